@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Specialty, MedicalSchedule, Appointment, AppointmentReminder, TemporaryReservation
+from .models import Specialty, MedicalSchedule, Appointment, AppointmentReminder, TemporaryReservation, AppointmentSeries
 
 
 @admin.register(Specialty)
@@ -212,6 +212,34 @@ class AppointmentReminderAdmin(admin.ModelAdmin):
     mark_as_sent.short_description = 'Marcar como enviados'
 
 
+@admin.register(AppointmentSeries)
+class AppointmentSeriesAdmin(admin.ModelAdmin):
+    list_display = ['patient', 'doctor', 'frequency', 'interval', 'start_date', 'end_date', 'appointment_time', 'materialized_until', 'is_active']
+    list_filter = ['is_active', 'frequency', 'specialty']
+    search_fields = ['patient__first_name', 'patient__last_name', 'doctor__first_name', 'doctor__last_name']
+    readonly_fields = ['materialized_until', 'created_by', 'created_at', 'updated_at']
+    ordering = ['-created_at']
+    
+    fieldsets = (
+        ('Participantes', {
+            'fields': ('patient', 'doctor', 'specialty')
+        }),
+        ('Recurrencia', {
+            'fields': ('frequency', 'interval', 'start_date', 'end_date', 'max_occurrences')
+        }),
+        ('Cita', {
+            'fields': ('appointment_time', 'duration', 'reason', 'notes')
+        }),
+        ('Estado', {
+            'fields': ('is_active', 'materialized_until')
+        }),
+        ('Metadatos', {
+            'fields': ('created_by', 'created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
+
+
 @admin.register(TemporaryReservation)
 class TemporaryReservationAdmin(admin.ModelAdmin):
     list_display = ['user', 'doctor', 'specialty', 'appointment_date', 'appointment_time', 'expires_at', 'is_active', 'get_status']
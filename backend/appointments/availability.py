@@ -0,0 +1,262 @@
+"""
+Motor de disponibilidad de horarios médicos.
+
+Cada día se representa como un mapa de bits de minutos (un ``int`` de Python
+de 1440 bits): los ``MedicalSchedule`` del doctor definen los minutos de
+atención y las citas y reservas temporales vigentes se restan como intervalos
+ocupados, junto con las ocurrencias aún no materializadas de las series
+recurrentes. Comprobar si un slot está libre es una operación de máscara, por
+lo que el cálculo es despreciable frente a las consultas (una por tabla).
+"""
+import heapq
+from collections import defaultdict
+from datetime import time, timedelta
+from itertools import islice
+
+from django.utils import timezone
+
+from .cache import AvailabilityCache
+from .models import Appointment, MedicalSchedule, TemporaryReservation
+from .recurrence import active_series, pending_occurrences
+
+MINUTES_PER_DAY = 24 * 60
+
+# Estados de cita que bloquean el horario del doctor
+BLOCKING_STATUSES = ('scheduled', 'confirmed')
+
+# Duración asumida para una reserva temporal fuera de cualquier horario
+DEFAULT_SLOT_MINUTES = 30
+
+
+def _to_minutes(value):
+    """Convierte un ``time`` en minutos desde la medianoche"""
+    return value.hour * 60 + value.minute
+
+
+def _to_time(minutes):
+    """Convierte minutos desde la medianoche en ``time``"""
+    return time(minutes // 60, minutes % 60)
+
+
+def _not_before(day, now):
+    """Primer minuto reservable de ``day`` (excluye horas ya pasadas)"""
+    local_now = timezone.localtime(now)
+    if day < local_now.date():
+        return MINUTES_PER_DAY
+    if day == local_now.date():
+        return local_now.hour * 60 + local_now.minute + 1
+    return 0
+
+
+def _interval_mask(start, length):
+    """Máscara de bits para el intervalo [start, start + length)"""
+    if length <= 0:
+        return 0
+    end = min(start + length, MINUTES_PER_DAY)
+    return ((1 << (end - start)) - 1) << start
+
+
+class AvailabilityEngine:
+    """
+    Calcula los horarios libres de uno o varios doctores en un rango de fechas.
+
+    ``load()`` ejecuta exactamente una consulta por tabla (horarios, citas,
+    reservas temporales y series recurrentes); a partir de ahí todo se
+    resuelve en memoria.
+    Si no se indican doctores, se toman los que tienen horario activo en
+    ``specialty_id``.
+    """
+
+    def __init__(self, doctor_ids=None, start_date=None, end_date=None, now=None, specialty_id=None):
+        if doctor_ids is None and specialty_id is None:
+            raise ValueError('Se requiere doctor_ids o specialty_id')
+        self.doctor_ids = (
+            sorted({int(doctor_id) for doctor_id in doctor_ids})
+            if doctor_ids is not None else None
+        )
+        self.specialty_id = specialty_id
+        self.start_date = start_date
+        self.end_date = end_date or start_date
+        self.now = now or timezone.now()
+        # (doctor_id, weekday) -> [(inicio, fin, duración)] en minutos
+        self._schedules = defaultdict(list)
+        # (doctor_id, fecha) -> mapa de bits de minutos ocupados
+        self._busy = defaultdict(int)
+        # (doctor_id, fecha) -> expiración más próxima de una reserva vigente
+        self._next_expiry = {}
+        self._loaded = False
+
+    def dates(self):
+        """Itera las fechas del rango solicitado"""
+        day = self.start_date
+        while day <= self.end_date:
+            yield day
+            day += timedelta(days=1)
+
+    def _weekdays(self):
+        span = (self.end_date - self.start_date).days + 1
+        if span >= 7:
+            return list(range(7))
+        return sorted({day.weekday() for day in self.dates()})
+
+    def load(self):
+        """Carga horarios, citas y reservas vigentes del rango"""
+        if self._loaded:
+            return self
+
+        schedules = MedicalSchedule.objects.filter(
+            weekday__in=self._weekdays(),
+            is_active=True
+        )
+        if self.doctor_ids is not None:
+            schedules = schedules.filter(doctor_id__in=self.doctor_ids)
+        if self.specialty_id is not None:
+            schedules = schedules.filter(specialty_id=self.specialty_id)
+
+        for doctor_id, weekday, start_time, end_time, slot_duration in schedules.values_list(
+            'doctor_id', 'weekday', 'start_time', 'end_time', 'slot_duration'
+        ):
+            self._schedules[(doctor_id, weekday)].append(
+                (_to_minutes(start_time), _to_minutes(end_time), slot_duration)
+            )
+        for rows in self._schedules.values():
+            rows.sort()
+
+        if self.doctor_ids is None:
+            self.doctor_ids = sorted({doctor_id for doctor_id, _ in self._schedules})
+        if not self.doctor_ids:
+            self._loaded = True
+            return self
+
+        appointments = Appointment.objects.filter(
+            doctor_id__in=self.doctor_ids,
+            appointment_date__range=(self.start_date, self.end_date),
+            status__in=BLOCKING_STATUSES
+        ).values_list('doctor_id', 'appointment_date', 'appointment_time', 'duration')
+
+        for doctor_id, day, start_time, duration in appointments:
+            self._busy[(doctor_id, day)] |= _interval_mask(_to_minutes(start_time), duration)
+
+        reservations = TemporaryReservation.objects.filter(
+            doctor_id__in=self.doctor_ids,
+            appointment_date__range=(self.start_date, self.end_date),
+            is_active=True,
+            expires_at__gt=self.now
+        ).values_list('doctor_id', 'appointment_date', 'appointment_time', 'expires_at')
+
+        for doctor_id, day, start_time, expires_at in reservations:
+            start = _to_minutes(start_time)
+            length = self._slot_length(doctor_id, day.weekday(), start)
+            self._busy[(doctor_id, day)] |= _interval_mask(start, length)
+            key = (doctor_id, day)
+            if key not in self._next_expiry or expires_at < self._next_expiry[key]:
+                self._next_expiry[key] = expires_at
+
+        series_list = active_series(self.start_date, self.end_date).filter(
+            doctor_id__in=self.doctor_ids
+        ).only(
+            'doctor_id', 'start_date', 'end_date', 'max_occurrences', 'frequency',
+            'interval', 'appointment_time', 'duration', 'materialized_until'
+        )
+        for series, day in pending_occurrences(series_list, self.start_date, self.end_date):
+            self._busy[(series.doctor_id, day)] |= _interval_mask(
+                _to_minutes(series.appointment_time), series.duration
+            )
+
+        self._loaded = True
+        return self
+
+    def _slot_length(self, doctor_id, weekday, minute):
+        """Duración del slot del horario que contiene ``minute``"""
+        for start, end, duration in self._schedules.get((doctor_id, weekday), ()):
+            if start <= minute < end:
+                return duration
+        return DEFAULT_SLOT_MINUTES
+
+    def slot_length(self, doctor_id, day, slot_time):
+        """Duración del slot del horario del doctor que empieza en ``slot_time``"""
+        self.load()
+        return self._slot_length(int(doctor_id), day.weekday(), _to_minutes(slot_time))
+
+    def is_free(self, doctor_id, day, slot_time, duration):
+        """Indica si ``[slot_time, slot_time + duration)`` no se solapa con nada ocupado"""
+        self.load()
+        busy = self._busy.get((int(doctor_id), day), 0)
+        return not busy & _interval_mask(_to_minutes(slot_time), duration)
+
+    def occupy(self, doctor_id, day, slot_time, duration):
+        """Marcar un intervalo como ocupado (citas aún no guardadas)"""
+        self.load()
+        self._busy[(int(doctor_id), day)] |= _interval_mask(_to_minutes(slot_time), duration)
+
+    def next_expiry(self, doctor_id, day):
+        """Momento en que expira la primera reserva vigente del doctor ese día"""
+        self.load()
+        return self._next_expiry.get((int(doctor_id), day))
+
+    def free_minutes(self, doctor_id, day, include_past=False):
+        """Minutos de inicio de los slots libres de un doctor en una fecha"""
+        self.load()
+        doctor_id = int(doctor_id)
+        rows = self._schedules.get((doctor_id, day.weekday()))
+        if not rows:
+            return []
+
+        busy = self._busy.get((doctor_id, day), 0)
+        not_before = 0 if include_past else _not_before(day, self.now)
+        free = []
+        seen = set()
+        for start, end, duration in rows:
+            slot_mask = (1 << duration) - 1
+            for minute in range(start, end - duration + 1, duration):
+                if minute < not_before or minute in seen:
+                    continue
+                if (busy >> minute) & slot_mask:
+                    continue
+                seen.add(minute)
+                free.append(minute)
+        free.sort()
+        return free
+
+    def free_slots(self, doctor_id, day):
+        """Horarios libres de un doctor en una fecha como objetos ``time``"""
+        return [_to_time(minute) for minute in self.free_minutes(doctor_id, day)]
+
+    def _iter_doctor(self, doctor_id):
+        """Slots libres de un doctor en orden cronológico: (fecha, minuto, doctor)"""
+        for day in self.dates():
+            for minute in self.free_minutes(doctor_id, day):
+                yield day, minute, doctor_id
+
+    def next_available(self, limit=10):
+        """
+        Primeros ``limit`` slots libres entre todos los doctores del rango.
+
+        Cada doctor aporta una secuencia ordenada y perezosa; ``heapq.merge``
+        las combina sin materializar el calendario completo.
+        """
+        self.load()
+        merged = heapq.merge(*(self._iter_doctor(doctor_id) for doctor_id in self.doctor_ids))
+        return [
+            (day, _to_time(minute), doctor_id)
+            for day, minute, doctor_id in islice(merged, limit)
+        ]
+
+
+def get_available_slots(doctor_id, day, now=None):
+    """
+    Horarios libres (``HH:MM``) de un doctor para una fecha.
+
+    El resultado se cachea por doctor y fecha sin recortar las horas ya
+    pasadas; ese recorte se aplica al leer para que la entrada siga siendo
+    válida durante todo el día.
+    """
+    now = now or timezone.now()
+    minutes = AvailabilityCache.get(doctor_id, day)
+    if minutes is None:
+        engine = AvailabilityEngine([doctor_id], day, now=now)
+        minutes = engine.free_minutes(doctor_id, day, include_past=True)
+        AvailabilityCache.set(doctor_id, day, minutes, expires_at=engine.next_expiry(doctor_id, day))
+
+    not_before = _not_before(day, now)
+    return [_to_time(minute).strftime('%H:%M') for minute in minutes if minute >= not_before]
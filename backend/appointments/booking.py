@@ -0,0 +1,174 @@
+"""
+Reserva de horarios segura ante concurrencia.
+
+Cada operación toma un bloqueo corto sobre la fila ``DoctorDayClaim`` del día del
+doctor con ``select_for_update`` y, ya serializada, comprueba con el mapa de
+minutos de ``AvailabilityEngine`` que el intervalo no se solape con citas,
+reservas vigentes ni ocurrencias pendientes de series. El bloqueo es por día
+y no por hora porque dos horarios distintos pueden solaparse. Así las
+peticiones simultáneas reciben un ``SlotTakenError`` limpio en lugar de un
+``IntegrityError`` o de una cita solapada.
+"""
+import random
+import time
+
+from django.db import OperationalError, transaction
+from django.utils import timezone
+
+from .availability import AvailabilityEngine
+from .models import Appointment, DoctorDayClaim, TemporaryReservation
+
+
+class SlotTakenError(Exception):
+    """El horario solicitado ya está ocupado"""
+
+
+class ReservationExpiredError(Exception):
+    """La reserva temporal ya expiró"""
+
+
+# Reintentos ante errores transitorios de bloqueo (deadlock en PostgreSQL,
+# "database is locked" en SQLite)
+LOCK_RETRIES = 5
+LOCK_RETRY_DELAY = 0.01  # segundos
+
+
+def _retry_on_lock(func):
+    """Ejecutar ``func`` reintentando si la base de datos reporta un bloqueo transitorio"""
+    # Dentro de una transacción externa no se puede reintentar de forma segura
+    retries = 1 if transaction.get_connection().in_atomic_block else LOCK_RETRIES
+    for attempt in range(retries):
+        try:
+            return func()
+        except OperationalError as e:
+            message = str(e).lower()
+            if attempt == retries - 1 or ('lock' not in message and 'deadlock' not in message):
+                raise
+            time.sleep(LOCK_RETRY_DELAY * random.uniform(0.5, 1.5) * (attempt + 1))
+
+
+def lock_day(doctor_id, appointment_date):
+    """Bloquear el día del doctor hasta el final de la transacción"""
+    claim, _ = DoctorDayClaim.objects.select_for_update().get_or_create(
+        doctor_id=doctor_id,
+        appointment_date=appointment_date
+    )
+    return claim
+
+
+def lock_days(days):
+    """
+    Bloquear varios días ``(doctor_id, fecha)`` con dos consultas.
+
+    Las filas se bloquean ordenadas para que dos lotes concurrentes no se
+    esperen mutuamente.
+    """
+    days = sorted(set(days))
+    if not days:
+        return
+    DoctorDayClaim.objects.bulk_create(
+        [DoctorDayClaim(doctor_id=doctor_id, appointment_date=day) for doctor_id, day in days],
+        ignore_conflicts=True
+    )
+    list(DoctorDayClaim.objects.select_for_update().filter(
+        doctor_id__in={doctor_id for doctor_id, _ in days},
+        appointment_date__range=(min(day for _, day in days), max(day for _, day in days))
+    ).order_by('doctor_id', 'appointment_date').values_list('pk', flat=True))
+
+
+def _slot_filter(doctor_id, appointment_date, appointment_time):
+    return {
+        'doctor_id': doctor_id,
+        'appointment_date': appointment_date,
+        'appointment_time': appointment_time,
+    }
+
+
+def reserve_slot(user, doctor, specialty, appointment_date, appointment_time, now=None):
+    """
+    Crear una reserva temporal para el horario indicado.
+
+    Lanza ``SlotTakenError`` si el slot se solapa con una cita activa, una
+    reserva vigente o una ocurrencia pendiente de una serie.
+    """
+    now = now or timezone.now()
+    doctor_id = getattr(doctor, 'pk', doctor)
+    slot = _slot_filter(doctor_id, appointment_date, appointment_time)
+
+    @transaction.atomic
+    def reserve():
+        lock_day(doctor_id, appointment_date)
+
+        # Las reservas vencidas siguen activas hasta que alguien las libera;
+        # sin esto bloquearían el horario por la restricción de unicidad
+        TemporaryReservation.objects.filter(
+            is_active=True, expires_at__lte=now, **slot
+        ).update(is_active=False)
+
+        engine = AvailabilityEngine([doctor_id], appointment_date, now=now)
+        length = engine.slot_length(doctor_id, appointment_date, appointment_time)
+        if not engine.is_free(doctor_id, appointment_date, appointment_time, length):
+            raise SlotTakenError()
+
+        return TemporaryReservation.objects.create(
+            user=user,
+            doctor_id=doctor_id,
+            specialty=specialty,
+            appointment_date=appointment_date,
+            appointment_time=appointment_time
+        )
+
+    return _retry_on_lock(reserve)
+
+
+def confirm_reservation(user, reservation_id, now=None):
+    """
+    Convertir una reserva temporal vigente en una cita.
+
+    Lanza ``TemporaryReservation.DoesNotExist`` si la reserva no es del
+    usuario, ``ReservationExpiredError`` si venció y ``SlotTakenError`` si
+    entretanto el horario quedó ocupado.
+    """
+    now = now or timezone.now()
+
+    @transaction.atomic
+    def confirm():
+        reservation = TemporaryReservation.objects.get(
+            id=reservation_id,
+            user=user,
+            is_active=True
+        )
+        # Mismo orden de bloqueo que reserve_slot: primero el día
+        lock_day(reservation.doctor_id, reservation.appointment_date)
+        reservation = TemporaryReservation.objects.select_for_update().get(
+            id=reservation_id,
+            is_active=True
+        )
+        if reservation.expires_at <= now:
+            raise ReservationExpiredError()
+
+        # Liberar la propia reserva antes de comprobar; si el intervalo está
+        # ocupado la transacción se revierte y la reserva sigue activa
+        reservation.is_active = False
+        reservation.save(update_fields=['is_active'])
+        doctor_id, day, start = reservation.doctor_id, reservation.appointment_date, reservation.appointment_time
+        engine = AvailabilityEngine([doctor_id], day, now=now)
+        # La cita ocupa lo mismo que la reserva: el slot del horario
+        length = engine.slot_length(doctor_id, day, start)
+        if not engine.is_free(doctor_id, day, start, length):
+            raise SlotTakenError()
+
+        appointment = Appointment.objects.create(
+            patient=user,
+            doctor_id=reservation.doctor_id,
+            specialty_id=reservation.specialty_id,
+            appointment_date=reservation.appointment_date,
+            appointment_time=reservation.appointment_time,
+            duration=length,
+            status='scheduled',
+            notes=f'Confirmada desde reserva temporal #{reservation.id}'
+        )
+
+        return appointment
+
+    return _retry_on_lock(confirm)
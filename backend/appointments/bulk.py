@@ -0,0 +1,162 @@
+"""
+Carga masiva de citas.
+
+Valida un lote completo con consultas por conjuntos: una consulta para los
+usuarios, una para las especialidades y un ``AvailabilityEngine`` por doctor
+sobre su ventana de fechas para detectar solapamientos con citas, reservas
+vigentes y ocurrencias pendientes de series. Los días afectados se bloquean
+como en ``booking`` antes de comprobar, las colisiones dentro del propio lote
+se marcan en el mapa de minutos y la inserción usa ``bulk_create``.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+
+from .availability import AvailabilityEngine
+from .booking import lock_days
+from .cache import AvailabilityCache
+from .models import Appointment, Specialty
+from .serializers import BulkAppointmentRowSerializer
+
+User = get_user_model()
+
+BULK_CREATE_BATCH_SIZE = 1000
+ID_LOOKUP_CHUNK_SIZE = 1000
+
+
+def _existing(queryset, ids, field='id'):
+    """``{id: field}`` de los ``ids`` presentes en ``queryset``, consultando en bloques"""
+    ids = sorted(ids)
+    found = {}
+    for start in range(0, len(ids), ID_LOOKUP_CHUNK_SIZE):
+        chunk = ids[start:start + ID_LOOKUP_CHUNK_SIZE]
+        found.update(queryset.filter(id__in=chunk).values_list('id', field))
+    return found
+
+
+def _error(index, errors):
+    return {'row': index, 'status': 'error', 'errors': errors}
+
+
+def bulk_create_appointments(rows):
+    """
+    Crear citas en bloque.
+
+    Devuelve una lista de resultados por fila, en el mismo orden de entrada:
+    ``{'row', 'status': 'created', 'id', 'appointment_id'}`` o
+    ``{'row', 'status': 'error', 'errors'}``.
+    """
+    results = [None] * len(rows)
+    valid = []
+
+    for index, row in enumerate(rows):
+        serializer = BulkAppointmentRowSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = _error(index, serializer.errors)
+
+    # Referencias: una consulta por tabla para todo el lote
+    user_roles = _existing(
+        User.objects.filter(is_active=True),
+        {data['patient'] for _, data in valid} | {data['doctor'] for _, data in valid},
+        'role'
+    )
+    existing_specialties = _existing(
+        Specialty.objects.all(),
+        {data['specialty'] for _, data in valid if data.get('specialty')}
+    )
+
+    checked = []
+    for index, data in valid:
+        errors = {}
+        if data['patient'] not in user_roles:
+            errors['patient'] = ['Paciente no encontrado']
+        if data['doctor'] not in user_roles:
+            errors['doctor'] = ['Doctor no encontrado']
+        elif user_roles[data['doctor']] != 'doctor':
+            errors['doctor'] = ['El usuario no es un doctor']
+        if data.get('specialty') and data['specialty'] not in existing_specialties:
+            errors['specialty'] = ['Especialidad no encontrada']
+        if errors:
+            results[index] = _error(index, errors)
+        else:
+            checked.append((index, data))
+
+    # Ventana de fechas de cada doctor entre las filas que ocupan horario
+    windows = {}
+    for _, data in checked:
+        if data['status'] == 'cancelled':
+            continue
+        low, high = windows.get(data['doctor'], (data['appointment_date'], data['appointment_date']))
+        windows[data['doctor']] = (min(low, data['appointment_date']), max(high, data['appointment_date']))
+
+    to_create = []
+    try:
+        with transaction.atomic():
+            # Mismo bloqueo que reserve_slot: las reservas simultáneas esperan al lote
+            lock_days(
+                (data['doctor'], data['appointment_date'])
+                for _, data in checked if data['status'] != 'cancelled'
+            )
+            engines = {
+                doctor_id: AvailabilityEngine([doctor_id], low, high)
+                for doctor_id, (low, high) in windows.items()
+            }
+
+            for index, data in checked:
+                if data['status'] != 'cancelled':
+                    engine = engines[data['doctor']]
+                    slot = (data['doctor'], data['appointment_date'], data['appointment_time'], data['duration'])
+                    if not engine.is_free(*slot):
+                        results[index] = _error(index, {
+                            'non_field_errors': ['El doctor ya tiene una cita programada en ese horario.']
+                        })
+                        continue
+                    # Las filas siguientes del lote chocarán con esta
+                    engine.occupy(*slot)
+
+                to_create.append((index, Appointment(
+                    patient_id=data['patient'],
+                    doctor_id=data['doctor'],
+                    specialty_id=data.get('specialty'),
+                    appointment_date=data['appointment_date'],
+                    appointment_time=data['appointment_time'],
+                    duration=data['duration'],
+                    status=data['status'],
+                    reason=data['reason'],
+                    notes=data.get('notes', '')
+                )))
+
+            Appointment.objects.bulk_create(
+                [appointment for _, appointment in to_create],
+                batch_size=BULK_CREATE_BATCH_SIZE
+            )
+    except IntegrityError:
+        # Otra petición ocupó alguno de los horarios mientras se validaba
+        for index, _ in to_create:
+            results[index] = _error(index, {
+                'non_field_errors': ['Conflicto con una cita creada simultáneamente; reintente el lote.']
+            })
+        return results
+
+    if not to_create:
+        return results
+
+    # bulk_create no emite señales: invalidar la disponibilidad a mano
+    touched = defaultdict(set)
+    for _, appointment in to_create:
+        touched[appointment.doctor_id].add(appointment.appointment_date)
+    for doctor_id, days in touched.items():
+        for day in days:
+            AvailabilityCache.invalidate(doctor_id, day)
+
+    for index, appointment in to_create:
+        results[index] = {
+            'row': index,
+            'status': 'created',
+            'id': appointment.pk,
+            'appointment_id': str(appointment.appointment_id),
+        }
+    return results
@@ -0,0 +1,152 @@
+from django.core.cache import cache
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AvailabilityCache:
+    """
+    Caché de horarios libres por doctor y fecha.
+
+    Las claves incluyen una versión por doctor: un cambio en citas o reservas
+    borra solo la fecha afectada, mientras que un cambio de ``MedicalSchedule``
+    (que afecta a todas las fechas de ese día de la semana) sube la versión
+    del doctor y deja huérfanas sus entradas anteriores.
+    """
+
+    CACHE_PREFIX = 'availability'
+    DEFAULT_TIMEOUT = 300  # 5 minutos
+    HITS_KEY = f'{CACHE_PREFIX}:stats:hits'
+    MISSES_KEY = f'{CACHE_PREFIX}:stats:misses'
+
+    @classmethod
+    def _version_key(cls, doctor_id):
+        return f"{cls.CACHE_PREFIX}:version:{doctor_id}"
+
+    @classmethod
+    def _get_version(cls, doctor_id):
+        return cache.get(cls._version_key(doctor_id)) or 1
+
+    @classmethod
+    def _generate_cache_key(cls, doctor_id, day, version):
+        return f"{cls.CACHE_PREFIX}:{doctor_id}:v{version}:{day}"
+
+    @classmethod
+    def _incr(cls, key):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+    @classmethod
+    def get(cls, doctor_id, day):
+        """Obtener los minutos libres cacheados o None si no hay entrada"""
+        try:
+            version = cls._get_version(doctor_id)
+            minutes = cache.get(cls._generate_cache_key(doctor_id, day, version))
+            cls._incr(cls.HITS_KEY if minutes is not None else cls.MISSES_KEY)
+            return minutes
+        except Exception as e:
+            logger.error(f"Error retrieving availability from cache: {str(e)}")
+            return None
+
+    @classmethod
+    def set(cls, doctor_id, day, minutes, expires_at=None):
+        """
+        Guardar los minutos libres de un doctor en una fecha.
+
+        Si hay una reserva temporal vigente, la entrada no sobrevive a su
+        expiración: en ese momento el slot vuelve a quedar libre sin que se
+        escriba nada en la base de datos.
+        """
+        timeout = cls.DEFAULT_TIMEOUT
+        if expires_at is not None:
+            seconds = int((expires_at - timezone.now()).total_seconds())
+            timeout = max(1, min(timeout, seconds))
+
+        try:
+            version = cls._get_version(doctor_id)
+            cache.set(cls._generate_cache_key(doctor_id, day, version), list(minutes), timeout)
+            return True
+        except Exception as e:
+            logger.error(f"Error setting availability cache: {str(e)}")
+            return False
+
+    @classmethod
+    def invalidate(cls, doctor_id, day):
+        """Eliminar la entrada de un doctor en una fecha"""
+        try:
+            version = cls._get_version(doctor_id)
+            cache.delete(cls._generate_cache_key(doctor_id, day, version))
+        except Exception as e:
+            logger.error(f"Error invalidating availability cache: {str(e)}")
+
+    @classmethod
+    def invalidate_doctor(cls, doctor_id):
+        """Invalidar todas las fechas de un doctor subiendo su versión"""
+        key = cls._version_key(doctor_id)
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 2, None)
+        except Exception as e:
+            logger.error(f"Error invalidating doctor availability cache: {str(e)}")
+
+    @classmethod
+    def get_stats(cls):
+        """Contadores de aciertos y fallos de la caché"""
+        values = cache.get_many([cls.HITS_KEY, cls.MISSES_KEY])
+        hits = values.get(cls.HITS_KEY, 0)
+        misses = values.get(cls.MISSES_KEY, 0)
+        total = hits + misses
+        return {
+            'backend': cache.__class__.__name__,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0,
+        }
+
+    @classmethod
+    def reset_stats(cls):
+        """Reiniciar los contadores de aciertos y fallos"""
+        cache.delete_many([cls.HITS_KEY, cls.MISSES_KEY])
+
+
+class DoctorDirectoryCache:
+    """Caché de la respuesta de doctores por especialidad"""
+
+    CACHE_PREFIX = 'doctor_directory'
+    DEFAULT_TIMEOUT = 3600  # 1 hora; el directorio invalida al cambiar
+
+    @classmethod
+    def _generate_cache_key(cls, specialty_id):
+        return f"{cls.CACHE_PREFIX}:{specialty_id}"
+
+    @classmethod
+    def get(cls, specialty_id):
+        """Obtener los doctores cacheados de una especialidad o None"""
+        try:
+            return cache.get(cls._generate_cache_key(specialty_id))
+        except Exception as e:
+            logger.error(f"Error retrieving doctor directory from cache: {str(e)}")
+            return None
+
+    @classmethod
+    def set(cls, specialty_id, doctors, timeout=None):
+        """Guardar los doctores de una especialidad"""
+        try:
+            cache.set(cls._generate_cache_key(specialty_id), doctors, timeout or cls.DEFAULT_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.error(f"Error setting doctor directory cache: {str(e)}")
+            return False
+
+    @classmethod
+    def invalidate(cls, specialty_id):
+        """Eliminar la entrada de una especialidad"""
+        try:
+            cache.delete(cls._generate_cache_key(specialty_id))
+        except Exception as e:
+            logger.error(f"Error invalidating doctor directory cache: {str(e)}")
@@ -0,0 +1,90 @@
+"""
+Mantenimiento del directorio de doctores (``DoctorDirectoryEntry``).
+
+El directorio se recalcula por doctor: basta con saber qué doctor cambió
+(horario, perfil o datos de usuario) para reescribir sus filas con un par de
+consultas, sin tocar las de los demás.
+"""
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .cache import DoctorDirectoryCache
+from .models import DoctorDirectoryEntry, MedicalSchedule
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Años de experiencia si el doctor no tiene perfil ni fecha de alta
+DEFAULT_EXPERIENCE_YEARS = 5
+
+ENTRY_FIELDS = ['full_name', 'email', 'experience_years', 'consultation_fee', 'schedule_count', 'updated_at']
+
+
+def _experience_years(doctor, profile):
+    if profile is not None:
+        return profile.years_of_experience
+    if doctor.date_joined:
+        return max(1, (timezone.now().date() - doctor.date_joined.date()).days // 365)
+    return DEFAULT_EXPERIENCE_YEARS
+
+
+def rebuild_doctor_entries(doctor_id):
+    """Recalcular las filas del directorio de un doctor"""
+    previous = set(
+        DoctorDirectoryEntry.objects.filter(doctor_id=doctor_id).values_list('specialty_id', flat=True)
+    )
+
+    doctor = User.objects.filter(id=doctor_id, is_active=True).select_related('doctor_profile').first()
+    counts = {}
+    if doctor is not None:
+        counts = dict(
+            MedicalSchedule.objects.filter(
+                doctor_id=doctor_id,
+                is_active=True,
+                specialty__isnull=False
+            ).values('specialty').annotate(total=Count('id')).values_list('specialty', 'total')
+        )
+
+    with transaction.atomic():
+        DoctorDirectoryEntry.objects.filter(doctor_id=doctor_id).exclude(specialty_id__in=counts).delete()
+        if counts:
+            # RelatedObjectDoesNotExist hereda de AttributeError
+            profile = getattr(doctor, 'doctor_profile', None)
+            values = {
+                'full_name': doctor.get_full_name(),
+                'email': doctor.email,
+                'experience_years': _experience_years(doctor, profile),
+                'consultation_fee': profile.consultation_fee if profile is not None else None,
+            }
+            DoctorDirectoryEntry.objects.bulk_create(
+                [
+                    DoctorDirectoryEntry(
+                        specialty_id=specialty_id,
+                        doctor_id=doctor_id,
+                        schedule_count=total,
+                        **values
+                    )
+                    for specialty_id, total in counts.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['specialty', 'doctor'],
+                update_fields=ENTRY_FIELDS
+            )
+
+    for specialty_id in previous | set(counts):
+        DoctorDirectoryCache.invalidate(specialty_id)
+
+
+def rebuild_doctor_directory():
+    """Recalcular el directorio completo; devuelve el número de doctores procesados"""
+    doctor_ids = set(MedicalSchedule.objects.values_list('doctor_id', flat=True).distinct())
+    doctor_ids |= set(DoctorDirectoryEntry.objects.values_list('doctor_id', flat=True).distinct())
+    for doctor_id in sorted(doctor_ids):
+        rebuild_doctor_entries(doctor_id)
+    logger.info(f"Rebuilt doctor directory for {len(doctor_ids)} doctors")
+    return len(doctor_ids)
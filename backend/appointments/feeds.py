@@ -0,0 +1,155 @@
+"""
+Calendario iCalendar (.ics) por usuario.
+
+Los clientes de calendario consultan la URL cada pocos minutos, así que la
+respuesta se genera por streaming desde un iterador de ``.values()`` sin
+pasar por los serializers, y un ETag derivado de ``MAX(updated_at)`` permite
+responder 304 con una única consulta de agregación cuando nada cambió.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, Max, Q, Subquery
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.http import condition, require_safe
+
+from .models import Appointment, CalendarFeedToken
+
+# Días hacia atrás incluidos en el calendario
+FEED_PAST_DAYS = 30
+
+STATUS_MAP = {
+    'scheduled': 'TENTATIVE',
+    'confirmed': 'CONFIRMED',
+    'in_progress': 'CONFIRMED',
+    'completed': 'CONFIRMED',
+    'no_show': 'CANCELLED',
+    'cancelled': 'CANCELLED',
+}
+
+FEED_FIELDS = (
+    'appointment_id', 'doctor_id', 'appointment_date', 'appointment_time', 'duration',
+    'status', 'updated_at', 'specialty__name',
+    'doctor__first_name', 'doctor__last_name',
+    'patient__first_name', 'patient__last_name',
+)
+
+
+def _token_user(token):
+    """ID del usuario activo del token como subconsulta escalar sobre el índice único"""
+    return Subquery(
+        CalendarFeedToken.objects.filter(token=token, user__is_active=True).values('user_id')[:1]
+    )
+
+
+def _feed_queryset(user_id):
+    """
+    Citas del usuario como doctor o como paciente.
+
+    ``user_id`` se resuelve antes de filtrar (un entero o ``_token_user``),
+    así el OR usa los índices de ``doctor_id`` y ``patient_id`` en lugar de
+    unir la tabla de tokens por cada lado.
+    """
+    return Appointment.objects.filter(
+        Q(doctor_id=user_id) | Q(patient_id=user_id),
+        appointment_date__gte=timezone.localdate() - timedelta(days=FEED_PAST_DAYS)
+    )
+
+
+def feed_etag(request, token):
+    """
+    ETag del calendario: número de citas y última modificación.
+
+    El conteo detecta borrados, que no cambian ``MAX(updated_at)``. Un
+    calendario vacío (o un token inválido) no tiene ETag y se resuelve en la
+    vista.
+    """
+    summary = _feed_queryset(_token_user(token)).aggregate(total=Count('id'), last=Max('updated_at'))
+    if not summary['total']:
+        return None
+    return f"{summary['total']}-{int(summary['last'].timestamp() * 1000000)}"
+
+
+def _escape(value):
+    """Escapar texto según RFC 5545"""
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;')
+        .replace(',', '\\,').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    """Plegar líneas de más de 75 octetos según RFC 5545"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # No cortar en medio de un carácter UTF-8
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # las líneas de continuación empiezan con un espacio
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _utc(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _render_event(row, user_id):
+    start = timezone.make_aware(datetime.combine(row['appointment_date'], row['appointment_time']))
+    end = start + timedelta(minutes=row['duration'])
+    if row['doctor_id'] == user_id:
+        summary = f"Cita: {row['patient__first_name']} {row['patient__last_name']}"
+    else:
+        summary = f"Cita con Dr. {row['doctor__first_name']} {row['doctor__last_name']}"
+
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{row['appointment_id']}@medical-system",
+        f"DTSTAMP:{_utc(row['updated_at'])}",
+        f"LAST-MODIFIED:{_utc(row['updated_at'])}",
+        f"DTSTART:{_utc(start)}",
+        f"DTEND:{_utc(end)}",
+        f"SUMMARY:{_escape(summary)}",
+        f"STATUS:{STATUS_MAP.get(row['status'], 'TENTATIVE')}",
+    ]
+    if row['specialty__name']:
+        lines.append(f"CATEGORIES:{_escape(row['specialty__name'])}")
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+def _stream_calendar(queryset, user_id):
+    yield (
+        'BEGIN:VCALENDAR\r\n'
+        'VERSION:2.0\r\n'
+        'PRODID:-//Medical System//Citas//ES\r\n'
+        'CALSCALE:GREGORIAN\r\n'
+        'METHOD:PUBLISH\r\n'
+    )
+    for row in queryset.values(*FEED_FIELDS).order_by('appointment_date', 'appointment_time').iterator(chunk_size=500):
+        yield _render_event(row, user_id)
+    yield 'END:VCALENDAR\r\n'
+
+
+@require_safe
+@condition(etag_func=feed_etag)
+def calendar_feed(request, token):
+    """Calendario .ics del usuario dueño del token"""
+    try:
+        feed_token = CalendarFeedToken.objects.only('user_id').get(token=token, user__is_active=True)
+    except CalendarFeedToken.DoesNotExist:
+        raise Http404('Calendario no encontrado')
+
+    response = StreamingHttpResponse(
+        _stream_calendar(_feed_queryset(feed_token.user_id), feed_token.user_id),
+        content_type='text/calendar; charset=utf-8'
+    )
+    response['Content-Disposition'] = 'inline; filename="citas.ics"'
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from appointments.directory import rebuild_doctor_directory, rebuild_doctor_entries
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el directorio desnormalizado de doctores por especialidad'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--doctor-id',
+            type=int,
+            help='Recalcular solo las filas de este doctor'
+        )
+
+    def handle(self, *args, **options):
+        if options['doctor_id']:
+            rebuild_doctor_entries(options['doctor_id'])
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Directorio recalculado para el doctor {options['doctor_id']}")
+            )
+            return
+
+        total = rebuild_doctor_directory()
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Directorio recalculado para {total} doctores')
+        )
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0004_temporaryreservation"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotClaim",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("appointment_date", models.DateField(verbose_name="Fecha de cita")),
+                ("appointment_time", models.TimeField(verbose_name="Hora de cita")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Bloqueo de Horario",
+                "verbose_name_plural": "Bloqueos de Horario",
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name="appointment",
+            unique_together=set(),
+        ),
+        migrations.AlterUniqueTogether(
+            name="temporaryreservation",
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name="appointment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "cancelled"), _negated=True),
+                fields=("doctor", "appointment_date", "appointment_time"),
+                name="unique_doctor_slot_not_cancelled",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="temporaryreservation",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_active", True)),
+                fields=("doctor", "appointment_date", "appointment_time"),
+                name="unique_active_temporary_reservation",
+            ),
+        ),
+        migrations.AddField(
+            model_name="slotclaim",
+            name="doctor",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="slot_claims",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Doctor",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="slotclaim",
+            unique_together={("doctor", "appointment_date", "appointment_time")},
+        ),
+    ]
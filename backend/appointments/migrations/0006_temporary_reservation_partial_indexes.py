@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-16 23:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0005_slot_claims_and_conditional_uniques"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="temporaryreservation",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["doctor", "appointment_date"],
+                name="temp_res_active_doctor_date",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="temporaryreservation",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["expires_at"],
+                name="temp_res_active_expires",
+            ),
+        ),
+    ]
@@ -0,0 +1,163 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:03
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0006_temporary_reservation_partial_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentSeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "frequency",
+                    models.CharField(
+                        choices=[("weekly", "Semanal"), ("monthly", "Mensual")],
+                        default="weekly",
+                        max_length=10,
+                        verbose_name="Frecuencia",
+                    ),
+                ),
+                (
+                    "interval",
+                    models.PositiveSmallIntegerField(
+                        default=1,
+                        help_text="Cada cuántas semanas o meses se repite",
+                        validators=[
+                            django.core.validators.MinValueValidator(1),
+                            django.core.validators.MaxValueValidator(12),
+                        ],
+                        verbose_name="Intervalo",
+                    ),
+                ),
+                ("start_date", models.DateField(verbose_name="Fecha de inicio")),
+                (
+                    "end_date",
+                    models.DateField(
+                        blank=True, null=True, verbose_name="Fecha de fin"
+                    ),
+                ),
+                (
+                    "max_occurrences",
+                    models.PositiveIntegerField(
+                        blank=True,
+                        help_text="Número máximo de citas de la serie",
+                        null=True,
+                        verbose_name="Máximo de ocurrencias",
+                    ),
+                ),
+                ("appointment_time", models.TimeField(verbose_name="Hora de cita")),
+                (
+                    "duration",
+                    models.IntegerField(
+                        default=30,
+                        help_text="Duración en minutos",
+                        validators=[
+                            django.core.validators.MinValueValidator(15),
+                            django.core.validators.MaxValueValidator(120),
+                        ],
+                        verbose_name="Duración",
+                    ),
+                ),
+                (
+                    "reason",
+                    models.TextField(
+                        help_text="Motivo de la consulta", verbose_name="Motivo"
+                    ),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Notas")),
+                (
+                    "materialized_until",
+                    models.DateField(
+                        blank=True,
+                        help_text="Última fecha con citas ya creadas",
+                        null=True,
+                        verbose_name="Materializada hasta",
+                    ),
+                ),
+                ("is_active", models.BooleanField(default=True, verbose_name="Activa")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="created_appointment_series",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Creada por",
+                    ),
+                ),
+                (
+                    "doctor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="doctor_appointment_series",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Doctor",
+                    ),
+                ),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="patient_appointment_series",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Paciente",
+                    ),
+                ),
+                (
+                    "specialty",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="appointment_series",
+                        to="appointments.specialty",
+                        verbose_name="Especialidad",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Serie de Citas",
+                "verbose_name_plural": "Series de Citas",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="appointment",
+            name="series",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="appointments",
+                to="appointments.appointmentseries",
+                verbose_name="Serie",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointmentseries",
+            index=models.Index(
+                fields=["doctor", "is_active"], name="appt_series_doctor_active"
+            ),
+        ),
+    ]
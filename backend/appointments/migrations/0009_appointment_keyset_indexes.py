@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0008_calendar_feed_token"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["appointment_date", "appointment_time", "id"],
+                name="appt_date_time_id",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["doctor", "appointment_date", "appointment_time", "id"],
+                name="appt_doctor_date_time_id",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["patient", "appointment_date", "appointment_time", "id"],
+                name="appt_patient_date_time_id",
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0009_appointment_keyset_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DoctorDirectoryEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "full_name",
+                    models.CharField(max_length=255, verbose_name="Nombre completo"),
+                ),
+                (
+                    "email",
+                    models.EmailField(
+                        blank=True, max_length=254, verbose_name="Correo electrónico"
+                    ),
+                ),
+                (
+                    "experience_years",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Años de experiencia"
+                    ),
+                ),
+                (
+                    "consultation_fee",
+                    models.DecimalField(
+                        blank=True,
+                        decimal_places=2,
+                        max_digits=10,
+                        null=True,
+                        verbose_name="Costo de consulta",
+                    ),
+                ),
+                (
+                    "schedule_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Horarios activos"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "doctor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="directory_entries",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Doctor",
+                    ),
+                ),
+                (
+                    "specialty",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="directory_entries",
+                        to="appointments.specialty",
+                        verbose_name="Especialidad",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Entrada del Directorio de Doctores",
+                "verbose_name_plural": "Directorio de Doctores",
+                "indexes": [
+                    models.Index(
+                        fields=["specialty", "full_name"],
+                        name="doctor_dir_specialty_name",
+                    )
+                ],
+                "unique_together": {("specialty", "doctor")},
+            },
+        ),
+    ]
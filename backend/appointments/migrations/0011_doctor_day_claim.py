@@ -0,0 +1,54 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def drop_slot_claims(apps, schema_editor):
+    """Las filas por hora solo servían como bloqueo; las de día se recrean bajo demanda"""
+    SlotClaim = apps.get_model('appointments', 'SlotClaim')
+    SlotClaim.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0010_doctor_directory"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_slot_claims, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name="slotclaim",
+            unique_together=set(),
+        ),
+        migrations.RemoveField(
+            model_name="slotclaim",
+            name="appointment_time",
+        ),
+        migrations.RenameModel(
+            old_name="SlotClaim",
+            new_name="DoctorDayClaim",
+        ),
+        migrations.AlterModelOptions(
+            name="doctordayclaim",
+            options={
+                "verbose_name": "Bloqueo de Día",
+                "verbose_name_plural": "Bloqueos de Día",
+            },
+        ),
+        migrations.AlterField(
+            model_name="doctordayclaim",
+            name="doctor",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="day_claims",
+                to=settings.AUTH_USER_MODEL,
+                verbose_name="Doctor",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="doctordayclaim",
+            unique_together={("doctor", "appointment_date")},
+        ),
+    ]
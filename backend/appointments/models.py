@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
+import secrets
 import uuid
 
 User = get_user_model()
@@ -75,6 +76,100 @@ class MedicalSchedule(models.Model):
         return f"{self.doctor.get_full_name()} - {self.get_weekday_display()} {self.start_time}-{self.end_time}"
 
 
+class AppointmentSeries(models.Model):
+    """
+    Serie de citas recurrentes (controles semanales o mensuales).
+
+    Solo se materializan como ``Appointment`` las ocurrencias dentro del
+    horizonte ``materialized_until``; las posteriores se calculan al vuelo.
+    """
+    FREQUENCY_CHOICES = [
+        ('weekly', 'Semanal'),
+        ('monthly', 'Mensual'),
+    ]
+    
+    patient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='patient_appointment_series',
+        verbose_name='Paciente'
+    )
+    doctor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='doctor_appointment_series',
+        verbose_name='Doctor'
+    )
+    specialty = models.ForeignKey(
+        Specialty,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='appointment_series',
+        verbose_name='Especialidad'
+    )
+    frequency = models.CharField(
+        max_length=10,
+        choices=FREQUENCY_CHOICES,
+        default='weekly',
+        verbose_name='Frecuencia'
+    )
+    interval = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1), MaxValueValidator(12)],
+        help_text='Cada cuántas semanas o meses se repite',
+        verbose_name='Intervalo'
+    )
+    start_date = models.DateField(verbose_name='Fecha de inicio')
+    end_date = models.DateField(blank=True, null=True, verbose_name='Fecha de fin')
+    max_occurrences = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text='Número máximo de citas de la serie',
+        verbose_name='Máximo de ocurrencias'
+    )
+    appointment_time = models.TimeField(verbose_name='Hora de cita')
+    duration = models.IntegerField(
+        default=30,
+        validators=[MinValueValidator(15), MaxValueValidator(120)],
+        help_text='Duración en minutos',
+        verbose_name='Duración'
+    )
+    reason = models.TextField(
+        help_text='Motivo de la consulta',
+        verbose_name='Motivo'
+    )
+    notes = models.TextField(blank=True, verbose_name='Notas')
+    materialized_until = models.DateField(
+        blank=True,
+        null=True,
+        help_text='Última fecha con citas ya creadas',
+        verbose_name='Materializada hasta'
+    )
+    is_active = models.BooleanField(default=True, verbose_name='Activa')
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='created_appointment_series',
+        verbose_name='Creada por'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Serie de Citas'
+        verbose_name_plural = 'Series de Citas'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['doctor', 'is_active'], name='appt_series_doctor_active'),
+        ]
+    
+    def __str__(self):
+        return f"Serie {self.get_frequency_display()} - {self.patient.get_full_name()} con {self.doctor.get_full_name()}"
+
+
 class Appointment(models.Model):
     """Modelo para citas médicas"""
     STATUS_CHOICES = [
@@ -144,6 +239,14 @@ class Appointment(models.Model):
         blank=True,
         verbose_name='Motivo de cancelación'
     )
+    series = models.ForeignKey(
+        AppointmentSeries,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='appointments',
+        verbose_name='Serie'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -151,7 +254,30 @@ class Appointment(models.Model):
         verbose_name = 'Cita Médica'
         verbose_name_plural = 'Citas Médicas'
         ordering = ['-appointment_date', '-appointment_time']
-        unique_together = ['doctor', 'appointment_date', 'appointment_time']
+        constraints = [
+            # Una cita cancelada no debe impedir volver a reservar el horario
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=~models.Q(status='cancelled'),
+                name='unique_doctor_slot_not_cancelled'
+            ),
+        ]
+        indexes = [
+            # Índices para la paginación por cursor (fecha, hora, id) de los
+            # listados generales, por doctor y por paciente
+            models.Index(
+                fields=['appointment_date', 'appointment_time', 'id'],
+                name='appt_date_time_id'
+            ),
+            models.Index(
+                fields=['doctor', 'appointment_date', 'appointment_time', 'id'],
+                name='appt_doctor_date_time_id'
+            ),
+            models.Index(
+                fields=['patient', 'appointment_date', 'appointment_time', 'id'],
+                name='appt_patient_date_time_id'
+            ),
+        ]
     
     def __str__(self):
         return f"Cita {self.appointment_id} - {self.patient.get_full_name()} con {self.doctor.get_full_name()} el {self.appointment_date}"
@@ -215,7 +341,29 @@ class TemporaryReservation(models.Model):
         verbose_name = 'Reserva Temporal'
         verbose_name_plural = 'Reservas Temporales'
         ordering = ['-created_at']
-        unique_together = ['doctor', 'appointment_date', 'appointment_time', 'is_active']
+        constraints = [
+            # Solo puede haber una reserva activa por horario; las inactivas
+            # (canceladas o confirmadas) pueden acumularse sin conflicto
+            models.UniqueConstraint(
+                fields=['doctor', 'appointment_date', 'appointment_time'],
+                condition=models.Q(is_active=True),
+                name='unique_active_temporary_reservation'
+            ),
+        ]
+        indexes = [
+            # Índices parciales: las consultas de disponibilidad y el barrido
+            # de reservas vencidas solo leen filas activas
+            models.Index(
+                fields=['doctor', 'appointment_date'],
+                condition=models.Q(is_active=True),
+                name='temp_res_active_doctor_date'
+            ),
+            models.Index(
+                fields=['expires_at'],
+                condition=models.Q(is_active=True),
+                name='temp_res_active_expires'
+            ),
+        ]
     
     def __str__(self):
         return f"Reserva temporal: {self.user.get_full_name()} - {self.appointment_date} {self.appointment_time}"
@@ -240,6 +388,111 @@ class TemporaryReservation(models.Model):
         self.save()
 
 
+class DoctorDayClaim(models.Model):
+    """
+    Fila de bloqueo por día de un doctor (doctor, fecha).
+
+    Reservas, confirmaciones, cargas masivas y series toman
+    ``select_for_update`` sobre esta fila antes de comprobar solapamientos:
+    dos horarios distintos pueden solaparse, así que el bloqueo no puede ser
+    por hora.
+    """
+    doctor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='day_claims',
+        verbose_name='Doctor'
+    )
+    appointment_date = models.DateField(verbose_name='Fecha de cita')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Bloqueo de Día'
+        verbose_name_plural = 'Bloqueos de Día'
+        unique_together = ['doctor', 'appointment_date']
+    
+    def __str__(self):
+        return f"Bloqueo {self.doctor_id} - {self.appointment_date}"
+
+
+class DoctorDirectoryEntry(models.Model):
+    """
+    Directorio desnormalizado de doctores: una fila por (especialidad, doctor).
+
+    Se recalcula por doctor cuando cambian sus horarios, su perfil o sus
+    datos de usuario, para que los listados de doctores lean una sola tabla.
+    """
+    specialty = models.ForeignKey(
+        Specialty,
+        on_delete=models.CASCADE,
+        related_name='directory_entries',
+        verbose_name='Especialidad'
+    )
+    doctor = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='directory_entries',
+        verbose_name='Doctor'
+    )
+    full_name = models.CharField(max_length=255, verbose_name='Nombre completo')
+    email = models.EmailField(blank=True, verbose_name='Correo electrónico')
+    experience_years = models.PositiveIntegerField(default=0, verbose_name='Años de experiencia')
+    consultation_fee = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name='Costo de consulta'
+    )
+    schedule_count = models.PositiveIntegerField(default=0, verbose_name='Horarios activos')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Entrada del Directorio de Doctores'
+        verbose_name_plural = 'Directorio de Doctores'
+        unique_together = ['specialty', 'doctor']
+        indexes = [
+            models.Index(fields=['specialty', 'full_name'], name='doctor_dir_specialty_name'),
+        ]
+    
+    def __str__(self):
+        return f"{self.full_name} - {self.specialty_id}"
+
+
+class CalendarFeedToken(models.Model):
+    """Token secreto para suscribirse al calendario .ics de un usuario"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='calendar_feed_token',
+        verbose_name='Usuario'
+    )
+    token = models.CharField(max_length=64, unique=True, verbose_name='Token')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Token de Calendario'
+        verbose_name_plural = 'Tokens de Calendario'
+    
+    def __str__(self):
+        return f"Calendario de {self.user.get_full_name()}"
+    
+    def save(self, *args, **kwargs):
+        if not self.token:
+            self.token = self.generate_token()
+        super().save(*args, **kwargs)
+    
+    def rotate(self):
+        """Genera un token nuevo; las suscripciones anteriores dejan de funcionar"""
+        self.token = self.generate_token()
+        self.save(update_fields=['token'])
+    
+    @staticmethod
+    def generate_token():
+        """Genera un token seguro para la URL del calendario"""
+        return secrets.token_urlsafe(32)
+
+
 class AppointmentReminder(models.Model):
     """Modelo para recordatorios de citas"""
     REMINDER_TYPE_CHOICES = [
@@ -0,0 +1,142 @@
+"""
+Paginación por cursor (keyset) para listados de citas.
+
+A diferencia de ``PageNumberPagination`` no usa OFFSET ni ``COUNT(*)``: el
+cursor guarda la última posición (fecha, hora, id) y la página siguiente se
+obtiene con un filtro sobre el índice compuesto, con coste constante sin
+importar la profundidad.
+"""
+import base64
+from collections import OrderedDict, namedtuple
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+Cursor = namedtuple('Cursor', ['position', 'reverse'])
+
+
+class AppointmentCursorPagination(BasePagination):
+    """Cursor sobre (appointment_date, appointment_time, id), de la cita más reciente a la más antigua"""
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-appointment_date', '-appointment_time', '-id')
+    invalid_cursor_message = 'Cursor inválido'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def _fields(self, reverse=False):
+        """Pares (campo, descendente) del orden, invertidos si se pagina hacia atrás"""
+        return [
+            (name.lstrip('-'), name.startswith('-') != reverse)
+            for name in self.ordering
+        ]
+
+    def _after(self, fields, position):
+        """Filtro ``(a, b, c) > (x, y, z)`` expandido a OR de prefijos iguales"""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(fields, position):
+            lookup = f"{name}__{'lt' if descending else 'gt'}"
+            condition |= Q(**equal, **{lookup: value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+        fields = self._fields(reverse)
+
+        queryset = queryset.order_by(*[('-' if desc else '') + name for name, desc in fields])
+        if self.cursor:
+            queryset = queryset.filter(self._after(fields, self.cursor.position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = self.cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = results
+        return results
+
+    def _position(self, instance):
+        return tuple(getattr(instance, name.lstrip('-')) for name in self.ordering)
+
+    def encode_cursor(self, cursor):
+        raw = '|'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value)
+                       for value in cursor.position)
+        raw = f"{'r' if cursor.reverse else 'n'}|{raw}"
+        token = base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii')
+            direction, *values = raw.split('|')
+            if direction not in ('n', 'r') or len(values) != len(self.ordering):
+                raise ValueError
+            position = tuple(
+                self.model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            )
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(position=position, reverse=direction == 'r')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(position=self._position(self.page[-1]), reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(position=self._position(self.page[0]), reverse=True))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class UpcomingAppointmentCursorPagination(AppointmentCursorPagination):
+    """Cursor en orden cronológico, para agendas del usuario"""
+    ordering = ('appointment_date', 'appointment_time', 'id')
@@ -0,0 +1,14 @@
+from rest_framework import permissions
+
+
+class IsReceptionistOrAdmin(permissions.BasePermission):
+    """
+    Permiso que solo permite acceso a recepcionistas y administradores
+    """
+
+    def has_permission(self, request, view):
+        return request.user and request.user.is_authenticated and (
+            request.user.role in ['receptionist', 'admin'] or
+            request.user.is_staff or
+            request.user.is_superuser
+        )
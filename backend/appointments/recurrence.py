@@ -0,0 +1,144 @@
+"""
+Expansión de series de citas recurrentes.
+
+La n-ésima ocurrencia de una serie se calcula directamente a partir de la
+fecha de inicio, así que expandir un rango no recorre las ocurrencias
+anteriores. Solo las fechas hasta ``materialized_until`` existen como
+``Appointment``; las posteriores son ocurrencias pendientes que el motor de
+disponibilidad y el calendario calculan al vuelo.
+"""
+import calendar
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import AvailabilityCache
+from .models import Appointment, AppointmentSeries
+
+logger = logging.getLogger(__name__)
+
+# Horizonte por defecto de citas materializadas
+DEFAULT_HORIZON_WEEKS = 8
+
+
+def _add_months(day, months):
+    """Suma meses conservando el día, ajustado al último día del mes"""
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _nth_occurrence(series, n):
+    if series.frequency == 'monthly':
+        return _add_months(series.start_date, n * series.interval)
+    return series.start_date + timedelta(weeks=n * series.interval)
+
+
+def occurrence_dates(series, start, end):
+    """Fechas de la serie dentro de [start, end], en orden"""
+    last = end if series.end_date is None else min(end, series.end_date)
+    if last < series.start_date or start > last:
+        return
+
+    # Primer índice candidato sin recorrer las ocurrencias anteriores
+    if series.frequency == 'monthly':
+        months = (start.year - series.start_date.year) * 12 + start.month - series.start_date.month
+        n = max(0, months // series.interval - 1)
+    else:
+        n = max(0, (start - series.start_date).days // (7 * series.interval))
+
+    while series.max_occurrences is None or n < series.max_occurrences:
+        day = _nth_occurrence(series, n)
+        if day > last:
+            break
+        if day >= start:
+            yield day
+        n += 1
+
+
+def active_series(start, end):
+    """Series activas con ocurrencias pendientes de materializar en [start, end]"""
+    return AppointmentSeries.objects.filter(
+        is_active=True,
+        start_date__lte=end
+    ).filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=start)
+    ).filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=end)
+    )
+
+
+def pending_occurrences(series_list, start, end):
+    """Ocurrencias ``(serie, fecha)`` aún no materializadas dentro de [start, end]"""
+    for series in series_list:
+        first = start
+        if series.materialized_until and series.materialized_until >= first:
+            first = series.materialized_until + timedelta(days=1)
+        for day in occurrence_dates(series, first, end):
+            yield series, day
+
+
+def materialize_series(series, until):
+    """
+    Crear las citas de la serie hasta ``until``.
+
+    Con los días del doctor bloqueados como en ``booking``, cada ocurrencia
+    se comprueba con ``AvailabilityEngine`` contra citas, reservas vigentes y
+    otras series; las que se solapan se omiten con un aviso. Devuelve el
+    número de citas realmente insertadas.
+    """
+    # booking y availability importan este módulo
+    from .availability import AvailabilityEngine
+    from .booking import lock_days
+
+    first = max(timezone.localdate(), series.start_date)
+    if series.materialized_until:
+        first = max(first, series.materialized_until + timedelta(days=1))
+    if not series.is_active or first > until:
+        return 0
+
+    dates = list(occurrence_dates(series, first, until))
+    appointments = []
+    with transaction.atomic():
+        lock_days((series.doctor_id, day) for day in dates)
+        # Antes de leer la disponibilidad: así las ocurrencias de esta serie
+        # ya no cuentan como pendientes y no se bloquean a sí mismas
+        AppointmentSeries.objects.filter(pk=series.pk).update(materialized_until=until)
+        series.materialized_until = until
+
+        if dates:
+            engine = AvailabilityEngine([series.doctor_id], dates[0], dates[-1])
+            for day in dates:
+                slot = (series.doctor_id, day, series.appointment_time, series.duration)
+                if not engine.is_free(*slot):
+                    logger.warning(f"Series {series.pk}: slot {day} {series.appointment_time} already taken")
+                    continue
+                engine.occupy(*slot)
+                appointments.append(Appointment(
+                    patient_id=series.patient_id,
+                    doctor_id=series.doctor_id,
+                    specialty_id=series.specialty_id,
+                    appointment_date=day,
+                    appointment_time=series.appointment_time,
+                    duration=series.duration,
+                    reason=series.reason,
+                    notes=series.notes,
+                    series=series
+                ))
+            # Respaldo ante la restricción de unicidad; el bloqueo del día ya
+            # serializa las reservas
+            Appointment.objects.bulk_create(appointments, ignore_conflicts=True)
+
+    # ignore_conflicts no informa qué filas se omitieron: buscarlas por su UUID
+    inserted = list(Appointment.objects.filter(
+        appointment_id__in=[appointment.appointment_id for appointment in appointments]
+    ).values_list('appointment_date', flat=True)) if appointments else []
+
+    # bulk_create y update no emiten señales
+    for day in inserted:
+        AvailabilityCache.invalidate(series.doctor_id, day)
+    return len(inserted)
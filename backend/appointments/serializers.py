@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import Specialty, MedicalSchedule, Appointment, AppointmentReminder, TemporaryReservation
+from django.db.models import Count
+from .models import (
+    Specialty, MedicalSchedule, Appointment, AppointmentReminder, TemporaryReservation, AppointmentSeries,
+    DoctorDirectoryEntry
+)
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -15,6 +19,10 @@ class SpecialtySerializer(serializers.ModelSerializer):
     
     def get_doctor_count(self, obj):
         """Cuenta el número de doctores activos en esta especialidad"""
+        # Listados que precalculan el conteo (p. ej. desde el directorio) lo
+        # anotan como ``active_doctor_count`` y evitan una consulta por fila
+        if hasattr(obj, 'active_doctor_count'):
+            return obj.active_doctor_count
         return MedicalSchedule.objects.filter(
             specialty=obj,
             is_active=True
@@ -30,12 +38,43 @@ class DoctorSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'full_name', 'specialty']
     
     def get_specialty(self, obj):
-        """Obtiene las especialidades del doctor"""
-        specialties = Specialty.objects.filter(
-            schedules__doctor=obj,
-            schedules__is_active=True
-        ).distinct()
+        """
+        Obtiene las especialidades del doctor desde el directorio precalculado.
+        
+        Las entradas de todos los doctores del listado se leen con una
+        consulta y los conteos de doctores con otra, una vez por serializador.
+        """
+        counts = self._directory_counts()
+        specialties = []
+        for entry in self._directory_entries(obj):
+            specialty = entry.specialty
+            specialty.active_doctor_count = counts.get(specialty.id, 0)
+            specialties.append(specialty)
+        specialties.sort(key=lambda specialty: specialty.name)
         return SpecialtySerializer(specialties, many=True).data
+    
+    def _directory_entries(self, obj):
+        """Entradas del directorio de ``obj``, cargadas junto con las del resto del listado"""
+        holder = self.parent if isinstance(self.parent, serializers.ListSerializer) else self
+        entries = getattr(holder, '_directory_entry_cache', {})
+        if obj.pk not in entries:
+            doctors = holder.instance if holder is not self and holder.instance is not None else []
+            doctor_ids = {doctor.pk for doctor in doctors} | {obj.pk}
+            entries = {doctor_id: [] for doctor_id in doctor_ids}
+            for entry in DoctorDirectoryEntry.objects.filter(doctor_id__in=doctor_ids).select_related('specialty'):
+                entries[entry.doctor_id].append(entry)
+            holder._directory_entry_cache = entries
+        return entries[obj.pk]
+    
+    def _directory_counts(self):
+        root = self.root
+        if not hasattr(root, '_directory_count_cache'):
+            root._directory_count_cache = dict(
+                DoctorDirectoryEntry.objects.values('specialty').annotate(
+                    total=Count('doctor')
+                ).values_list('specialty', 'total')
+            )
+        return root._directory_count_cache
 
 
 class MedicalScheduleSerializer(serializers.ModelSerializer):
@@ -132,6 +171,32 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return data
 
 
+class AppointmentSeriesSerializer(serializers.ModelSerializer):
+    patient_name = serializers.CharField(source='patient.get_full_name', read_only=True)
+    doctor_name = serializers.CharField(source='doctor.get_full_name', read_only=True)
+    frequency_display = serializers.CharField(source='get_frequency_display', read_only=True)
+    
+    class Meta:
+        model = AppointmentSeries
+        fields = ['id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'specialty',
+                  'frequency', 'frequency_display', 'interval', 'start_date', 'end_date',
+                  'max_occurrences', 'appointment_time', 'duration', 'reason', 'notes',
+                  'materialized_until', 'is_active', 'created_at', 'updated_at']
+        read_only_fields = ['materialized_until', 'is_active', 'created_at', 'updated_at']
+    
+    def validate(self, data):
+        """Valida la regla de recurrencia"""
+        from datetime import date
+        start_date = data.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = data.get('end_date', getattr(self.instance, 'end_date', None))
+        
+        if 'start_date' in data and data['start_date'] < date.today():
+            raise serializers.ValidationError("La fecha de inicio no puede ser en el pasado.")
+        if end_date and start_date and end_date < start_date:
+            raise serializers.ValidationError("La fecha de fin debe ser posterior a la de inicio.")
+        return data
+
+
 class AppointmentCreateSerializer(serializers.ModelSerializer):
     """Serializer para crear citas con validación adicional"""
     class Meta:
@@ -228,6 +293,9 @@ class TemporaryReservationSerializer(serializers.ModelSerializer):
                  'specialty_name', 'appointment_date', 'appointment_time', 'expires_at',
                  'time_remaining', 'is_expired', 'is_active', 'created_at']
         read_only_fields = ['created_at', 'user', 'expires_at', 'user_name']
+        # La unicidad del horario la garantiza booking.reserve_slot bajo bloqueo,
+        # teniendo en cuenta las reservas vencidas
+        validators = []
     
     def get_time_remaining(self, obj):
         """Calcula el tiempo restante en segundos"""
@@ -253,3 +321,22 @@ class AvailableSlotSerializer(serializers.Serializer):
     available = serializers.BooleanField()
     doctor_id = serializers.IntegerField(required=False)
     doctor_name = serializers.CharField(required=False)
+
+
+class BulkAppointmentRowSerializer(serializers.Serializer):
+    """Serializer para validar una fila de la carga masiva de citas sin consultar la base de datos"""
+    patient = serializers.IntegerField()
+    doctor = serializers.IntegerField()
+    specialty = serializers.IntegerField(required=False, allow_null=True)
+    appointment_date = serializers.DateField()
+    appointment_time = serializers.TimeField()
+    duration = serializers.IntegerField(default=30, min_value=15, max_value=120)
+    status = serializers.ChoiceField(choices=Appointment.STATUS_CHOICES, default='scheduled')
+    reason = serializers.CharField()
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    
+    def validate_appointment_date(self, value):
+        from datetime import date
+        if value < date.today():
+            raise serializers.ValidationError("La fecha de la cita no puede ser en el pasado.")
+        return value
@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .cache import AvailabilityCache, DoctorDirectoryCache
+from .directory import rebuild_doctor_entries
+from .models import Appointment, AppointmentSeries, DoctorDirectoryEntry, MedicalSchedule, Specialty, TemporaryReservation
+
+# Nota: las actualizaciones masivas (QuerySet.update) no emiten señales; las
+# reservas que expiran sin escritura quedan cubiertas por el TTL de la caché.
+
+
+@receiver(post_init, sender=Appointment)
+@receiver(post_init, sender=TemporaryReservation)
+def remember_availability_key(sender, instance, **kwargs):
+    """Recordar doctor y fecha originales para invalidar también la clave anterior"""
+    # Leer de __dict__ para no disparar consultas en campos diferidos
+    instance._availability_key = (
+        instance.__dict__.get('doctor_id'),
+        instance.__dict__.get('appointment_date'),
+    )
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+@receiver(post_save, sender=TemporaryReservation)
+@receiver(post_delete, sender=TemporaryReservation)
+def invalidate_slot_availability(sender, instance, **kwargs):
+    """Invalidar la disponibilidad del doctor en la fecha de la cita o reserva"""
+    keys = {(instance.doctor_id, instance.appointment_date)}
+    previous = getattr(instance, '_availability_key', None)
+    if previous:
+        keys.add(previous)
+
+    for doctor_id, day in keys:
+        if doctor_id and day:
+            AvailabilityCache.invalidate(doctor_id, day)
+
+    instance._availability_key = (instance.doctor_id, instance.appointment_date)
+
+
+@receiver(post_save, sender=MedicalSchedule)
+@receiver(post_delete, sender=MedicalSchedule)
+def invalidate_schedule_availability(sender, instance, **kwargs):
+    """Un cambio de horario afecta a todas las fechas del doctor"""
+    if instance.doctor_id:
+        AvailabilityCache.invalidate_doctor(instance.doctor_id)
+
+
+@receiver(post_save, sender=AppointmentSeries)
+@receiver(post_delete, sender=AppointmentSeries)
+def invalidate_series_availability(sender, instance, **kwargs):
+    """Las ocurrencias pendientes de una serie ocupan fechas indefinidas del doctor"""
+    if instance.doctor_id:
+        AvailabilityCache.invalidate_doctor(instance.doctor_id)
+
+
+# Datos de usuario que se copian al directorio de doctores
+DIRECTORY_USER_FIELDS = {'first_name', 'last_name', 'email', 'is_active', 'date_joined'}
+
+
+@receiver(post_init, sender=MedicalSchedule)
+def remember_schedule_doctor(sender, instance, **kwargs):
+    """Recordar el doctor original para recalcular también su directorio"""
+    instance._directory_doctor_id = instance.__dict__.get('doctor_id')
+
+
+@receiver(post_save, sender=MedicalSchedule)
+@receiver(post_delete, sender=MedicalSchedule)
+def rebuild_directory_on_schedule_change(sender, instance, **kwargs):
+    """Recalcular el directorio de los doctores afectados por el horario"""
+    doctor_ids = {instance.doctor_id, getattr(instance, '_directory_doctor_id', None)}
+    for doctor_id in doctor_ids - {None}:
+        rebuild_doctor_entries(doctor_id)
+    instance._directory_doctor_id = instance.doctor_id
+
+
+@receiver(post_save, sender='authentication.DoctorProfile')
+@receiver(post_delete, sender='authentication.DoctorProfile')
+def rebuild_directory_on_profile_change(sender, instance, **kwargs):
+    """Experiencia y costo de consulta vienen del perfil del doctor"""
+    rebuild_doctor_entries(instance.user_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def rebuild_directory_on_user_change(sender, instance, created=False, update_fields=None, **kwargs):
+    """Recalcular el directorio si cambian nombre, correo o estado del doctor"""
+    if created or (update_fields and not DIRECTORY_USER_FIELDS & set(update_fields)):
+        return
+    if DoctorDirectoryEntry.objects.filter(doctor_id=instance.pk).exists():
+        rebuild_doctor_entries(instance.pk)
+    elif instance.is_active and MedicalSchedule.objects.filter(doctor_id=instance.pk, is_active=True).exists():
+        # Un doctor reactivado vuelve al directorio
+        rebuild_doctor_entries(instance.pk)
+
+
+@receiver(post_save, sender=Specialty)
+@receiver(post_delete, sender=Specialty)
+def invalidate_specialty_directory(sender, instance, **kwargs):
+    DoctorDirectoryCache.invalidate(instance.pk)
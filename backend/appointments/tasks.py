@@ -0,0 +1,83 @@
+from celery import shared_task
+from django.utils import timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def release_expired_reservations(batch_size=1000):
+    """
+    Tarea periódica para desactivar reservas temporales vencidas
+
+    Cada lote es un único ``UPDATE ... WHERE id IN (SELECT ... LIMIT n)`` que
+    usa el índice parcial de reservas activas. También elimina las filas de
+    bloqueo por día (``DoctorDayClaim``) de fechas pasadas.
+
+    No hace falta invalidar la caché de disponibilidad: las reservas vencidas
+    ya no cuentan como ocupadas y las entradas cacheadas expiran con ellas.
+    """
+    from .models import DoctorDayClaim, TemporaryReservation
+
+    now = timezone.now()
+    reclaimed = 0
+    batches = 0
+
+    while True:
+        expired_ids = TemporaryReservation.objects.filter(
+            is_active=True,
+            expires_at__lt=now
+        ).values('id')[:batch_size]
+
+        updated = TemporaryReservation.objects.filter(
+            id__in=expired_ids
+        ).update(is_active=False)
+
+        if not updated:
+            break
+        reclaimed += updated
+        batches += 1
+        if updated < batch_size:
+            break
+
+    claims_deleted, _ = DoctorDayClaim.objects.filter(
+        appointment_date__lt=timezone.localdate()
+    ).delete()
+
+    stats = {
+        'reclaimed': reclaimed,
+        'batches': batches,
+        'day_claims_deleted': claims_deleted,
+    }
+    logger.info(f"Released expired temporary reservations: {stats}")
+    return stats
+
+
+@shared_task
+def materialize_appointment_series(horizon_weeks=None):
+    """
+    Tarea periódica para crear las citas de las series recurrentes dentro
+    del horizonte móvil (por defecto 8 semanas)
+    """
+    from datetime import timedelta
+    from django.db.models import Q
+    from .models import AppointmentSeries
+    from .recurrence import DEFAULT_HORIZON_WEEKS, materialize_series
+
+    horizon = timezone.localdate() + timedelta(weeks=horizon_weeks or DEFAULT_HORIZON_WEEKS)
+    series_qs = AppointmentSeries.objects.filter(
+        is_active=True,
+        start_date__lte=horizon
+    ).filter(
+        Q(materialized_until__isnull=True) | Q(materialized_until__lt=horizon)
+    )
+
+    series_count = 0
+    created = 0
+    for series in series_qs.iterator():
+        created += materialize_series(series, horizon)
+        series_count += 1
+
+    stats = {'series': series_count, 'created': created, 'horizon': horizon.isoformat()}
+    logger.info(f"Materialized appointment series: {stats}")
+    return stats
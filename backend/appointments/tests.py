@@ -1,4 +1,5 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth import get_user_model
@@ -7,10 +8,19 @@ from rest_framework import status
 from datetime import datetime, date, time, timedelta
 import uuid
 
-from .models import Specialty, MedicalSchedule, Appointment, AppointmentReminder
+from .models import (
+    Specialty, MedicalSchedule, Appointment, AppointmentReminder, TemporaryReservation, DoctorDayClaim,
+    AppointmentSeries, CalendarFeedToken, DoctorDirectoryEntry
+)
+from .tasks import materialize_appointment_series, release_expired_reservations
+from .availability import AvailabilityEngine, get_available_slots
+from .cache import AvailabilityCache
+from .booking import ReservationExpiredError, SlotTakenError, confirm_reservation, reserve_slot
+from .bulk import bulk_create_appointments
+from .recurrence import materialize_series, occurrence_dates
 from .serializers import (
     SpecialtySerializer, MedicalScheduleSerializer, 
-    AppointmentSerializer, AppointmentReminderSerializer
+    AppointmentSerializer, AppointmentReminderSerializer, DoctorSerializer
 )
 
 User = get_user_model()
@@ -676,4 +686,864 @@ class AppointmentAPITests(APITestCase):
         
         # Verificar que el paciente puede ver su propia cita
         response = self.client.get(self.appointment_detail_url)
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class AvailabilityEngineTests(BaseAppointmentTestCase):
+    """Tests para el motor de disponibilidad basado en MedicalSchedule"""
+    
+    def setUp(self):
+        super().setUp()
+        # Lunes dentro de dos semanas, lejos de la cita creada en setUp
+        today = date.today()
+        self.monday = today + timedelta(days=14 - today.weekday())
+    
+    def test_slots_follow_medical_schedule(self):
+        """Prueba que los slots se generan desde el horario del doctor"""
+        slots = get_available_slots(self.doctor.id, self.monday)
+        self.assertEqual(len(slots), 16)
+        self.assertEqual(slots[0], '09:00')
+        self.assertEqual(slots[-1], '16:30')
+    
+    def test_day_without_schedule_has_no_slots(self):
+        """Prueba que un día sin horario no ofrece slots"""
+        saturday = self.monday + timedelta(days=5)
+        self.assertEqual(get_available_slots(self.doctor.id, saturday), [])
+    
+    def test_appointment_duration_blocks_overlapping_slots(self):
+        """Prueba que una cita larga bloquea todos los slots que solapa"""
+        Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(10, 0),
+            duration=60,
+            status='confirmed',
+            reason='Control'
+        )
+        Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(14, 0),
+            duration=30,
+            status='cancelled',
+            reason='Cancelada'
+        )
+        slots = get_available_slots(self.doctor.id, self.monday)
+        self.assertNotIn('10:00', slots)
+        self.assertNotIn('10:30', slots)
+        self.assertIn('11:00', slots)
+        self.assertIn('14:00', slots)
+    
+    def test_only_live_reservations_block_slots(self):
+        """Prueba que solo las reservas temporales vigentes bloquean slots"""
+        TemporaryReservation.objects.create(
+            user=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(9, 0)
+        )
+        TemporaryReservation.objects.create(
+            user=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(9, 30),
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        slots = get_available_slots(self.doctor.id, self.monday)
+        self.assertNotIn('09:00', slots)
+        self.assertIn('09:30', slots)
+    
+    def test_one_query_per_table(self):
+        """Prueba que el cálculo usa una consulta por tabla"""
+        engine = AvailabilityEngine([self.doctor.id], self.monday, self.monday + timedelta(days=6))
+        with self.assertNumQueries(4):
+            engine.load()
+        with self.assertNumQueries(0):
+            for day in engine.dates():
+                engine.free_slots(self.doctor.id, day)
+    
+    def test_available_slots_endpoint(self):
+        """Prueba el endpoint available-slots"""
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user=self.patient)
+        response = client.get(reverse('available-slots'), {
+            'doctor_id': self.doctor.id,
+            'date': self.monday.isoformat()
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, get_available_slots(self.doctor.id, self.monday))
+        
+        response = client.get(reverse('available-slots'), {
+            'doctor_id': self.doctor.id,
+            'date': 'no-es-fecha'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NextAvailableSearchTests(BaseAppointmentTestCase):
+    """Tests para la búsqueda de próximos horarios libres entre doctores"""
+    
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.monday = today + timedelta(days=14 - today.weekday())
+        self.other_doctor = User.objects.create_user(email='doctor2@hospital.com',
+            password='doctorpassword',
+            first_name='Otra',
+            last_name='Doctora'
+        )
+        # La segunda doctora atiende desde las 08:00 los lunes
+        MedicalSchedule.objects.create(
+            doctor=self.other_doctor,
+            specialty=self.specialty,
+            weekday=0,
+            start_time=time(8, 0),
+            end_time=time(9, 0),
+            slot_duration=30,
+            is_active=True
+        )
+    
+    def test_merges_doctors_in_chronological_order(self):
+        """Prueba que los slots de varios doctores se combinan por fecha y hora"""
+        engine = AvailabilityEngine(specialty_id=self.specialty.id, start_date=self.monday)
+        slots = engine.next_available(limit=4)
+        self.assertEqual(
+            [(slot.strftime('%H:%M'), doctor_id) for _, slot, doctor_id in slots],
+            [
+                ('08:00', self.other_doctor.id),
+                ('08:30', self.other_doctor.id),
+                ('09:00', self.doctor.id),
+                ('09:30', self.doctor.id),
+            ]
+        )
+    
+    def test_search_runs_one_query_per_table(self):
+        """Prueba que la búsqueda en una ventana de dos semanas no depende del número de días"""
+        engine = AvailabilityEngine(
+            specialty_id=self.specialty.id,
+            start_date=self.monday,
+            end_date=self.monday + timedelta(days=13)
+        )
+        with self.assertNumQueries(4):
+            slots = engine.next_available(limit=50)
+        self.assertEqual(len(slots), 50)
+    
+    def test_next_available_endpoint(self):
+        """Prueba el endpoint next-available"""
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user=self.patient)
+        response = client.get(reverse('next-available'), {
+            'doctor_ids': f'{self.doctor.id},{self.other_doctor.id}',
+            'start_date': self.monday.isoformat(),
+            'limit': 3
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['doctor_name'], 'Otra Doctora')
+        self.assertEqual(response.data[0]['time'], '08:00')
+        
+        response = client.get(reverse('next-available'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'availability-tests',
+    }
+})
+class AvailabilityCacheTests(BaseAppointmentTestCase):
+    """Tests para la caché de disponibilidad invalidada por eventos"""
+    
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        today = date.today()
+        self.monday = today + timedelta(days=14 - today.weekday())
+    
+    def test_second_call_served_from_cache(self):
+        """Prueba que la segunda consulta no toca la base de datos"""
+        first = get_available_slots(self.doctor.id, self.monday)
+        with self.assertNumQueries(0):
+            second = get_available_slots(self.doctor.id, self.monday)
+        self.assertEqual(first, second)
+        stats = AvailabilityCache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+    
+    def test_appointment_invalidates_its_date_only(self):
+        """Prueba que una cita invalida solo la fecha afectada"""
+        tuesday = self.monday + timedelta(days=1)
+        get_available_slots(self.doctor.id, self.monday)
+        get_available_slots(self.doctor.id, tuesday)
+        
+        Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(9, 0),
+            reason='Control'
+        )
+        self.assertIsNone(AvailabilityCache.get(self.doctor.id, self.monday))
+        self.assertIsNotNone(AvailabilityCache.get(self.doctor.id, tuesday))
+        self.assertNotIn('09:00', get_available_slots(self.doctor.id, self.monday))
+    
+    def test_moving_appointment_invalidates_previous_date(self):
+        """Prueba que mover una cita invalida la fecha anterior y la nueva"""
+        appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(9, 0),
+            reason='Control'
+        )
+        tuesday = self.monday + timedelta(days=1)
+        self.assertNotIn('09:00', get_available_slots(self.doctor.id, self.monday))
+        
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        appointment.appointment_date = tuesday
+        appointment.save()
+        self.assertIn('09:00', get_available_slots(self.doctor.id, self.monday))
+    
+    def test_schedule_change_invalidates_doctor(self):
+        """Prueba que cambiar el horario invalida todas las fechas del doctor"""
+        get_available_slots(self.doctor.id, self.monday)
+        self.schedule.end_time = time(12, 0)
+        self.schedule.save()
+        self.assertIsNone(AvailabilityCache.get(self.doctor.id, self.monday))
+        self.assertEqual(get_available_slots(self.doctor.id, self.monday)[-1], '11:30')
+    
+    def test_series_doctor_change_invalidates_previous_doctor(self):
+        """Prueba que reasignar una serie libera el horario del doctor anterior"""
+        from rest_framework.test import APIClient
+        other_doctor = User.objects.create_user(email='other.doctor@hospital.com',
+            password='doctorpassword',
+            first_name='Otro',
+            last_name='Doctor'
+        )
+        series = AppointmentSeries.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            frequency='weekly',
+            start_date=self.monday,
+            appointment_time=time(11, 0),
+            reason='Control crónico'
+        )
+        materialize_series(series, self.monday)
+        later = self.monday + timedelta(weeks=5)
+        self.assertNotIn('11:00', get_available_slots(self.doctor.id, self.monday))
+        self.assertNotIn('11:00', get_available_slots(self.doctor.id, later))
+        
+        self.admin.role = 'admin'
+        self.admin.save()
+        before = timezone.now()
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        response = client.patch(reverse('appointment-series-detail', args=[series.id]), {'doctor': other_doctor.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        self.assertIn('11:00', get_available_slots(self.doctor.id, self.monday))
+        self.assertIn('11:00', get_available_slots(self.doctor.id, later))
+        # La cancelación masiva actualiza updated_at para el ETag del calendario
+        cancelled = series.appointments.get(doctor=self.doctor)
+        self.assertEqual(cancelled.status, 'cancelled')
+        self.assertGreaterEqual(cancelled.updated_at, before)
+
+
+class SlotBookingTests(BaseAppointmentTestCase):
+    """Tests para la reserva de horarios con bloqueo por slot"""
+    
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.monday = today + timedelta(days=14 - today.weekday())
+        self.other_patient = User.objects.create_user(email='other@example.com',
+            password='otherpassword',
+            first_name='Other',
+            last_name='Patient'
+        )
+    
+    def _reserve(self, user, slot_time=time(9, 0)):
+        return reserve_slot(user, self.doctor, self.specialty, self.monday, slot_time)
+    
+    def test_second_reservation_for_same_slot_is_rejected(self):
+        """Prueba que un horario reservado devuelve SlotTakenError"""
+        self._reserve(self.patient)
+        with self.assertRaises(SlotTakenError):
+            self._reserve(self.other_patient)
+    
+    def test_expired_reservation_does_not_block_slot(self):
+        """Prueba que una reserva vencida aún activa no bloquea el horario"""
+        expired = TemporaryReservation.objects.create(
+            user=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(9, 0),
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        reservation = self._reserve(self.other_patient)
+        expired.refresh_from_db()
+        self.assertFalse(expired.is_active)
+        self.assertTrue(reservation.is_active)
+    
+    def test_confirm_reservation_creates_appointment(self):
+        """Prueba que confirmar crea la cita y libera la reserva"""
+        reservation = self._reserve(self.patient)
+        appointment = confirm_reservation(self.patient, reservation.id)
+        reservation.refresh_from_db()
+        self.assertFalse(reservation.is_active)
+        self.assertEqual(appointment.appointment_time, time(9, 0))
+        with self.assertRaises(SlotTakenError):
+            self._reserve(self.other_patient)
+    
+    def test_cancelled_appointment_frees_slot(self):
+        """Prueba que una cita cancelada permite volver a reservar el horario"""
+        reservation = self._reserve(self.patient)
+        confirm_reservation(self.patient, reservation.id).cancel('Cambio de planes')
+        reservation = self._reserve(self.other_patient)
+        appointment = confirm_reservation(self.other_patient, reservation.id)
+        self.assertEqual(appointment.patient, self.other_patient)
+    
+    def test_overlapping_slot_is_rejected(self):
+        """Prueba que un horario solapado con una cita más larga se rechaza"""
+        Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(9, 0),
+            duration=60,
+            reason='Control largo'
+        )
+        with self.assertRaises(SlotTakenError):
+            self._reserve(self.other_patient, time(9, 30))
+        self.assertTrue(self._reserve(self.other_patient, time(10, 0)).is_active)
+    
+    def test_confirm_rejects_overlap_created_meanwhile(self):
+        """Prueba que confirmar falla si entretanto se creó una cita solapada"""
+        reservation = self._reserve(self.patient, time(10, 0))
+        Appointment.objects.create(
+            patient=self.other_patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(9, 45),
+            duration=30,
+            reason='Sobreturno'
+        )
+        with self.assertRaises(SlotTakenError):
+            confirm_reservation(self.patient, reservation.id)
+        reservation.refresh_from_db()
+        self.assertTrue(reservation.is_active)
+    
+    def test_confirmed_appointment_keeps_slot_length(self):
+        """Prueba que la cita confirmada dura lo que el slot del horario"""
+        self.schedule.slot_duration = 15
+        self.schedule.save()
+        reservation = self._reserve(self.patient, time(9, 0))
+        appointment = confirm_reservation(self.patient, reservation.id)
+        
+        self.assertEqual(appointment.duration, 15)
+        self.assertTrue(self._reserve(self.other_patient, time(9, 15)).is_active)
+    
+    def test_confirm_expired_reservation_fails(self):
+        """Prueba que no se puede confirmar una reserva vencida"""
+        reservation = self._reserve(self.patient)
+        with self.assertRaises(ReservationExpiredError):
+            confirm_reservation(self.patient, reservation.id, now=reservation.expires_at)
+    
+    def test_reservation_endpoint_returns_conflict(self):
+        """Prueba que el endpoint responde 409 cuando el horario está tomado"""
+        from rest_framework.test import APIClient
+        self._reserve(self.patient)
+        client = APIClient()
+        client.force_authenticate(user=self.other_patient)
+        response = client.post(reverse('appointment-create-temporary-reservation'), {
+            'doctor': self.doctor.id,
+            'specialty': self.specialty.id,
+            'appointment_date': self.monday.isoformat(),
+            'appointment_time': '09:00'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['code'], 'slot_taken')
+
+
+class ReleaseExpiredReservationsTaskTests(BaseAppointmentTestCase):
+    """Tests para el barrido periódico de reservas temporales vencidas"""
+    
+    def _reservation(self, slot_time, expires_at):
+        return TemporaryReservation.objects.create(
+            user=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=date.today() + timedelta(days=3),
+            appointment_time=slot_time,
+            expires_at=expires_at
+        )
+    
+    def test_deactivates_only_expired_reservations_in_batches(self):
+        """Prueba que solo se desactivan las reservas vencidas, por lotes"""
+        past = timezone.now() - timedelta(minutes=5)
+        expired = [self._reservation(time(9 + i, 0), past) for i in range(5)]
+        live = self._reservation(time(16, 0), timezone.now() + timedelta(minutes=5))
+        DoctorDayClaim.objects.create(
+            doctor=self.doctor,
+            appointment_date=date.today() - timedelta(days=1)
+        )
+        
+        stats = release_expired_reservations(batch_size=2)
+        
+        self.assertEqual(stats['reclaimed'], 5)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(stats['day_claims_deleted'], 1)
+        self.assertFalse(TemporaryReservation.objects.filter(
+            id__in=[r.id for r in expired], is_active=True
+        ).exists())
+        live.refresh_from_db()
+        self.assertTrue(live.is_active)
+
+
+class BulkAppointmentBookingTests(BaseAppointmentTestCase):
+    """Tests para la carga masiva de citas"""
+    
+    def setUp(self):
+        super().setUp()
+        self.doctor.role = 'doctor'
+        self.doctor.save()
+        self.day = date.today() + timedelta(days=1)
+    
+    def _row(self, hour, minute=0, **overrides):
+        row = {
+            'patient': self.patient.id,
+            'doctor': self.doctor.id,
+            'specialty': self.specialty.id,
+            'appointment_date': self.day.isoformat(),
+            'appointment_time': f'{hour:02d}:{minute:02d}',
+            'reason': 'Importación'
+        }
+        row.update(overrides)
+        return row
+    
+    def test_reports_per_row_results(self):
+        """Prueba que se crean las filas válidas y se reportan los errores por fila"""
+        rows = [
+            self._row(9),
+            self._row(9),                     # choca con la fila anterior
+            self._row(10),                    # choca con la cita existente
+            self._row(11, doctor=999999),     # doctor inexistente
+            self._row(12, appointment_date=(date.today() - timedelta(days=1)).isoformat()),
+            self._row(13, status='cancelled'),
+        ]
+        results = bulk_create_appointments(rows)
+        
+        self.assertEqual([r['status'] for r in results],
+                         ['created', 'error', 'error', 'error', 'error', 'created'])
+        self.assertEqual([r['row'] for r in results], list(range(6)))
+        self.assertIn('doctor', results[3]['errors'])
+        self.assertIn('appointment_date', results[4]['errors'])
+        self.assertTrue(Appointment.objects.filter(id=results[0]['id'], appointment_time=time(9, 0)).exists())
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 3)
+    
+    def test_query_count_does_not_grow_with_rows(self):
+        """Prueba que la validación usa consultas por conjuntos y no por fila"""
+        other_day = (self.day + timedelta(days=1)).isoformat()
+        rows = [self._row(9 + i // 4, (i % 4) * 15, appointment_date=other_day, duration=15) for i in range(32)]
+        # usuarios, especialidades, SAVEPOINT, bloqueo del día (INSERT y SELECT),
+        # horarios, citas, reservas y series del doctor, INSERT, RELEASE
+        with self.assertNumQueries(11):
+            results = bulk_create_appointments(rows)
+        self.assertTrue(all(r['status'] == 'created' for r in results))
+    
+    def test_overlaps_reservations_and_roles(self):
+        """Prueba que se detectan solapamientos, reservas vigentes y doctores inválidos"""
+        TemporaryReservation.objects.create(
+            user=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.day,
+            appointment_time=time(14, 0)
+        )
+        rows = [
+            self._row(9, duration=60),
+            self._row(9, 30),                 # dentro de la fila anterior
+            self._row(9, 45),
+            self._row(10, 15),                # dentro de la cita existente (10:00-10:30)
+            self._row(14),                    # reserva temporal vigente
+            self._row(15, doctor=self.patient.id),
+            self._row(16),
+        ]
+        results = bulk_create_appointments(rows)
+        
+        self.assertEqual([r['status'] for r in results],
+                         ['created', 'error', 'error', 'error', 'error', 'error', 'created'])
+        self.assertEqual(results[5]['errors']['doctor'], ['El usuario no es un doctor'])
+    
+    def test_endpoint_requires_receptionist_or_admin(self):
+        """Prueba los permisos y códigos de estado del endpoint"""
+        from rest_framework.test import APIClient
+        client = APIClient()
+        url = reverse('bulk-create')
+        
+        client.force_authenticate(user=self.patient)
+        response = client.post(url, {'appointments': [self._row(9)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        client.force_authenticate(user=self.admin)
+        response = client.post(url, {'appointments': [self._row(9), self._row(10)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'], 1)
+
+
+class AppointmentSeriesTests(BaseAppointmentTestCase):
+    """Tests para las series de citas recurrentes"""
+    
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        self.series = AppointmentSeries.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            frequency='weekly',
+            start_date=self.monday,
+            appointment_time=time(11, 0),
+            reason='Control crónico'
+        )
+    
+    def test_occurrence_dates(self):
+        """Prueba la expansión semanal, mensual y el límite de ocurrencias"""
+        dates = list(occurrence_dates(self.series, self.monday + timedelta(days=1), self.monday + timedelta(weeks=3)))
+        self.assertEqual(dates, [self.monday + timedelta(weeks=n) for n in (1, 2, 3)])
+        
+        monthly = AppointmentSeries(
+            frequency='monthly', interval=1, start_date=date(2031, 1, 31), max_occurrences=3
+        )
+        self.assertEqual(
+            list(occurrence_dates(monthly, date(2031, 1, 1), date(2031, 12, 31))),
+            [date(2031, 1, 31), date(2031, 2, 28), date(2031, 3, 31)]
+        )
+    
+    def test_materializes_only_horizon(self):
+        """Prueba que solo se crean citas hasta el horizonte"""
+        horizon = self.monday + timedelta(weeks=2)
+        created = materialize_series(self.series, horizon)
+        
+        self.assertEqual(created, 3)
+        self.assertEqual(self.series.appointments.count(), 3)
+        self.series.refresh_from_db()
+        self.assertEqual(self.series.materialized_until, horizon)
+        # Repetir no duplica citas
+        self.assertEqual(materialize_series(self.series, horizon), 0)
+    
+    def test_skips_overlapping_occurrences(self):
+        """Prueba que se omiten las ocurrencias que se solapan con citas, reservas u otras series"""
+        Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday,
+            appointment_time=time(10, 30),
+            duration=60,
+            reason='Control largo'
+        )
+        TemporaryReservation.objects.create(
+            user=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            appointment_date=self.monday + timedelta(weeks=1),
+            appointment_time=time(11, 0)
+        )
+        AppointmentSeries.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            specialty=self.specialty,
+            frequency='weekly',
+            start_date=self.monday + timedelta(weeks=2),
+            appointment_time=time(10, 45),
+            max_occurrences=1,
+            reason='Otra serie'
+        )
+        created = materialize_series(self.series, self.monday + timedelta(weeks=3))
+        
+        self.assertEqual(created, 1)
+        self.assertEqual(
+            list(self.series.appointments.values_list('appointment_date', flat=True)),
+            [self.monday + timedelta(weeks=3)]
+        )
+    
+    def test_count_excludes_skipped_conflicts(self):
+        """Prueba que se cuentan solo las citas insertadas, no las omitidas por conflicto"""
+        from unittest import mock
+        bulk_create = Appointment.objects.bulk_create
+        
+        def concurrent_booking(*args, **kwargs):
+            # Otra reserva ocupa el primer horario tras la comprobación
+            Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                specialty=self.specialty,
+                appointment_date=self.monday,
+                appointment_time=time(11, 0),
+                reason='Reserva simultánea'
+            )
+            return bulk_create(*args, **kwargs)
+        
+        with mock.patch.object(Appointment.objects, 'bulk_create', side_effect=concurrent_booking):
+            created = materialize_series(self.series, self.monday + timedelta(weeks=2))
+        
+        self.assertEqual(created, 2)
+        self.assertEqual(self.series.appointments.count(), 2)
+    
+    def test_pending_occurrences_block_availability(self):
+        """Prueba que las ocurrencias no materializadas ocupan el horario"""
+        materialize_series(self.series, self.monday + timedelta(weeks=1))
+        later = self.monday + timedelta(weeks=5)
+        
+        self.assertNotIn('11:00', get_available_slots(self.doctor.id, later))
+        self.assertIn('11:30', get_available_slots(self.doctor.id, later))
+        with self.assertRaises(SlotTakenError):
+            reserve_slot(self.admin, self.doctor, self.specialty, later, time(11, 0))
+    
+    def test_periodic_task_materializes_active_series(self):
+        """Prueba la tarea periódica de materialización"""
+        stats = materialize_appointment_series(horizon_weeks=4)
+        self.assertEqual(stats['series'], 1)
+        self.assertEqual(stats['created'], self.series.appointments.count())
+        self.assertGreater(stats['created'], 0)
+    
+    def test_calendar_includes_virtual_occurrences(self):
+        """Prueba que el calendario combina citas y ocurrencias calculadas"""
+        from rest_framework.test import APIClient
+        materialize_series(self.series, self.monday)
+        client = APIClient()
+        client.force_authenticate(user=self.patient)
+        response = client.get(reverse('calendar'), {
+            'start_date': self.monday.isoformat(),
+            'end_date': (self.monday + timedelta(weeks=2)).isoformat()
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        series_entries = [entry for entry in response.data if entry['series'] == self.series.id]
+        self.assertEqual([entry['is_virtual'] for entry in series_entries], [False, True, True])
+
+
+class CalendarFeedTests(BaseAppointmentTestCase):
+    """Tests para el calendario .ics por token"""
+    
+    def setUp(self):
+        super().setUp()
+        self.doctor.role = 'doctor'
+        self.doctor.save()
+        self.feed_token = CalendarFeedToken.objects.create(user=self.doctor)
+        self.url = reverse('calendar-feed-ics', args=[self.feed_token.token])
+    
+    def _content(self, response):
+        return b''.join(response.streaming_content).decode('utf-8')
+    
+    def test_streams_events(self):
+        """Prueba que el calendario contiene las citas del doctor"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(response.has_header('ETag'))
+        content = self._content(response)
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertIn(f'UID:{self.appointment.appointment_id}@medical-system', content)
+        self.assertIn('SUMMARY:Cita: Patient Test', content)
+        self.assertIn('CATEGORIES:Cardiología', content)
+    
+    def test_unchanged_feed_returns_304_with_one_query(self):
+        """Prueba que una consulta sin cambios responde 304 con una sola consulta"""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        
+        self.appointment.confirm()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('STATUS:CONFIRMED', self._content(response))
+    
+    def test_patient_token_resolved_once(self):
+        """Prueba que el token se resuelve una vez y el filtro va por doctor_id o patient_id"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        patient_token = CalendarFeedToken.objects.create(user=self.patient)
+        url = reverse('calendar-feed-ics', args=[patient_token.token])
+        
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertIn('"appointments_appointment"."doctor_id" = (SELECT', sql)
+        self.assertIn('"appointments_appointment"."patient_id" = (SELECT', sql)
+    
+    def test_invalid_or_rotated_token(self):
+        """Prueba que un token rotado deja de funcionar"""
+        self.feed_token.rotate()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        
+        from rest_framework.test import APIClient
+        client = APIClient()
+        client.force_authenticate(user=self.doctor)
+        response = client.get(reverse('calendar-feed'))
+        self.assertEqual(response.data['token'], self.feed_token.token)
+        self.assertEqual(self.client.get(response.data['url']).status_code, 200)
+
+
+class AppointmentCursorPaginationTests(BaseAppointmentTestCase):
+    """Tests para la paginación por cursor de los listados de citas"""
+    
+    def setUp(self):
+        super().setUp()
+        from rest_framework.test import APIClient
+        start = date.today() + timedelta(days=2)
+        # Varias citas comparten fecha y hora para probar el desempate por id
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=self.patient,
+                doctor=self.doctor if i % 2 else self.admin,
+                appointment_date=start + timedelta(days=i // 6),
+                appointment_time=time(9 + (i % 3), 0),
+                reason=f'Control {i}'
+            )
+            for i in range(24)
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+    
+    def _walk(self, url, **params):
+        ids = []
+        response = self.client.get(url, dict(params, page_size=5))
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+    
+    def test_list_walks_all_pages_in_order(self):
+        """Prueba que el listado recorre todas las citas sin repetir ni saltar"""
+        ids, last = self._walk(reverse('appointment-list'))
+        expected = list(
+            Appointment.objects.filter(patient=self.patient)
+            .order_by('-appointment_date', '-appointment_time', '-id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+        
+        previous = self.client.get(last.data['previous'])
+        self.assertEqual([item['id'] for item in previous.data['results']], expected[-10:-5])
+    
+    def test_my_appointments_is_chronological_and_paginated(self):
+        """Prueba que my-appointments pagina en orden cronológico"""
+        ids, _ = self._walk(reverse('appointment-my-appointments'))
+        expected = list(
+            Appointment.objects.filter(patient=self.patient)
+            .order_by('appointment_date', 'appointment_time', 'id')
+            .values_list('id', flat=True)
+        )
+        self.assertEqual(ids, expected)
+    
+    def test_invalid_cursor(self):
+        """Prueba que un cursor manipulado devuelve 404"""
+        response = self.client.get(reverse('appointment-list'), {'cursor': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class DoctorDirectoryTests(BaseAppointmentTestCase):
+    """Tests para el directorio precalculado de doctores"""
+    
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.patient)
+        self.url = reverse('doctors-by-specialty', args=[self.specialty.id])
+    
+    def test_schedules_populate_directory(self):
+        """Prueba que los horarios crean una fila por especialidad y doctor"""
+        entry = DoctorDirectoryEntry.objects.get(specialty=self.specialty, doctor=self.doctor)
+        self.assertEqual(entry.full_name, 'Doctor Test')
+        self.assertEqual(entry.schedule_count, 5)
+        
+        MedicalSchedule.objects.filter(doctor=self.doctor, weekday__gt=0).delete()
+        self.schedule.is_active = False
+        self.schedule.save()
+        self.assertFalse(DoctorDirectoryEntry.objects.filter(doctor=self.doctor).exists())
+    
+    def test_profile_changes_update_directory(self):
+        """Prueba que el perfil del doctor actualiza experiencia y costo"""
+        from decimal import Decimal
+        from authentication.models import DoctorProfile
+        profile = DoctorProfile.objects.create(
+            user=self.doctor,
+            license_number='LIC-001',
+            consultation_fee=Decimal('350.00'),
+            years_of_experience=12
+        )
+        entry = DoctorDirectoryEntry.objects.get(doctor=self.doctor)
+        self.assertEqual(entry.experience_years, 12)
+        self.assertEqual(entry.consultation_fee, Decimal('350.00'))
+        
+        self.doctor.last_name = 'Renombrado'
+        self.doctor.save()
+        profile.years_of_experience = 13
+        profile.save()
+        entry.refresh_from_db()
+        self.assertEqual(entry.full_name, 'Doctor Renombrado')
+        self.assertEqual(entry.experience_years, 13)
+    
+    def test_endpoint_serves_from_directory_and_cache(self):
+        """Prueba que el endpoint usa el directorio y cachea la respuesta"""
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['id'], self.doctor.id)
+        self.assertEqual(response.data[0]['schedule_count'], 5)
+        self.assertIsNone(response.data[0]['email'])
+        
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        
+        # Un cambio de horario invalida la respuesta cacheada
+        self.schedule.is_active = False
+        self.schedule.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.data[0]['schedule_count'], 4)
+    
+    def test_doctor_serializer_reads_directory_in_bulk(self):
+        """Prueba que DoctorSerializer lee el directorio sin consultar por doctor"""
+        for i in range(3):
+            doctor = User.objects.create_user(email=f'dir{i}@hospital.com', password='x',
+                                              first_name='Dir', last_name=str(i))
+            MedicalSchedule.objects.create(doctor=doctor, specialty=self.specialty, weekday=1,
+                                           start_time=time(9, 0), end_time=time(12, 0))
+        doctors = User.objects.filter(directory_entries__isnull=False).distinct()
+        # doctores, entradas con su especialidad y conteos
+        with self.assertNumQueries(3):
+            data = DoctorSerializer(doctors, many=True).data
+        self.assertEqual(len(data), 4)
+        self.assertEqual(data[0]['specialty'][0]['doctor_count'], 4)
+        self.assertEqual(data[0]['specialty'][0]['name'], 'Cardiología')
+        
+        data = DoctorSerializer(doctors.first()).data
+        self.assertEqual([specialty['name'] for specialty in data['specialty']], ['Cardiología'])
@@ -1,13 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .feeds import calendar_feed
+from .permissions import IsReceptionistOrAdmin
 
 router = DefaultRouter()
+# Registrar las series antes que r'' para que 'series/' no se tome como un pk
+router.register(r'series', views.AppointmentSeriesViewSet, basename='appointment-series')
 router.register(r'', views.AppointmentViewSet, basename='appointment')
 
 # Create custom function-based views for problematic endpoints
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 
 @api_view(['GET'])
@@ -20,6 +24,56 @@ def available_slots(request):
     viewset.kwargs = {}
     return viewset.available_slots(request)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def next_available_view(request):
+    viewset = views.AppointmentViewSet()
+    # Initialize viewset properly
+    viewset.request = request
+    viewset.format_kwarg = None
+    viewset.kwargs = {}
+    return viewset.next_available(request)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def availability_cache_stats_view(request):
+    viewset = views.AppointmentViewSet()
+    # Initialize viewset properly
+    viewset.request = request
+    viewset.format_kwarg = None
+    viewset.kwargs = {}
+    return viewset.availability_cache_stats(request)
+
+@api_view(['POST'])
+@permission_classes([IsReceptionistOrAdmin])
+def bulk_create_view(request):
+    viewset = views.AppointmentViewSet()
+    # Initialize viewset properly
+    viewset.request = request
+    viewset.format_kwarg = None
+    viewset.kwargs = {}
+    return viewset.bulk_create(request)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def calendar_view(request):
+    viewset = views.AppointmentViewSet()
+    # Initialize viewset properly
+    viewset.request = request
+    viewset.format_kwarg = None
+    viewset.kwargs = {}
+    return viewset.calendar(request)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def calendar_feed_token_view(request):
+    viewset = views.AppointmentViewSet()
+    # Initialize viewset properly
+    viewset.request = request
+    viewset.format_kwarg = None
+    viewset.kwargs = {}
+    return viewset.calendar_feed(request)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def specialties_view(request):
@@ -66,6 +120,12 @@ def doctors_by_specialty(request, specialty_id):
 urlpatterns = [
     # Custom endpoints that avoid router conflicts
     path('available-slots/', available_slots, name='available-slots'),
+    path('next-available/', next_available_view, name='next-available'),
+    path('availability-cache-stats/', availability_cache_stats_view, name='availability-cache-stats'),
+    path('bulk-create/', bulk_create_view, name='bulk-create'),
+    path('calendar/', calendar_view, name='calendar'),
+    path('calendar-feed/', calendar_feed_token_view, name='calendar-feed'),
+    path('feed/<str:token>.ics', calendar_feed, name='calendar-feed-ics'),
     path('specialties/', specialties_view, name='specialties'),
     path('upcoming/', upcoming_view, name='upcoming'),
     path('specialties/<int:specialty_id>/doctors/', doctors_by_specialty, name='doctors-by-specialty'),
@@ -3,22 +3,40 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from django.urls import reverse
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, IsAdminUser
 from django.db import models
-from .models import Appointment, TemporaryReservation, Specialty
+from .models import Appointment, AppointmentSeries, CalendarFeedToken, DoctorDirectoryEntry, TemporaryReservation, Specialty
+from authentication.managers import with_batch_decryption
 from authentication.models import User
-from .serializers import AppointmentSerializer, TemporaryReservationSerializer
+from .serializers import AppointmentSerializer, AppointmentSeriesSerializer, TemporaryReservationSerializer
+from .availability import AvailabilityEngine, get_available_slots
+from .cache import AvailabilityCache, DoctorDirectoryCache
+from .booking import ReservationExpiredError, SlotTakenError, confirm_reservation, reserve_slot
+from .bulk import bulk_create_appointments
+from .pagination import AppointmentCursorPagination, UpcomingAppointmentCursorPagination
+from .permissions import IsReceptionistOrAdmin
+from .recurrence import DEFAULT_HORIZON_WEEKS, active_series, materialize_series, pending_occurrences
 from datetime import datetime, timedelta
 from django.utils import timezone
 
+# Límites de la búsqueda de próximos horarios libres
+DEFAULT_SEARCH_WINDOW_DAYS = 14
+MAX_SEARCH_WINDOW_DAYS = 60
+MAX_NEXT_AVAILABLE_RESULTS = 100
+MAX_BULK_APPOINTMENTS = 50000
+DEFAULT_CALENDAR_WINDOW_DAYS = 28
+
 
 class AppointmentViewSet(viewsets.ModelViewSet):
     permission_classes_by_action = {'create_temporary_reservation': [IsAuthenticated],
                                     'list_temporary_reservations': [IsAuthenticatedOrReadOnly]}
     """ViewSet para citas médicas"""
-    queryset = Appointment.objects.all()
+    # Pacientes y doctores se desencriptan en una consulta por página
+    queryset = with_batch_decryption(Appointment.objects.select_related('patient', 'doctor', 'specialty'))
     serializer_class = AppointmentSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = AppointmentCursorPagination
     
     def get_queryset(self):
         """Filtrar citas según el rol del usuario"""
@@ -123,19 +141,26 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        data = serializer.validated_data
         try:
-            temporary_reservation = serializer.save(user=request.user)
-            print(f"✅ SUCCESS - Reserva temporal creada: {temporary_reservation.id}")
-            return Response(
-                TemporaryReservationSerializer(temporary_reservation).data,
-                status=status.HTTP_201_CREATED
+            temporary_reservation = reserve_slot(
+                user=request.user,
+                doctor=data['doctor'],
+                specialty=data['specialty'],
+                appointment_date=data['appointment_date'],
+                appointment_time=data['appointment_time']
             )
-        except Exception as e:
-            print(f"❌ ERROR - Excepción al crear reserva: {str(e)}")
+        except SlotTakenError:
             return Response(
-                {'detail': f'Error al crear reserva temporal: {str(e)}'},
-                status=status.HTTP_400_BAD_REQUEST
+                {'detail': 'El horario ya no está disponible', 'code': 'slot_taken'},
+                status=status.HTTP_409_CONFLICT
             )
+        
+        print(f"✅ SUCCESS - Reserva temporal creada: {temporary_reservation.id}")
+        return Response(
+            TemporaryReservationSerializer(temporary_reservation).data,
+            status=status.HTTP_201_CREATED
+        )
  
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticatedOrReadOnly])
     def list_temporary_reservations(self, request):
@@ -194,51 +219,33 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            reservation = TemporaryReservation.objects.get(
-                id=reservation_id,
-                user=request.user,
-                is_active=True
-            )
-            
-            # Verificar que la reserva no haya expirado
-            now = timezone.now()
-            if reservation.expires_at <= now:
-                return Response(
-                    {'error': 'La reserva temporal ha expirado'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Crear la cita definitiva
-            appointment = Appointment.objects.create(
-                patient=request.user,
-                doctor=reservation.doctor,
-                specialty=reservation.specialty,
-                appointment_date=reservation.appointment_date,
-                appointment_time=reservation.appointment_time,
-                status='scheduled',
-                notes=f'Confirmada desde reserva temporal #{reservation.id}'
-            )
-            
-            # Desactivar la reserva temporal
-            reservation.is_active = False
-            reservation.save()
-            
-            # Serializar la cita creada
-            serializer = AppointmentSerializer(appointment)
-            
-            return Response(
-                {
-                    'message': 'Reserva temporal confirmada exitosamente',
-                    'appointment': serializer.data
-                },
-                status=status.HTTP_201_CREATED
-            )
-            
+            appointment = confirm_reservation(request.user, reservation_id)
         except TemporaryReservation.DoesNotExist:
             return Response(
                 {'error': 'Reserva temporal no encontrada o no pertenece al usuario'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except ReservationExpiredError:
+            return Response(
+                {'error': 'La reserva temporal ha expirado'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except SlotTakenError:
+            return Response(
+                {'error': 'El horario ya no está disponible', 'code': 'slot_taken'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        # Serializar la cita creada
+        serializer = AppointmentSerializer(appointment)
+        
+        return Response(
+            {
+                'message': 'Reserva temporal confirmada exitosamente',
+                'appointment': serializer.data
+            },
+            status=status.HTTP_201_CREATED
+        )
 
     def get_permissions(self):
         try:
@@ -320,55 +327,218 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         from datetime import datetime
         try:
             selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-            weekday = selected_date.weekday()
-            
-            # Horarios base para todos los días
-            base_slots = [
-                '08:00', '08:30', '09:00', '09:30', '10:00', '10:30',
-                '11:00', '11:30', '14:00', '14:30', '15:00', '15:30',
-                '16:00', '16:30', '17:00', '17:30'
-            ]
-            
-            # Verificar citas ya programadas para este doctor en esta fecha
-            existing_appointments = Appointment.objects.filter(
-                doctor_id=doctor_id,
-                appointment_date=selected_date,
-                status__in=['scheduled', 'confirmed']
-            ).values_list('appointment_time', flat=True)
-            
-            # Verificar reservas temporales activas para este doctor en esta fecha
-            now = timezone.now()
-            temporary_reservations = TemporaryReservation.objects.filter(
-                doctor_id=doctor_id,
-                appointment_date=selected_date,
-                is_active=True,
-                expires_at__gt=now
-            ).values_list('appointment_time', flat=True)
-            
-            # Convertir a formato string para comparación
-            occupied_slots = [time.strftime('%H:%M') for time in existing_appointments]
-            occupied_slots.extend([time.strftime('%H:%M') for time in temporary_reservations])
-            
-            # Para fines de semana, simular menos disponibilidad
-            if weekday >= 5:  # Fin de semana (sábado y domingo)
-                # Simular que en fin de semana hay horarios de emergencia o menos disponibilidad
-                weekend_occupied = ['09:00', '14:00', '16:00']
-                occupied_slots.extend(weekend_occupied)
-            else:  # Días laborables (lunes a viernes)
-                # Simular algunas citas ya ocupadas en días laborables
-                weekday_occupied = ['10:00', '15:00']
-                occupied_slots.extend(weekday_occupied)
-            
-            # Filtrar slots disponibles
-            available_slots = [slot for slot in base_slots if slot not in occupied_slots]
-            
-            return Response(available_slots)
-            
         except ValueError:
             return Response(
-                {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'}, 
+                {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not str(doctor_id).isdigit():
+            return Response(
+                {'error': 'doctor_id inválido'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+        # Horarios calculados a partir del MedicalSchedule del doctor,
+        # descontando citas y reservas temporales vigentes
+        available_slots = get_available_slots(doctor_id, selected_date)
+        
+        return Response(available_slots)
+    
+    @action(detail=False, methods=['get'], url_path='availability-cache-stats',
+            permission_classes=[IsAdminUser])
+    def availability_cache_stats(self, request):
+        """Estadísticas de aciertos de la caché de disponibilidad"""
+        return Response(AvailabilityCache.get_stats())
+    
+    @action(detail=False, methods=['post'], url_path='bulk-create',
+            permission_classes=[IsReceptionistOrAdmin])
+    def bulk_create(self, request):
+        """Crear citas en bloque con resultados por fila"""
+        rows = request.data.get('appointments') if isinstance(request.data, dict) else request.data
+        if not isinstance(rows, list) or not rows:
+            return Response(
+                {'error': 'Se requiere una lista no vacía de citas'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(rows) > MAX_BULK_APPOINTMENTS:
+            return Response(
+                {'error': f'Máximo {MAX_BULK_APPOINTMENTS} citas por petición'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        results = bulk_create_appointments(rows)
+        created = sum(1 for result in results if result['status'] == 'created')
+        errors = len(results) - created
+
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+
+        return Response(
+            {'created': created, 'errors': errors, 'results': results},
+            status=response_status
+        )
+    
+    @action(detail=False, methods=['get'], url_path='next-available')
+    def next_available(self, request):
+        """Buscar los próximos horarios libres entre varios doctores y días"""
+        specialty_id = request.query_params.get('specialty_id')
+        doctor_ids_param = request.query_params.get('doctor_ids')
+        
+        if not specialty_id and not doctor_ids_param:
+            return Response(
+                {'error': 'Se requiere specialty_id o doctor_ids'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            doctor_ids = None
+            if doctor_ids_param:
+                doctor_ids = [int(value) for value in doctor_ids_param.split(',') if value.strip()]
+            if specialty_id:
+                specialty_id = int(specialty_id)
+            limit = min(int(request.query_params.get('limit', 10)), MAX_NEXT_AVAILABLE_RESULTS)
+        except ValueError:
+            return Response(
+                {'error': 'specialty_id, doctor_ids y limit deben ser numéricos'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            start_param = request.query_params.get('start_date')
+            start_date = (
+                datetime.strptime(start_param, '%Y-%m-%d').date()
+                if start_param else timezone.localdate()
+            )
+            end_param = request.query_params.get('end_date')
+            end_date = (
+                datetime.strptime(end_param, '%Y-%m-%d').date()
+                if end_param else start_date + timedelta(days=DEFAULT_SEARCH_WINDOW_DAYS - 1)
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if end_date < start_date or (end_date - start_date).days >= MAX_SEARCH_WINDOW_DAYS:
+            return Response(
+                {'error': f'El rango de fechas debe ser de 1 a {MAX_SEARCH_WINDOW_DAYS} días'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        engine = AvailabilityEngine(
+            doctor_ids=doctor_ids,
+            start_date=start_date,
+            end_date=end_date,
+            specialty_id=specialty_id
+        )
+        slots = engine.next_available(limit=max(limit, 0))
+        
+        doctor_names = {
+            doctor_id: f"{first_name} {last_name}"
+            for doctor_id, first_name, last_name in User.objects.filter(
+                id__in={doctor_id for _, _, doctor_id in slots}
+            ).values_list('id', 'first_name', 'last_name')
+        } if slots else {}
+        
+        return Response([
+            {
+                'doctor_id': doctor_id,
+                'doctor_name': doctor_names.get(doctor_id, ''),
+                'date': day.isoformat(),
+                'time': slot.strftime('%H:%M'),
+            }
+            for day, slot, doctor_id in slots
+        ])
+    
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """
+        Calendario de citas en un rango de fechas.
+        
+        Incluye las citas existentes y las ocurrencias de series recurrentes
+        aún no materializadas (``is_virtual``), calculadas al vuelo.
+        """
+        try:
+            start_param = request.query_params.get('start_date')
+            start_date = (
+                datetime.strptime(start_param, '%Y-%m-%d').date()
+                if start_param else timezone.localdate()
+            )
+            end_param = request.query_params.get('end_date')
+            end_date = (
+                datetime.strptime(end_param, '%Y-%m-%d').date()
+                if end_param else start_date + timedelta(days=DEFAULT_CALENDAR_WINDOW_DAYS - 1)
+            )
+        except ValueError:
+            return Response(
+                {'error': 'Formato de fecha inválido. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if end_date < start_date or (end_date - start_date).days >= MAX_SEARCH_WINDOW_DAYS:
+            return Response(
+                {'error': f'El rango de fechas debe ser de 1 a {MAX_SEARCH_WINDOW_DAYS} días'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        fields = ['id', 'series', 'patient', 'doctor', 'specialty', 'appointment_date',
+                  'appointment_time', 'duration', 'status']
+        entries = [
+            dict(row, is_virtual=False)
+            for row in self.get_queryset().filter(
+                appointment_date__range=(start_date, end_date)
+            ).values(*fields)
+        ]
+        
+        series_list = active_series(start_date, end_date)
+        user = request.user
+        if getattr(user, 'role', None) == 'patient':
+            series_list = series_list.filter(patient=user)
+        elif getattr(user, 'role', None) == 'doctor':
+            series_list = series_list.filter(doctor=user)
+        
+        for series, day in pending_occurrences(series_list, start_date, end_date):
+            entries.append({
+                'id': None,
+                'series': series.id,
+                'patient': series.patient_id,
+                'doctor': series.doctor_id,
+                'specialty': series.specialty_id,
+                'appointment_date': day,
+                'appointment_time': series.appointment_time,
+                'duration': series.duration,
+                'status': 'scheduled',
+                'is_virtual': True,
+            })
+        
+        entries.sort(key=lambda entry: (entry['appointment_date'], entry['appointment_time']))
+        for entry in entries:
+            entry['appointment_date'] = entry['appointment_date'].isoformat()
+            entry['appointment_time'] = entry['appointment_time'].strftime('%H:%M')
+        return Response(entries)
+    
+    @action(detail=False, methods=['get', 'post'], url_path='calendar-feed')
+    def calendar_feed(self, request):
+        """
+        URL de suscripción al calendario .ics del usuario.
+        
+        GET la crea si no existe; POST genera un token nuevo e invalida el
+        anterior.
+        """
+        feed_token, created = CalendarFeedToken.objects.get_or_create(user=request.user)
+        if request.method == 'POST' and not created:
+            feed_token.rotate()
+        
+        return Response({
+            'token': feed_token.token,
+            'url': request.build_absolute_uri(reverse('calendar-feed-ics', args=[feed_token.token]))
+        })
     
     @action(detail=False, methods=['get'], url_path='my-appointments')
     def my_appointments(self, request):
@@ -391,20 +561,15 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
-        # Ordenar por fecha y hora
-        appointments = appointments.order_by('appointment_date', 'appointment_time')
-        
-        # Serializar y devolver
-        serializer = self.get_serializer(appointments, many=True)
-        return Response(serializer.data)
+        # Paginar por cursor en orden cronológico (fecha, hora, id)
+        paginator = UpcomingAppointmentCursorPagination()
+        page = paginator.paginate_queryset(appointments, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def doctors_by_specialty(self, request, specialty_id=None):
-        """Obtener doctores por especialidad desde la base de datos"""
-        from authentication.models import User
-        from .models import MedicalSchedule, Specialty
-        from django.db.models import Count, Avg
-        
+        """Obtener doctores por especialidad desde el directorio precalculado"""
         # Si no se proporciona specialty_id, obtenerlo de query params
         if not specialty_id:
             specialty_id = request.query_params.get('specialty_id')
@@ -416,59 +581,48 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             )
         
         try:
-            # Verificar que la especialidad existe
-            specialty = Specialty.objects.get(id=specialty_id, is_active=True)
-            
-            # Obtener doctores que tienen horarios activos en esta especialidad
-            doctors = User.objects.filter(
-                medical_schedules__specialty_id=specialty_id,
-                medical_schedules__is_active=True,
-                is_active=True
-            ).distinct().annotate(
-                schedule_count=Count('medical_schedules', filter=models.Q(medical_schedules__is_active=True))
+            specialty_id = int(specialty_id)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'specialty_id debe ser numérico'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        doctors = DoctorDirectoryCache.get(specialty_id)
+        if doctors is None:
+            try:
+                # Verificar que la especialidad existe
+                specialty = Specialty.objects.get(id=specialty_id, is_active=True)
+            except Specialty.DoesNotExist:
+                return Response(
+                    {'error': 'Especialidad no encontrada'}, 
+                    status=status.HTTP_404_NOT_FOUND
+                )
             
-            doctors_list = []
-            for doctor in doctors:
-                # Intentar obtener el doctor profile si existe
-                doctor_profile = None
-                if hasattr(doctor, 'doctor_profile'):
-                    doctor_profile = doctor.doctor_profile
-                
-                # Calcular años de experiencia basado en date_joined como fallback
-                from datetime import datetime
-                experience_years = 5  # Valor por defecto
-                if doctor_profile and hasattr(doctor_profile, 'years_of_experience'):
-                    experience_years = doctor_profile.years_of_experience
-                elif doctor.date_joined:
-                    years_since_joined = (datetime.now().date() - doctor.date_joined.date()).days // 365
-                    experience_years = max(1, years_since_joined)  # Mínimo 1 año
-                
-                doctors_list.append({
-                    'id': doctor.id,
-                    'name': doctor.get_full_name(),
+            doctors = [
+                {
+                    'id': entry['doctor_id'],
+                    'name': entry['full_name'],
                     'specialization': specialty.name,
-                    'experience_years': experience_years,
+                    'experience_years': entry['experience_years'],
+                    'consultation_fee': entry['consultation_fee'],
                     'rating': 4.5,  # Valor por defecto hasta implementar sistema de ratings
-                    'schedule_count': doctor.schedule_count,
-                    'email': doctor.email if request.user.is_staff else None,  # Solo para admins
-                })
-            
-            # Si no hay doctores en la base de datos, usar datos de fallback
-            if not doctors_list:
-                return Response([])
-            
-            return Response(doctors_list)
-            
-        except Specialty.DoesNotExist:
-            return Response(
-                {'error': 'Especialidad no encontrada'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
-        except Exception as e:
-            # En caso de error, retornar lista vacía
-            print(f"❌ ERROR en doctors_by_specialty: {str(e)}")
-            return Response([])
+                    'schedule_count': entry['schedule_count'],
+                    'email': entry['email'],
+                }
+                for entry in DoctorDirectoryEntry.objects.filter(
+                    specialty_id=specialty_id
+                ).order_by('full_name').values(
+                    'doctor_id', 'full_name', 'email', 'experience_years',
+                    'consultation_fee', 'schedule_count'
+                )
+            ]
+            DoctorDirectoryCache.set(specialty_id, doctors)
+        
+        if not request.user.is_staff:
+            # El correo solo se muestra a administradores
+            doctors = [dict(doctor, email=None) for doctor in doctors]
+        return Response(doctors)
     
     def _get_fallback_doctors_by_specialty(self, specialty_id):
         """Datos de fallback para doctores cuando no hay datos en la BD"""
@@ -575,3 +729,64 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         
         serializer = self.get_serializer(appointment)
         return Response(serializer.data)
+
+
+class AppointmentSeriesViewSet(viewsets.ModelViewSet):
+    """ViewSet para series de citas recurrentes"""
+    queryset = AppointmentSeries.objects.select_related('patient', 'doctor')
+    serializer_class = AppointmentSeriesSerializer
+    
+    # Campos que cambian las fechas u horario de las ocurrencias
+    RULE_FIELDS = ('doctor', 'frequency', 'interval', 'start_date', 'end_date',
+                   'max_occurrences', 'appointment_time', 'duration')
+    
+    def get_permissions(self):
+        if self.request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return [IsAuthenticated()]
+        return [IsReceptionistOrAdmin()]
+    
+    def get_queryset(self):
+        """Filtrar series según el rol del usuario"""
+        user = self.request.user
+        if getattr(user, 'role', None) == 'patient':
+            return self.queryset.filter(patient=user)
+        elif getattr(user, 'role', None) == 'doctor':
+            return self.queryset.filter(doctor=user)
+        return self.queryset
+    
+    def _horizon(self):
+        return timezone.localdate() + timedelta(weeks=DEFAULT_HORIZON_WEEKS)
+    
+    def _cancel_future_appointments(self, series, reason):
+        """Cancelar las citas futuras aún agendadas de la serie"""
+        # QuerySet.update no toca auto_now; el ETag del calendario depende de updated_at
+        now = timezone.now()
+        series.appointments.filter(
+            appointment_date__gte=timezone.localdate(),
+            status='scheduled'
+        ).update(status='cancelled', cancelled_at=now, cancellation_reason=reason, updated_at=now)
+    
+    def perform_create(self, serializer):
+        series = serializer.save(created_by=self.request.user)
+        materialize_series(series, self._horizon())
+    
+    def perform_update(self, serializer):
+        previous = {field: getattr(serializer.instance, field) for field in self.RULE_FIELDS}
+        previous_doctor_id = serializer.instance.doctor_id
+        series = serializer.save()
+        if any(getattr(series, field) != value for field, value in previous.items()):
+            # La regla cambió: regenerar las ocurrencias futuras
+            self._cancel_future_appointments(series, 'Serie modificada')
+            series.materialized_until = None
+            series.save(update_fields=['materialized_until'])
+            materialize_series(series, self._horizon())
+        if previous_doctor_id != series.doctor_id:
+            # Las señales solo invalidan al doctor nuevo; el anterior recupera
+            # las citas canceladas y las ocurrencias pendientes
+            AvailabilityCache.invalidate_doctor(previous_doctor_id)
+    
+    def perform_destroy(self, instance):
+        """Finalizar la serie conservando el historial de citas"""
+        self._cancel_future_appointments(instance, 'Serie finalizada')
+        instance.is_active = False
+        instance.save(update_fields=['is_active', 'updated_at'])
@@ -0,0 +1,93 @@
+"""
+Autenticación JWT con el usuario resuelto desde caché.
+
+``JWTAuthentication`` consulta el usuario en cada petición. Aquí se
+reconstruye desde ``PrincipalCache`` como una instancia real de ``User`` con
+los campos no cacheados diferidos (se cargan solo si una vista los usa), y
+los perfiles inexistentes quedan marcados para que ``user.doctor_profile``
+falle sin consultar la base de datos.
+"""
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import PrincipalCache
+
+User = get_user_model()
+
+
+def _profile_annotation(profile):
+    return f'cached_{profile}_id'
+
+
+def build_principal_entry(user):
+    """Entrada de caché a partir de un usuario cargado con las anotaciones de perfil"""
+    entry = {
+        'fields': {name: getattr(user, name) for name in PrincipalCache.FIELDS},
+        'profiles': {
+            profile: getattr(user, _profile_annotation(profile), None)
+            for profile in PrincipalCache.PROFILES
+        },
+    }
+    if api_settings.CHECK_REVOKE_TOKEN:
+        entry['revoke'] = get_md5_hash_password(user.password)
+    return entry
+
+
+def user_from_entry(entry):
+    """Instancia de ``User`` con los campos cacheados y el resto diferido"""
+    fields = entry['fields']
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in fields]
+    user = User.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+    user._load_deferred_together = True
+    return user
+
+
+def mark_missing_profiles(user, profiles):
+    """Cachear la ausencia de perfil para que el acceso no consulte la base de datos"""
+    user.profile_ids = profiles
+    for profile, profile_id in profiles.items():
+        if profile_id is None:
+            User._meta.get_field(profile).set_cached_value(user, None)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication que resuelve el usuario desde ``PrincipalCache``"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        entry = PrincipalCache.get(user_id)
+        if entry is not None:
+            user = user_from_entry(entry)
+        else:
+            version = PrincipalCache.get_version(user_id)
+            try:
+                user = User.objects.annotate(**{
+                    _profile_annotation(profile): F(f'{profile}__id')
+                    for profile in PrincipalCache.PROFILES
+                }).get(**{api_settings.USER_ID_FIELD: user_id})
+            except User.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            entry = build_principal_entry(user)
+            PrincipalCache.set(user_id, entry, version)
+        mark_missing_profiles(user, entry['profiles'])
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry.get('revoke'):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PrincipalCache:
+    """
+    Caché del usuario autenticado por JWT.
+
+    Guarda solo datos de identidad y permisos (nunca contraseña, secretos 2FA
+    ni campos encriptados) y los ids de los perfiles. Las claves incluyen una
+    versión por usuario que sube al cambiar el usuario, sus perfiles o sus
+    tokens, de modo que una lectura en curso nunca reescribe datos antiguos
+    en la versión vigente.
+    """
+
+    CACHE_PREFIX = 'principal'
+    DEFAULT_TIMEOUT = 300  # 5 minutos; acota los cambios hechos con QuerySet.update
+
+    # Campos del usuario que se guardan; el resto se carga bajo demanda
+    FIELDS = (
+        'id', 'user_id', 'username', 'email', 'first_name', 'last_name', 'role',
+        'is_active', 'is_staff', 'is_superuser', 'date_joined', 'two_factor_enabled',
+    )
+    # Perfiles uno a uno cuyo id se guarda junto al usuario
+    PROFILES = ('doctor_profile', 'patient_profile')
+
+    @classmethod
+    def _version_key(cls, user_id):
+        return f"{cls.CACHE_PREFIX}:version:{user_id}"
+
+    @classmethod
+    def get_version(cls, user_id):
+        return cache.get(cls._version_key(user_id)) or 1
+
+    @classmethod
+    def _generate_cache_key(cls, user_id, version):
+        return f"{cls.CACHE_PREFIX}:{user_id}:v{version}"
+
+    @classmethod
+    def get(cls, user_id):
+        """Obtener la entrada cacheada del usuario o None"""
+        try:
+            return cache.get(cls._generate_cache_key(user_id, cls.get_version(user_id)))
+        except Exception as e:
+            logger.error(f"Error retrieving principal from cache: {str(e)}")
+            return None
+
+    @classmethod
+    def set(cls, user_id, entry, version):
+        """Guardar la entrada con la versión leída antes de consultar la base de datos"""
+        try:
+            cache.set(cls._generate_cache_key(user_id, version), entry, cls.DEFAULT_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.error(f"Error setting principal cache: {str(e)}")
+            return False
+
+    @classmethod
+    def invalidate(cls, user_id):
+        """Invalidar la entrada del usuario subiendo su versión"""
+        key = cls._version_key(user_id)
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 2, None)
+        except Exception as e:
+            logger.error(f"Error invalidating principal cache: {str(e)}")
+
+
+class TOTPReplayCache:
+    """
+    Códigos TOTP ya usados, por usuario y ventana de tiempo.
+
+    ``cache.add`` es atómico en Redis, así que de dos verificaciones
+    simultáneas del mismo código solo una lo consume.
+    """
+
+    CACHE_PREFIX = 'totp_used'
+    # Un código se acepta en su ventana y en la siguiente (valid_window=1)
+    DEFAULT_TIMEOUT = 90
+
+    @classmethod
+    def _generate_cache_key(cls, user_id, timecode):
+        return f"{cls.CACHE_PREFIX}:{user_id}:{timecode}"
+
+    @classmethod
+    def mark_used(cls, user_id, timecode):
+        """Marcar el código como usado; False si ya lo estaba"""
+        try:
+            return cache.add(cls._generate_cache_key(user_id, timecode), 1, cls.DEFAULT_TIMEOUT)
+        except Exception as e:
+            # Sin caché no se puede detectar la repetición; no bloquear el login
+            logger.error(f"Error marking TOTP code as used: {str(e)}")
+            return True
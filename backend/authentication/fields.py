@@ -3,8 +3,20 @@ from django.db.models import Value
 from django.db.models.functions import Cast
 from django.contrib.postgres.functions import Func
 from django.conf import settings
+from contextlib import contextmanager
+from contextvars import ContextVar
+import hashlib
+import hmac
+import logging
 import os
 
+from .services.envelope import EnvelopeEncryption, EnvelopeEncryptionError
+
+logger = logging.getLogger(__name__)
+
+# Valor mostrado cuando un dato cifrado no se puede desencriptar
+UNREADABLE_VALUE = "[Dato encriptado]"
+
 
 class PGPSymEncrypt(Func):
     """Función para encriptar con pgcrypto"""
@@ -27,6 +39,84 @@ class PGPSymDecrypt(Func):
         super().__init__(expression, key=key, **extra)
 
 
+def _crypto_key():
+    return getattr(settings, 'PGCRYPTO_KEY', os.environ.get('PGCRYPTO_KEY', 'default-encryption-key'))
+
+
+def _decrypt_value(value, connection):
+    """Desencriptar un único valor; si falla se devuelve como texto"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pgp_sym_decrypt(%s::bytea, %s::text)", [value, _crypto_key()])
+            result = cursor.fetchone()
+            return result[0] if result else str(value)
+    except Exception:
+        return str(value)
+
+
+def decrypt_values(values, connection):
+    """
+    Desencriptar una lista de valores con una sola consulta, conservando el orden.
+    
+    Si algún valor no se puede desencriptar falla la consulta completa y se
+    recurre a desencriptarlos uno a uno.
+    """
+    if not values:
+        return []
+    if len(values) == 1:
+        return [_decrypt_value(values[0], connection)]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pgp_sym_decrypt(value, %s::text) "
+                "FROM unnest(%s::bytea[]) WITH ORDINALITY AS t(value, position) "
+                "ORDER BY position",
+                [_crypto_key(), [bytes(value) for value in values]]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except Exception:
+        return [_decrypt_value(value, connection) for value in values]
+
+
+class PendingCiphertext:
+    """Valor leído dentro de ``deferred_decryption`` a la espera de desencriptarse en bloque"""
+    __slots__ = ('ciphertext', 'connection', 'plaintext')
+    
+    def __init__(self, ciphertext, connection):
+        self.ciphertext = ciphertext
+        self.connection = connection
+        self.plaintext = None
+
+
+# Valores pendientes del bloque de lectura en curso (None fuera de deferred_decryption)
+_pending_decryption = ContextVar('pending_decryption', default=None)
+
+
+@contextmanager
+def deferred_decryption():
+    """
+    Acumular los valores encriptados leídos dentro del bloque.
+    
+    ``from_db_value`` devuelve un ``PendingCiphertext`` en lugar de consultar
+    por cada valor; al salir se desencriptan todos con ``decrypt_values`` y
+    quien leyó los datos sustituye los marcadores por ``marker.plaintext``.
+    """
+    pending = []
+    token = _pending_decryption.set(pending)
+    try:
+        yield pending
+    finally:
+        _pending_decryption.reset(token)
+    
+    by_connection = {}
+    for marker in pending:
+        by_connection.setdefault(marker.connection.alias, []).append(marker)
+    for markers in by_connection.values():
+        plaintexts = decrypt_values([marker.ciphertext for marker in markers], markers[0].connection)
+        for marker, plaintext in zip(markers, plaintexts):
+            marker.plaintext = plaintext
+
+
 class EncryptedCharField(models.TextField):
     """Campo de texto que soporte encriptación cuando esté habilitada"""
     
@@ -42,18 +132,22 @@ class EncryptedCharField(models.TextField):
         if value is None:
             return value
         
-        # Si es un memoryview o bytes encriptado, intentar desencriptar
-        if isinstance(value, (bytes, memoryview)):
+        # Cifrado en aplicación: se desencripta en el proceso, sin consultas
+        if EnvelopeEncryption.is_encrypted(value):
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(
-                        "SELECT pgp_sym_decrypt(%s::bytea, %s::text)",
-                        [value, getattr(settings, 'PGCRYPTO_KEY', os.environ.get('PGCRYPTO_KEY', 'default-encryption-key'))]
-                    )
-                    result = cursor.fetchone()
-                    return result[0] if result else str(value)
-            except Exception:
-                return str(value)
+                return EnvelopeEncryption.decrypt(value)
+            except EnvelopeEncryptionError as e:
+                logger.error(f"Could not decrypt {self.model.__name__}.{self.name}: {e}")
+                return UNREADABLE_VALUE
+        
+        # Si es un memoryview o bytes encriptado, desencriptar (en bloque si es posible)
+        if isinstance(value, (bytes, memoryview)):
+            pending = _pending_decryption.get()
+            if pending is not None:
+                marker = PendingCiphertext(value, connection)
+                pending.append(marker)
+                return marker
+            return decrypt_values([value], connection)[0]
         
         # Si es string que contiene referencia a memory, es un memoryview convertido
         if isinstance(value, str) and '<memory at' in value:
@@ -69,6 +163,15 @@ class EncryptedCharField(models.TextField):
             return value
         return str(value)
     
+    def get_db_prep_save(self, value, connection):
+        """Cifra el valor al escribirlo si el backend en aplicación está activo"""
+        value = super().get_db_prep_save(value, connection)
+        # Las expresiones (p. ej. el CASE de bulk_update) se cifran valor a valor
+        if isinstance(value, str) and value and EnvelopeEncryption.enabled() \
+                and not EnvelopeEncryption.is_encrypted(value):
+            return EnvelopeEncryption.encrypt(value)
+        return value
+    
     def pre_save(self, model_instance, add):
         """Procesa el valor antes de guardarlo"""
         value = getattr(model_instance, self.attname)
@@ -97,3 +200,53 @@ class EncryptedEmailField(EncryptedCharField):
         defaults = {'form_class': forms.EmailField}
         defaults.update(kwargs)
         return super().formfield(**defaults)
+
+
+def _blind_index_key():
+    """Clave HMAC de los índices ciegos; por defecto se deriva de PGCRYPTO_KEY"""
+    key = getattr(settings, 'BLIND_INDEX_KEY', '')
+    if not key:
+        master = getattr(settings, 'PGCRYPTO_KEY', os.environ.get('PGCRYPTO_KEY', 'default-encryption-key'))
+        return hmac.new(master.encode('utf-8'), b'blind-index', hashlib.sha256).digest()
+    return key.encode('utf-8')
+
+
+def blind_index(value):
+    """
+    Índice ciego determinista (HMAC-SHA256) de un valor encriptado.
+
+    Permite búsquedas exactas con un índice normal sin desencriptar filas.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    return hmac.new(_blind_index_key(), value.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+class BlindIndexField(models.CharField):
+    """
+    Columna con el índice ciego de otro campo del modelo.
+
+    Se recalcula en ``pre_save`` (también en ``bulk_create``) a partir de
+    ``source``, por lo que nunca se asigna a mano.
+    """
+    
+    def __init__(self, *args, source=None, **kwargs):
+        self.source = source
+        kwargs.setdefault('max_length', 64)
+        kwargs.setdefault('editable', False)
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('blank', True)
+        super().__init__(*args, **kwargs)
+    
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['source'] = self.source
+        return name, path, args, kwargs
+    
+    def pre_save(self, model_instance, add):
+        value = blind_index(getattr(model_instance, self.source))
+        setattr(model_instance, self.attname, value)
+        return value
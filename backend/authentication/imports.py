@@ -0,0 +1,217 @@
+"""
+Importación masiva de pacientes desde CSV o NDJSON.
+
+El fichero se lee en streaming y se procesa por bloques: cada bloque se
+valida sin consultar la base de datos fila a fila (email, DNI y username se
+comprueban con una consulta por conjunto), los hashes de contraseña se
+calculan en el pool de ``PasswordHashingService`` y usuarios, perfiles,
+preferencias de notificación y entradas de búsqueda se insertan con
+``bulk_create`` dentro de una transacción por bloque.
+"""
+import codecs
+import csv
+import json
+import logging
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+
+from notifications.models import NotificationPreference
+
+from .fields import blind_index
+from .models import PatientProfile
+from .search import index_new_patients
+from .serializers import PatientImportRowSerializer
+from .services import PasswordHashingService
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_CHUNK_SIZE = 1000
+BULK_CREATE_BATCH_SIZE = 1000
+LOOKUP_CHUNK_SIZE = 1000
+# Errores detallados incluidos en el resumen; el resto solo se cuenta
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(filename):
+    """Formato según la extensión del fichero (CSV por defecto)"""
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+def _read_csv(reader):
+    for row in csv.DictReader(reader):
+        # Las celdas vacías equivalen a campos omitidos
+        yield {
+            key.strip(): value.strip()
+            for key, value in row.items()
+            if key and isinstance(value, str) and value.strip()
+        }, None
+
+
+def _read_ndjson(reader):
+    for line in reader:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield None, {'non_field_errors': ['JSON inválido']}
+            continue
+        if not isinstance(row, dict):
+            yield None, {'non_field_errors': ['Cada línea debe ser un objeto JSON']}
+            continue
+        yield row, None
+
+
+def iter_rows(stream, fmt='csv'):
+    """
+    Filas ``(datos, error)`` de un fichero binario, sin cargarlo en memoria.
+
+    ``error`` es un diccionario de errores si la línea no se pudo leer.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Formato no soportado: {fmt}')
+    reader = codecs.getreader('utf-8-sig')(stream)
+    if fmt == 'ndjson':
+        return _read_ndjson(reader)
+    return _read_csv(reader)
+
+
+def _existing(field, values):
+    """Valores de ``values`` ya presentes en ``field``, consultando en bloques"""
+    values = sorted(values)
+    found = set()
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[start:start + LOOKUP_CHUNK_SIZE]
+        found.update(User.objects.filter(**{f'{field}__in': chunk}).values_list(field, flat=True))
+    return found
+
+
+def _error(number, errors):
+    return {'row': number, 'status': 'error', 'errors': errors}
+
+
+def import_chunk(rows):
+    """
+    Importar un bloque de filas ``(número, datos, error)``.
+
+    Devuelve ``(creados, errores)``, donde ``errores`` es la lista de
+    resultados fallidos con su número de fila.
+    """
+    errors = []
+    valid = []
+    for number, row, parse_error in rows:
+        if parse_error:
+            errors.append(_error(number, parse_error))
+            continue
+        serializer = PatientImportRowSerializer(data=row)
+        if serializer.is_valid():
+            data = dict(serializer.validated_data)
+            data['email'] = User.objects.normalize_email(data['email'])
+            valid.append((number, data))
+        else:
+            errors.append(_error(number, serializer.errors))
+
+    # Unicidad: una consulta por campo para todo el bloque
+    taken_emails = _existing('email', {data['email'] for _, data in valid})
+    taken_dnis = _existing('dni_hash', {blind_index(data['dni']) for _, data in valid if data.get('dni')})
+    taken_usernames = _existing('username', {data['email'].split('@')[0] for _, data in valid})
+
+    checked = []
+    for number, data in valid:
+        row_errors = {}
+        dni_hash = blind_index(data['dni']) if data.get('dni') else None
+        if data['email'] in taken_emails:
+            row_errors['email'] = ['Ya existe un usuario con este email.']
+        if dni_hash and dni_hash in taken_dnis:
+            row_errors['dni'] = ['Ya existe un usuario con este DNI.']
+        if row_errors:
+            errors.append(_error(number, row_errors))
+            continue
+        # Las filas siguientes del bloque chocarán con esta
+        taken_emails.add(data['email'])
+        if dni_hash:
+            taken_dnis.add(dni_hash)
+
+        # Mismo username que create_user; el email completo si ya está ocupado
+        username = data['email'].split('@')[0]
+        if username in taken_usernames:
+            username = data['email']
+        taken_usernames.add(username)
+        checked.append((number, data, username))
+
+    if not checked:
+        return 0, errors
+
+    passwords = PasswordHashingService.make_passwords([data.pop('password', None) for _, data, _ in checked])
+
+    users = []
+    profiles = []
+    for (number, data, username), password in zip(checked, passwords):
+        profile_data = {
+            name: data.pop(name)
+            for name in PatientImportRowSerializer.PROFILE_FIELDS
+            if name in data
+        }
+        user = User(username=username, role='patient', password=password, **data)
+        users.append(user)
+        profiles.append(profile_data)
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=BULK_CREATE_BATCH_SIZE)
+            PatientProfile.objects.bulk_create(
+                [PatientProfile(user_id=user.pk, **profile_data) for user, profile_data in zip(users, profiles)],
+                batch_size=BULK_CREATE_BATCH_SIZE
+            )
+            # bulk_create no emite post_save: preferencias e índice de búsqueda a mano
+            NotificationPreference.objects.bulk_create(
+                [NotificationPreference(user_id=user.pk) for user in users],
+                batch_size=BULK_CREATE_BATCH_SIZE
+            )
+            index_new_patients(users)
+    except IntegrityError:
+        # Otra petición creó alguno de los usuarios mientras se validaba
+        logger.warning(f"Patient import chunk of {len(users)} rows failed with IntegrityError")
+        errors.extend(
+            _error(number, {'non_field_errors': ['Conflicto con un usuario creado simultáneamente; reintente el bloque.']})
+            for number, _, _ in checked
+        )
+        return 0, errors
+
+    return len(users), errors
+
+
+def import_patients(stream, fmt='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Importar pacientes desde un fichero binario CSV o NDJSON.
+
+    Devuelve ``{'processed', 'created', 'errors', 'error_rows'}``; las filas
+    se numeran desde 1 sin contar la cabecera del CSV.
+    """
+    summary = {'processed': 0, 'created': 0, 'errors': 0, 'error_rows': []}
+    rows = (
+        (number, row, error)
+        for number, (row, error) in enumerate(iter_rows(stream, fmt), start=1)
+    )
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        created, errors = import_chunk(chunk)
+        summary['processed'] += len(chunk)
+        summary['created'] += created
+        summary['errors'] += len(errors)
+        room = MAX_REPORTED_ERRORS - len(summary['error_rows'])
+        summary['error_rows'].extend(sorted(errors, key=lambda result: result['row'])[:room])
+    logger.info(
+        f"Imported {summary['created']} patients ({summary['errors']} errors, {summary['processed']} rows)"
+    )
+    return summary
@@ -0,0 +1,214 @@
+"""
+Protección del login contra fuerza bruta y credential stuffing.
+
+Los fallos se cuentan por email y por IP con una ventana deslizante
+aproximada: dos contadores de ventana fija (la actual y la anterior) y la
+anterior ponderada por la parte de ella que aún cae dentro de la ventana.
+Cada comprobación es un ``get_many`` y cada fallo un ``incr`` en la caché
+(Redis), así que un intento bloqueado no toca la base de datos ni calcula
+el hash de la contraseña.
+
+Los intentos se registran en ``LoginAttempt`` a través de un buffer por
+proceso que se vuelca en bloque con una tarea de Celery, por tamaño o por
+un temporizador en segundo plano.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'email': {'limit': 5, 'window': 900},
+    'ip': {'limit': 20, 'window': 900},
+}
+
+
+def client_ip(request):
+    """
+    IP del cliente para los contadores por IP.
+
+    Detrás de ``LOGIN_TRUSTED_PROXY_HOPS`` proxies se toma de
+    ``X-Forwarded-For`` la dirección que añadió el proxy más externo; las
+    anteriores las escribe el cliente y se ignoran. Sin proxies configurados
+    se usa ``REMOTE_ADDR``.
+    """
+    hops = getattr(settings, 'LOGIN_TRUSTED_PROXY_HOPS', 0)
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if hops > 0 and x_forwarded_for:
+        addresses = [address.strip() for address in x_forwarded_for.split(',') if address.strip()]
+        if addresses:
+            return addresses[-min(hops, len(addresses))]
+    return request.META.get('REMOTE_ADDR') or '0.0.0.0'
+
+
+class LoginThrottle:
+    """Contadores de fallos de login por email e IP"""
+
+    CACHE_PREFIX = 'login_throttle'
+
+    @classmethod
+    def _limits(cls):
+        return getattr(settings, 'LOGIN_THROTTLE_LIMITS', DEFAULT_LIMITS)
+
+    @classmethod
+    def _identities(cls, email, ip):
+        identities = {'ip': ip}
+        if email:
+            identities['email'] = email.strip().lower()
+        return identities
+
+    @classmethod
+    def _generate_cache_key(cls, scope, identity, bucket):
+        return f"{cls.CACHE_PREFIX}:{scope}:{identity}:{bucket}"
+
+    @classmethod
+    def _buckets(cls, window, now):
+        current = int(now // window)
+        return current, current - 1, (now % window) / window
+
+    @classmethod
+    def retry_after(cls, email, ip, now=None):
+        """Segundos hasta poder reintentar, o 0 si el login está permitido"""
+        now = now if now is not None else time.time()
+        limits = cls._limits()
+        keys = {}
+        for scope, identity in cls._identities(email, ip).items():
+            window = limits[scope]['window']
+            current, previous, elapsed = cls._buckets(window, now)
+            keys[scope] = (
+                cls._generate_cache_key(scope, identity, current),
+                cls._generate_cache_key(scope, identity, previous),
+                elapsed,
+            )
+        try:
+            counts = cache.get_many([key for current, previous, _ in keys.values() for key in (current, previous)])
+        except Exception as e:
+            logger.error(f"Error reading login throttle: {str(e)}")
+            return 0
+
+        wait = 0
+        for scope, (current_key, previous_key, elapsed) in keys.items():
+            limit, window = limits[scope]['limit'], limits[scope]['window']
+            current = counts.get(current_key, 0)
+            previous = counts.get(previous_key, 0)
+            if previous * (1 - elapsed) + current >= limit:
+                # Hasta el cambio de ventana; entonces se vuelve a evaluar
+                wait = max(wait, int(window * (1 - elapsed)) + 1)
+        return wait
+
+    @classmethod
+    def record_failure(cls, email, ip, now=None):
+        now = now if now is not None else time.time()
+        limits = cls._limits()
+        for scope, identity in cls._identities(email, ip).items():
+            window = limits[scope]['window']
+            current, _, _ = cls._buckets(window, now)
+            key = cls._generate_cache_key(scope, identity, current)
+            try:
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    # Dos ventanas: la clave se sigue leyendo como "anterior"
+                    cache.set(key, 1, window * 2)
+            except Exception as e:
+                logger.error(f"Error recording login failure: {str(e)}")
+
+    @classmethod
+    def reset(cls, email, now=None):
+        """Un login correcto limpia los fallos del email (no los de la IP)"""
+        if not email:
+            return
+        now = now if now is not None else time.time()
+        window = cls._limits()['email']['window']
+        current, previous, _ = cls._buckets(window, now)
+        identity = email.strip().lower()
+        try:
+            cache.delete_many([
+                cls._generate_cache_key('email', identity, current),
+                cls._generate_cache_key('email', identity, previous),
+            ])
+        except Exception as e:
+            logger.error(f"Error resetting login throttle: {str(e)}")
+
+
+class LoginAttemptWriter:
+    """
+    Buffer por proceso de intentos de login.
+
+    Se vuelca cuando alcanza ``LOGIN_ATTEMPT_BATCH_SIZE`` filas, cuando vence
+    el temporizador de ``LOGIN_ATTEMPT_FLUSH_INTERVAL`` segundos que arranca
+    con la primera fila del buffer (aunque no lleguen más logins), y al
+    terminar el proceso.
+    """
+
+    _buffer = []
+    _timer = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def record(cls, email, ip, user_agent, success):
+        row = {
+            'email': (email or '')[:254],
+            'ip_address': ip,
+            'user_agent': user_agent or '',
+            'success': success,
+            'attempted_at': timezone.now().isoformat(),
+        }
+        batch_size = getattr(settings, 'LOGIN_ATTEMPT_BATCH_SIZE', 50)
+        interval = getattr(settings, 'LOGIN_ATTEMPT_FLUSH_INTERVAL', 5)
+        with cls._lock:
+            cls._buffer.append(row)
+            due = len(cls._buffer) >= batch_size
+            if not due and cls._timer is None:
+                cls._timer = threading.Timer(interval, _flush_on_timer)
+                cls._timer.daemon = True
+                cls._timer.start()
+        if due:
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        """Enviar las filas pendientes a la tarea de escritura en bloque"""
+        with cls._lock:
+            rows, cls._buffer = cls._buffer, []
+            timer, cls._timer = cls._timer, None
+        if timer is not None:
+            timer.cancel()
+        if not rows:
+            return 0
+
+        from .tasks import record_login_attempts
+        try:
+            record_login_attempts.delay(rows)
+        except Exception as e:
+            # Sin broker: escribir en esta petición para no perder el registro
+            logger.warning(f"Could not queue login attempts, writing inline: {str(e)}")
+            record_login_attempts(rows)
+        return len(rows)
+
+
+def _flush_on_timer():
+    try:
+        LoginAttemptWriter.flush()
+    except Exception as e:
+        logger.error(f"Could not flush login attempts: {str(e)}")
+    finally:
+        # El hilo del temporizador no pasa por el ciclo de peticiones
+        connections.close_all()
+
+
+def _flush_at_exit():
+    try:
+        LoginAttemptWriter.flush()
+    except Exception as e:
+        logger.error(f"Could not flush login attempts at exit: {str(e)}")
+
+
+atexit.register(_flush_at_exit)
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from authentication.models import User
+
+
+class Command(BaseCommand):
+    help = 'Calcula los índices ciegos de DNI y número de identificación de los usuarios existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Usuarios por lote'
+        )
+        parser.add_argument(
+            '--start-id',
+            type=int,
+            default=0,
+            help='Reanudar a partir de este ID de usuario'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recalcular todos los índices (p. ej. tras cambiar BLIND_INDEX_KEY)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = options['start_id']
+        index_fields = list(User.BLIND_INDEXES.values())
+
+        queryset = User.objects.all()
+        if not options['all']:
+            # Solo filas con un valor encriptado sin índice
+            pending = Q()
+            for source, index in User.BLIND_INDEXES.items():
+                pending |= Q(**{f'{source}__isnull': False, f'{index}__isnull': True})
+            queryset = queryset.filter(pending)
+
+        updated = 0
+        while True:
+            users = list(
+                queryset.filter(pk__gt=last_id).order_by('pk').only('pk', *User.BLIND_INDEXES)[:batch_size]
+            )
+            if not users:
+                break
+            for user in users:
+                for field in index_fields:
+                    user._meta.get_field(field).pre_save(user, add=False)
+            User.objects.bulk_update(users, index_fields)
+            updated += len(users)
+            last_id = users[-1].pk
+            self.stdout.write(f'  {updated} usuarios procesados (último ID {last_id})')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Índices ciegos actualizados para {updated} usuarios')
+        )
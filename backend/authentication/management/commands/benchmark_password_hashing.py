@@ -0,0 +1,72 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from authentication.services import PasswordHashingService
+
+
+class Command(BaseCommand):
+    help = 'Compara logins por segundo verificando contraseñas con y sin el pool de procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--logins',
+            type=int,
+            default=200,
+            help='Verificaciones por escenario'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=16,
+            help='Peticiones simultáneas (hilos)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 2,
+            help='Procesos del pool'
+        )
+
+    def _run(self, encoded, logins, concurrency):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as threads:
+            results = list(threads.map(
+                lambda _: PasswordHashingService.verify_password('benchmark-password', encoded),
+                range(logins)
+            ))
+        elapsed = time.perf_counter() - start
+        assert all(valid for valid, _ in results)
+        return logins / elapsed
+
+    def handle(self, *args, **options):
+        hasher = hashers.get_hasher('default')
+        encoded = hasher.encode('benchmark-password', hasher.salt())
+        self.stdout.write(
+            f'Hasher {hasher.algorithm}, {options["logins"]} logins, '
+            f'{options["concurrency"]} peticiones simultáneas'
+        )
+
+        with override_settings(PASSWORD_HASHING_WORKERS=0):
+            inline = self._run(encoded, options['logins'], options['concurrency'])
+        self.stdout.write(f'  Sin pool:            {inline:8.1f} logins/s')
+
+        with override_settings(
+            PASSWORD_HASHING_WORKERS=options['workers'],
+            PASSWORD_HASHING_MAX_PENDING=options['workers'] * 4
+        ):
+            try:
+                # Arrancar los procesos fuera de la medición
+                PasswordHashingService.make_password('warm-up')
+                pooled = self._run(encoded, options['logins'], options['concurrency'])
+                stats = PasswordHashingService.stats()
+            finally:
+                PasswordHashingService.shutdown()
+        self.stdout.write(f'  Pool ({options["workers"]} procesos): {pooled:8.1f} logins/s')
+        self.stdout.write(f'  Trabajos completados en el pool: {stats["completed"]}')
+
+        self.stdout.write(self.style.SUCCESS(f'✅ Relación pool/sin pool: {pooled / inline:.2f}x'))
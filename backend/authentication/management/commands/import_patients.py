@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.imports import DEFAULT_CHUNK_SIZE, FORMATS, detect_format, import_patients
+
+
+class Command(BaseCommand):
+    help = 'Importa pacientes en bloque desde un fichero CSV o NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Fichero CSV o NDJSON con una fila por paciente')
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Formato del fichero (por defecto según la extensión)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help='Filas validadas e insertadas por bloque'
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as stream:
+                summary = import_patients(stream, fmt, chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el fichero: {e}')
+
+        for result in summary['error_rows']:
+            self.stdout.write(self.style.WARNING(f"Fila {result['row']}: {result['errors']}"))
+        if summary['errors'] > len(summary['error_rows']):
+            self.stdout.write(
+                self.style.WARNING(f"... y {summary['errors'] - len(summary['error_rows'])} errores más")
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {summary['created']} pacientes importados de {summary['processed']} filas "
+                f"({summary['errors']} con errores)"
+            )
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from authentication.search import rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de pacientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Pacientes leídos por lote'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_search_index(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Índice de búsqueda reconstruido para {total} pacientes')
+        )
@@ -0,0 +1,89 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from authentication.fields import UNREADABLE_VALUE, EncryptedCharField
+from authentication.services import EnvelopeEncryption
+
+
+class Command(BaseCommand):
+    help = 'Re-cifra los campos encriptados con la clave de datos principal (rotación sin parada)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rotate',
+            action='store_true',
+            help='Crear una clave principal nueva antes de re-cifrar'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Filas por lote'
+        )
+
+    def handle(self, *args, **options):
+        if not EnvelopeEncryption.enabled():
+            raise CommandError("ENCRYPTION_BACKEND debe ser 'envelope' para re-cifrar")
+
+        if options['rotate']:
+            key_id = EnvelopeEncryption.create_primary_key()
+            self.stdout.write(f'🔑 Nueva clave principal {key_id}')
+        else:
+            EnvelopeEncryption.clear_cache()
+            key_id = EnvelopeEncryption.primary_key_id()
+
+        prefix = EnvelopeEncryption.token_prefix(key_id)
+        total = skipped = 0
+        for model in apps.get_models():
+            fields = [
+                field.name for field in model._meta.concrete_fields
+                if isinstance(field, EncryptedCharField)
+            ]
+            if fields:
+                updated, unreadable = self._reencrypt(model, fields, prefix, options['batch_size'])
+                total += updated
+                skipped += unreadable
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'⚠️ {skipped} filas no se pudieron desencriptar; las claves anteriores se conservan'
+            ))
+            retired = 0
+        else:
+            # Todas las filas usan ya la clave principal: las anteriores quedan retiradas
+            retired = EnvelopeEncryption.retire_keys(keep=key_id)
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {total} filas re-cifradas con la clave {key_id}; {retired} claves retiradas')
+        )
+
+    def _reencrypt(self, model, fields, prefix, batch_size):
+        """
+        Re-cifrar por lotes las filas con algún valor en claro o de otra clave.
+        Devuelve ``(filas re-cifradas, filas ilegibles)``.
+
+        Al leer, el campo desencripta con la clave original; al guardar con
+        ``bulk_update`` se cifra con la principal. Las filas ya migradas dejan
+        de cumplir el filtro, así que interrumpir y relanzar reanuda el trabajo.
+        """
+        pending = Q()
+        for field in fields:
+            pending |= Q(**{f'{field}__isnull': False}) & ~Q(**{field: ''}) & ~Q(**{f'{field}__startswith': prefix})
+        queryset = model._default_manager.filter(pending).order_by('pk')
+
+        updated = unreadable = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(batch.only('pk', *fields)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1].pk
+            # No sobrescribir valores que no se pudieron leer
+            readable = [row for row in rows if UNREADABLE_VALUE not in (getattr(row, f) for f in fields)]
+            unreadable += len(rows) - len(readable)
+            if readable:
+                model._default_manager.bulk_update(readable, fields)
+            updated += len(readable)
+            self.stdout.write(f'  {model._meta.label}: {updated} filas (último ID {last_pk})')
+        return updated, unreadable
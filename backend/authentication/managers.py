@@ -1,14 +1,124 @@
+from itertools import islice
+
 from django.db import models
 from django.db.models import F
-from .fields import PGPSymDecrypt
+from .fields import PendingCiphertext, PGPSymDecrypt, blind_index, deferred_decryption
+
+
+def _resolve(value):
+    return value.plaintext if isinstance(value, PendingCiphertext) else value
+
+
+def _resolve_instance(instance, seen):
+    """Sustituir los marcadores de una instancia y de sus relaciones de select_related"""
+    if instance is None or id(instance) in seen:
+        return
+    seen.add(id(instance))
+    for name, value in instance.__dict__.items():
+        if isinstance(value, PendingCiphertext):
+            instance.__dict__[name] = value.plaintext
+    for related in instance._state.fields_cache.values():
+        if isinstance(related, models.Model):
+            _resolve_instance(related, seen)
+
+
+def _resolve_results(results):
+    """Sustituir en sitio los marcadores de una lista de resultados de cualquier iterable"""
+    seen = set()
+    for position, item in enumerate(results):
+        if isinstance(item, models.Model):
+            _resolve_instance(item, seen)
+        elif isinstance(item, dict):
+            for key, value in item.items():
+                item[key] = _resolve(value)
+        elif isinstance(item, tuple) and not hasattr(item, '_fields'):
+            results[position] = tuple(_resolve(value) for value in item)
+        elif isinstance(item, tuple):
+            results[position] = item._make(_resolve(value) for value in item)
+        else:
+            results[position] = _resolve(item)
+
+
+class BatchDecryptingIterable:
+    """
+    Mezcla para los iterables de Django que desencripta por bloques.
+    
+    Las filas se leen dentro de ``deferred_decryption`` y los marcadores se
+    sustituyen antes de entregarlas: todas a la vez al evaluar el QuerySet o
+    cada ``chunk_size`` filas con ``iterator()``. El bloque se cierra antes
+    de ceder filas al llamador.
+    """
+    
+    def __iter__(self):
+        rows = super().__iter__()
+        size = self.chunk_size if self.chunked_fetch else None
+        while True:
+            with deferred_decryption() as pending:
+                results = list(islice(rows, size))
+            if not results:
+                return
+            if pending:
+                _resolve_results(results)
+            yield from results
+
+
+_batch_iterables = {}
 
 
-class EncryptedFieldManager(models.Manager):
+def batch_decrypting(iterable_class):
+    """Subclase de ``iterable_class`` (ModelIterable, ValuesIterable...) con desencriptado en bloque"""
+    if issubclass(iterable_class, BatchDecryptingIterable):
+        return iterable_class
+    if iterable_class not in _batch_iterables:
+        _batch_iterables[iterable_class] = type(
+            f'BatchDecrypting{iterable_class.__name__}', (BatchDecryptingIterable, iterable_class), {}
+        )
+    return _batch_iterables[iterable_class]
+
+
+def with_batch_decryption(queryset):
+    """
+    Copia de ``queryset`` que desencripta en bloque, incluidas las relaciones
+    de ``select_related`` (p. ej. citas con sus pacientes).
+    
+    ``values()`` y ``values_list()`` cambian el iterable, así que en un
+    QuerySet normal se aplica después de ellos.
+    """
+    queryset = queryset.all()
+    queryset._iterable_class = batch_decrypting(queryset._iterable_class)
+    return queryset
+
+
+class DecryptingQuerySet(models.QuerySet):
+    """
+    QuerySet que desencripta en bloque los campos encriptados de sus resultados.
+    
+    Los valores encriptados de todas las filas se desencriptan con una sola
+    consulta en lugar de una por valor, tanto para instancias (incluidas las
+    de ``select_related``) como para ``values()`` y ``values_list()``;
+    ``iterator()`` lo hace por cada bloque de ``chunk_size`` filas. Otros
+    modelos pueden hacer lo mismo en una consulta con ``with_batch_decryption``.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._iterable_class = batch_decrypting(self._iterable_class)
+    
+    def values(self, *fields, **expressions):
+        return with_batch_decryption(super().values(*fields, **expressions))
+    
+    def values_list(self, *fields, flat=False, named=False):
+        return with_batch_decryption(super().values_list(*fields, flat=flat, named=named))
+
+
+class EncryptedFieldManager(models.Manager.from_queryset(DecryptingQuerySet)):
     """Manager personalizado para manejar queries con campos encriptados"""
     
-    def __init__(self, encrypted_fields=None):
+    def __init__(self, encrypted_fields=None, blind_indexes=None):
         super().__init__()
         self.encrypted_fields = encrypted_fields or []
+        # Campo encriptado -> columna con su índice ciego
+        self.blind_indexes = blind_indexes or {}
     
     def get_queryset(self):
         """Sobrescribe el queryset para desencriptar automáticamente los campos"""
@@ -29,8 +139,13 @@ class EncryptedFieldManager(models.Manager):
     def filter_encrypted(self, field_name, value):
         """
         Método helper para filtrar por campos encriptados
-        Nota: Esto puede ser lento porque requiere desencriptar todos los registros
+        
+        Si el campo tiene índice ciego se usa una igualdad indexada; si no,
+        requiere desencriptar todos los registros (lento)
         """
+        if field_name in self.blind_indexes:
+            return super().get_queryset().filter(**{self.blind_indexes[field_name]: blind_index(value)})
+        
         # Para búsquedas en campos encriptados, es mejor usar índices funcionales
         # o almacenar un hash del valor para búsquedas exactas
         queryset = self.get_queryset()
@@ -61,7 +176,8 @@ class UserEncryptedManager(EncryptedFieldManager):
     def __init__(self):
         # Especificar qué campos están encriptados en el modelo User
         encrypted_fields = ['dni', 'identification_number']
-        super().__init__(encrypted_fields=encrypted_fields)
+        blind_indexes = {'dni': 'dni_hash', 'identification_number': 'identification_number_hash'}
+        super().__init__(encrypted_fields=encrypted_fields, blind_indexes=blind_indexes)
     
     def get_by_dni(self, dni):
         """Buscar usuario por DNI encriptado"""
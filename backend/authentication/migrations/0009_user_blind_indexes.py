@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:13
+
+import authentication.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0008_add_obstetriz_odontologo_roles"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="dni_hash",
+            field=authentication.fields.BlindIndexField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                null=True,
+                source="dni",
+                unique=True,
+                verbose_name="Índice de DNI",
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="identification_number_hash",
+            field=authentication.fields.BlindIndexField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                null=True,
+                source="identification_number",
+                unique=True,
+                verbose_name="Índice de número de identificación",
+            ),
+        ),
+    ]
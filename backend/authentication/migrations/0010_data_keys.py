@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0009_user_blind_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DataKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("wrapped_key", models.BinaryField(verbose_name="Clave envuelta")),
+                (
+                    "is_primary",
+                    models.BooleanField(default=False, verbose_name="Clave principal"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "retired_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Retirada"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Clave de datos",
+                "verbose_name_plural": "Claves de datos",
+                "ordering": ["-created_at"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("is_primary", True)),
+                        fields=("is_primary",),
+                        name="single_primary_data_key",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_trigram_index(apps, schema_editor):
+    """Índice GIN de trigramas, solo en PostgreSQL"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS patient_search_document_trgm '
+        'ON authentication_patientsearchentry USING gin (document gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS patient_search_document_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0010_data_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientSearchEntry",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_entry",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("document", models.TextField(verbose_name="Documento")),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Entrada de búsqueda de paciente",
+                "verbose_name_plural": "Entradas de búsqueda de pacientes",
+            },
+        ),
+        migrations.CreateModel(
+            name="PatientSearchGram",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("gram", models.CharField(max_length=3)),
+                (
+                    "entry",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="grams",
+                        to="authentication.patientsearchentry",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Trigrama de búsqueda",
+                "verbose_name_plural": "Trigramas de búsqueda",
+                "unique_together": {("gram", "entry")},
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0011_patient_search_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="loginattempt",
+            name="attempted_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name="loginattempt",
+            index=models.Index(
+                fields=["email", "attempted_at"], name="login_attempt_email_time"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loginattempt",
+            index=models.Index(
+                fields=["ip_address", "attempted_at"], name="login_attempt_ip_time"
+            ),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:47
+
+import secrets
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+
+
+def hash_backup_tokens(apps, schema_editor):
+    """Mover los tokens de respaldo en claro a la tabla de hashes"""
+    User = apps.get_model("authentication", "User")
+    BackupToken = apps.get_model("authentication", "BackupToken")
+    rows = []
+    for user_id, tokens in User.objects.exclude(backup_tokens=[]).values_list("id", "backup_tokens").iterator():
+        for token in tokens or []:
+            formatted = token.replace("-", "").replace(" ", "").upper()
+            salt = secrets.token_hex(16)
+            rows.append(BackupToken(
+                user_id=user_id,
+                prefix=formatted[:4],
+                salt=salt,
+                token_hash=salted_hmac("authentication.backup_token", salt + formatted, algorithm="sha256").hexdigest(),
+            ))
+    BackupToken.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0012_login_attempt_batching"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BackupToken",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("prefix", models.CharField(max_length=4)),
+                ("salt", models.CharField(max_length=32)),
+                ("token_hash", models.CharField(max_length=64)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "used_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="Usado"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="backup_codes",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Token de respaldo",
+                "verbose_name_plural": "Tokens de respaldo",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "prefix"], name="backup_token_user_prefix"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(hash_backup_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="user",
+            name="backup_tokens",
+        ),
+    ]
@@ -2,12 +2,29 @@ from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.core.validators import RegexValidator
 from django.utils import timezone
-from .fields import EncryptedCharField
-from .managers import UserEncryptedManager
+from .fields import BlindIndexField, EncryptedCharField, blind_index
+from .managers import DecryptingQuerySet, UserEncryptedManager
+from .services.hashing import PasswordHashingService
 import uuid
 
 
-class UserManager(BaseUserManager):
+def calculate_age(dob):
+    """Edad en años cumplidos a partir de la fecha de nacimiento"""
+    if not dob:
+        return None
+    
+    from datetime import datetime
+    today = datetime.now().date()
+    age = today.year - dob.year
+    
+    # Verificar si ya pasó el cumpleaños este año
+    if today.month < dob.month or (today.month == dob.month and today.day < dob.day):
+        age -= 1
+        
+    return age
+
+
+class UserManager(BaseUserManager.from_queryset(DecryptingQuerySet)):
     """Manager personalizado para el modelo User"""
     
     def create_user(self, email, password=None, **extra_fields):
@@ -36,6 +53,16 @@ class UserManager(BaseUserManager):
             raise ValueError('Superuser debe tener is_superuser=True.')
         
         return self.create_user(email, password, **extra_fields)
+    
+    def get_by_dni(self, dni):
+        """Buscar usuario por DNI usando su índice ciego"""
+        value = blind_index(dni)
+        return self.filter(dni_hash=value).first() if value else None
+    
+    def get_by_identification(self, identification_number):
+        """Buscar usuario por número de identificación usando su índice ciego"""
+        value = blind_index(identification_number)
+        return self.filter(identification_number_hash=value).first() if value else None
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -82,6 +109,13 @@ class User(AbstractBaseUser, PermissionsMixin):
         validators=[RegexValidator(r'^[0-9]+$', 'Solo se permiten números')],
         verbose_name='Número de identificación'
     )
+    # Índices ciegos para búsquedas exactas sin desencriptar
+    dni_hash = BlindIndexField(source='dni', unique=True, verbose_name='Índice de DNI')
+    identification_number_hash = BlindIndexField(
+        source='identification_number',
+        unique=True,
+        verbose_name='Índice de número de identificación'
+    )
     birth_date = models.DateField(null=True, blank=True, verbose_name='Fecha de nacimiento')
     date_of_birth = models.DateField(null=True, blank=True, verbose_name='Fecha de nacimiento')
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES, blank=True, verbose_name='Género')
@@ -131,7 +165,6 @@ class User(AbstractBaseUser, PermissionsMixin):
     # 2FA Fields
     two_factor_enabled = models.BooleanField(default=False, verbose_name='2FA Habilitado')
     two_factor_secret = models.CharField(max_length=32, blank=True, verbose_name='Secreto 2FA')
-    backup_tokens = models.JSONField(default=list, blank=True, verbose_name='Tokens de respaldo')
     
     # Manager
     objects = UserManager()
@@ -156,19 +189,45 @@ class User(AbstractBaseUser, PermissionsMixin):
     @property
     def age(self):
         """Calcula la edad del usuario basado en su fecha de nacimiento"""
-        if not self.date_of_birth and not self.birth_date:
-            return None
-        
-        dob = self.date_of_birth or self.birth_date
-        from datetime import datetime
-        today = datetime.now().date()
-        age = today.year - dob.year
-        
-        # Verificar si ya pasó el cumpleaños este año
-        if today.month < dob.month or (today.month == dob.month and today.day < dob.day):
-            age -= 1
-            
-        return age
+        return calculate_age(self.date_of_birth or self.birth_date)
+    
+    # Campos con índice ciego: origen -> columna de índice
+    BLIND_INDEXES = {'dni': 'dni_hash', 'identification_number': 'identification_number_hash'}
+    
+    def set_password(self, raw_password):
+        """Calcula el hash en el pool de procesos si está activo"""
+        if raw_password is None:
+            return super().set_password(raw_password)
+        self.password = PasswordHashingService.make_password(raw_password)
+        self._password = raw_password
+    
+    def check_password(self, raw_password):
+        """Verifica en el pool de procesos y actualiza hashes con parámetros antiguos"""
+        valid, must_update = PasswordHashingService.verify_password(raw_password, self.password)
+        if valid and must_update:
+            self.set_password(raw_password)
+            # Actualizar el hash no cuenta como cambio de contraseña
+            self._password = None
+            self.save(update_fields=['password'])
+        return valid
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        """Un usuario resuelto desde caché carga todos sus campos diferidos en una consulta"""
+        if fields is not None and getattr(self, '_load_deferred_together', False):
+            deferred = self.get_deferred_fields()
+            if deferred and set(fields) <= deferred:
+                fields = deferred
+                self._load_deferred_together = False
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+    
+    def save(self, *args, **kwargs):
+        """Incluye los índices ciegos cuando se guardan solo algunos campos"""
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            update_fields |= {index for source, index in self.BLIND_INDEXES.items() if source in update_fields}
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
     
     def delete(self, *args, **kwargs):
         """Implementa borrado suave marcando como inactivo en lugar de eliminar"""
@@ -268,13 +327,103 @@ class LoginAttempt(models.Model):
     ip_address = models.GenericIPAddressField()
     user_agent = models.TextField()
     success = models.BooleanField(default=False)
-    attempted_at = models.DateTimeField(auto_now_add=True)
+    # Se escribe en bloque tras el intento: la hora la fija quien lo registra
+    attempted_at = models.DateTimeField(default=timezone.now)
     
     class Meta:
         verbose_name = 'Intento de Login'
         verbose_name_plural = 'Intentos de Login'
         ordering = ['-attempted_at']
+        indexes = [
+            models.Index(fields=['email', 'attempted_at'], name='login_attempt_email_time'),
+            models.Index(fields=['ip_address', 'attempted_at'], name='login_attempt_ip_time'),
+        ]
     
     def __str__(self):
         status = 'Exitoso' if self.success else 'Fallido'
         return f"{self.email} - {status} - {self.attempted_at}"
+
+
+class BackupToken(models.Model):
+    """
+    Token de respaldo de 2FA.
+    
+    Solo se guarda un HMAC con sal del token; el prefijo en claro permite
+    encontrar el candidato con un índice por usuario sin recorrer la lista.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='backup_codes')
+    prefix = models.CharField(max_length=4)
+    salt = models.CharField(max_length=32)
+    token_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    used_at = models.DateTimeField(null=True, blank=True, verbose_name='Usado')
+    
+    class Meta:
+        verbose_name = 'Token de respaldo'
+        verbose_name_plural = 'Tokens de respaldo'
+        indexes = [
+            models.Index(fields=['user', 'prefix'], name='backup_token_user_prefix'),
+        ]
+    
+    def __str__(self):
+        status = 'usado' if self.used_at else 'disponible'
+        return f"{self.user} - {self.prefix} ({status})"
+
+
+class DataKey(models.Model):
+    """Clave de datos del cifrado en aplicación, envuelta con la clave maestra"""
+    wrapped_key = models.BinaryField(verbose_name='Clave envuelta')
+    is_primary = models.BooleanField(default=False, verbose_name='Clave principal')
+    created_at = models.DateTimeField(auto_now_add=True)
+    retired_at = models.DateTimeField(null=True, blank=True, verbose_name='Retirada')
+    
+    class Meta:
+        verbose_name = 'Clave de datos'
+        verbose_name_plural = 'Claves de datos'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_primary'],
+                condition=models.Q(is_primary=True),
+                name='single_primary_data_key'
+            ),
+        ]
+    
+    def __str__(self):
+        status = 'principal' if self.is_primary else ('retirada' if self.retired_at else 'activa')
+        return f"Clave {self.pk} ({status})"
+
+
+class PatientSearchEntry(models.Model):
+    """Documento de búsqueda normalizado de un paciente"""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_entry'
+    )
+    # Nombre, apellidos, teléfono y email en minúsculas y sin acentos (el DNI
+    # no se incluye: está encriptado y se busca por su índice ciego)
+    document = models.TextField(verbose_name='Documento')
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Entrada de búsqueda de paciente'
+        verbose_name_plural = 'Entradas de búsqueda de pacientes'
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.document}"
+
+
+class PatientSearchGram(models.Model):
+    """Índice invertido de trigramas para bases de datos sin pg_trgm"""
+    gram = models.CharField(max_length=3)
+    entry = models.ForeignKey(PatientSearchEntry, on_delete=models.CASCADE, related_name='grams')
+    
+    class Meta:
+        verbose_name = 'Trigrama de búsqueda'
+        verbose_name_plural = 'Trigramas de búsqueda'
+        unique_together = ['gram', 'entry']
+    
+    def __str__(self):
+        return f"{self.gram} -> {self.entry_id}"
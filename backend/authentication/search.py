@@ -0,0 +1,163 @@
+"""
+Índice de búsqueda de pacientes.
+
+Cada paciente tiene un ``PatientSearchEntry`` con su nombre, teléfono y email
+normalizados. En PostgreSQL la columna tiene un índice GIN ``gin_trgm_ops``
+(ver migración), de modo que ``LIKE '%texto%'`` no recorre la tabla y el
+orden usa ``word_similarity``. En otras bases de datos se mantiene además un
+índice invertido de trigramas (``PatientSearchGram``): se buscan las entradas
+que contienen todos los trigramas de la consulta y el orden se calcula en
+Python sobre esos candidatos.
+"""
+import unicodedata
+
+from django.db import connection, transaction
+from django.db.models import Count, FloatField, Func, Value
+
+from .models import PatientSearchEntry, PatientSearchGram
+
+# Candidatos que se ordenan en Python en el índice de respaldo
+FALLBACK_CANDIDATES = 200
+
+
+class WordSimilarity(Func):
+    """Similitud de pg_trgm entre la consulta y la palabra más parecida del documento"""
+    function = 'word_similarity'
+    output_field = FloatField()
+
+
+def uses_trigram_index():
+    return connection.vendor == 'postgresql'
+
+
+def normalize(text):
+    """Minúsculas, sin acentos y con espacios simples"""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def trigrams(text):
+    """
+    Trigramas de cada palabra, sin relleno.
+
+    A diferencia de pg_trgm no se marcan inicio ni fin de palabra, así que
+    una subcadena de la palabra comparte todos sus trigramas con ella.
+    """
+    grams = set()
+    for word in normalize(text).split():
+        grams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def build_document(user):
+    return normalize(' '.join(filter(None, [user.first_name, user.last_name, user.phone, user.email])))
+
+
+def index_patient(user):
+    """Crear, actualizar o borrar la entrada de búsqueda de un usuario"""
+    if user.role != 'patient' or not user.is_active:
+        PatientSearchEntry.objects.filter(user_id=user.pk).delete()
+        return
+
+    document = build_document(user)
+    with transaction.atomic():
+        entry, created = PatientSearchEntry.objects.get_or_create(user_id=user.pk, defaults={'document': document})
+        if not created:
+            if entry.document == document:
+                return
+            entry.document = document
+            entry.save(update_fields=['document', 'updated_at'])
+        if not uses_trigram_index():
+            entry.grams.all().delete()
+            PatientSearchGram.objects.bulk_create(
+                [PatientSearchGram(gram=gram, entry=entry) for gram in trigrams(document)]
+            )
+
+
+def index_new_patients(users):
+    """
+    Indexar pacientes recién creados con ``bulk_create``.
+
+    ``bulk_create`` no emite ``post_save``, así que las entradas y sus
+    trigramas se insertan aquí con dos consultas para todo el lote.
+    """
+    entries = [
+        PatientSearchEntry(user_id=user.pk, document=build_document(user))
+        for user in users
+        if user.role == 'patient' and user.is_active
+    ]
+    with transaction.atomic():
+        PatientSearchEntry.objects.bulk_create(entries)
+        if not uses_trigram_index():
+            PatientSearchGram.objects.bulk_create([
+                PatientSearchGram(gram=gram, entry_id=entry.pk)
+                for entry in entries
+                for gram in trigrams(entry.document)
+            ])
+    return len(entries)
+
+
+def matching_entries(query):
+    """
+    Entradas que contienen ``query`` como subcadena.
+
+    En el índice de respaldo se filtra primero por los trigramas de la
+    consulta (todos deben aparecer) y después se confirma la subcadena.
+    """
+    term = normalize(query)
+    entries = PatientSearchEntry.objects.filter(document__contains=term)
+    if uses_trigram_index():
+        return entries
+
+    grams = trigrams(term)
+    if not grams:
+        # Consultas de menos de tres letras: solo la comparación de subcadena
+        return entries
+    candidates = PatientSearchGram.objects.filter(gram__in=grams).values('entry').annotate(
+        hits=Count('id')
+    ).filter(hits=len(grams)).values('entry')
+    return entries.filter(pk__in=candidates)
+
+
+def _fallback_rank(document, term):
+    """Coincidencia al inicio del documento, luego al inicio de una palabra, luego dentro"""
+    if document.startswith(term):
+        return 3
+    if f' {term}' in document:
+        return 2
+    return 1
+
+
+def search_patient_ids(query, limit=10):
+    """IDs de los pacientes que coinciden con ``query``, ordenados por relevancia"""
+    term = normalize(query)
+    if not term:
+        return []
+    entries = matching_entries(term)
+
+    if uses_trigram_index():
+        return list(
+            entries.annotate(rank=WordSimilarity(Value(term), 'document')).order_by(
+                '-rank', 'document'
+            ).values_list('user_id', flat=True)[:limit]
+        )
+
+    candidates = list(entries.values_list('user_id', 'document')[:FALLBACK_CANDIDATES])
+    candidates.sort(key=lambda item: (-_fallback_rank(item[1], term), len(item[1]), item[1]))
+    return [user_id for user_id, _ in candidates[:limit]]
+
+
+def rebuild_search_index(batch_size=1000):
+    """Reindexar todos los pacientes activos; devuelve cuántos se indexaron"""
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    PatientSearchEntry.objects.exclude(user__role='patient', user__is_active=True).delete()
+    total = 0
+    for user in User.objects.filter(role='patient', is_active=True).only(
+        'pk', 'role', 'is_active', 'first_name', 'last_name', 'phone', 'email'
+    ).iterator(chunk_size=batch_size):
+        index_patient(user)
+        total += 1
+    return total
@@ -2,6 +2,35 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import User, DoctorProfile, PatientProfile
+from .fields import blind_index
+
+
+class UniqueBlindIndexValidator:
+    """
+    Unicidad de un campo encriptado comprobada sobre su índice ciego.
+    
+    Sustituye al ``UniqueValidator`` que DRF genera a partir del modelo, que
+    compararía contra la columna encriptada.
+    """
+    requires_context = True
+    
+    def __init__(self, index_field, message):
+        self.index_field = index_field
+        self.message = message
+    
+    def __call__(self, value, serializer_field):
+        queryset = User.objects.filter(**{self.index_field: blind_index(value)})
+        instance = getattr(serializer_field.parent, 'instance', None)
+        if instance is not None:
+            queryset = queryset.exclude(pk=instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(self.message, code='unique')
+
+
+def _dni_validators():
+    return User._meta.get_field('dni').validators + [
+        UniqueBlindIndexValidator('dni_hash', 'Ya existe un usuario con este DNI.')
+    ]
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -29,7 +58,8 @@ class UserSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['user_id', 'date_joined']
         extra_kwargs = {
-            'password': {'write_only': True}
+            'password': {'write_only': True},
+            'dni': {'validators': _dni_validators()}
         }
 
 
@@ -44,6 +74,9 @@ class UserCreateSerializer(serializers.ModelSerializer):
             'email', 'password', 'password_confirm', 'first_name', 'last_name',
             'dni', 'birth_date', 'gender', 'phone'
         ]  # Removemos 'role' porque se asigna automáticamente
+        extra_kwargs = {
+            'dni': {'validators': _dni_validators()}
+        }
     
     def validate(self, data):
         if data['password'] != data['password_confirm']:
@@ -63,6 +96,40 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return user
 
 
+class PatientImportRowSerializer(serializers.ModelSerializer):
+    """
+    Serializer para validar una fila de la importación masiva de pacientes.
+    
+    No consulta la base de datos: la unicidad de email y DNI se comprueba
+    por lotes en ``authentication.imports``.
+    """
+    password = serializers.CharField(write_only=True, min_length=8, required=False)
+    blood_type = serializers.ChoiceField(choices=PatientProfile.BLOOD_TYPE_CHOICES, required=False, allow_blank=True)
+    allergies = serializers.CharField(required=False, allow_blank=True)
+    chronic_conditions = serializers.CharField(required=False, allow_blank=True)
+    emergency_contact_name = serializers.CharField(max_length=200, required=False, allow_blank=True)
+    emergency_contact_relationship = serializers.CharField(max_length=50, required=False, allow_blank=True)
+    insurance_provider = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    insurance_policy_number = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    
+    PROFILE_FIELDS = [
+        'blood_type', 'allergies', 'chronic_conditions', 'emergency_contact_name',
+        'emergency_contact_relationship', 'insurance_provider', 'insurance_policy_number'
+    ]
+    
+    class Meta:
+        model = User
+        fields = [
+            'email', 'password', 'first_name', 'last_name', 'dni', 'birth_date', 'gender', 'phone',
+            'blood_type', 'allergies', 'chronic_conditions', 'emergency_contact_name',
+            'emergency_contact_relationship', 'insurance_provider', 'insurance_policy_number'
+        ]
+        extra_kwargs = {
+            'email': {'validators': []},
+            'dni': {'validators': User._meta.get_field('dni').validators}
+        }
+
+
 class DoctorProfileSerializer(serializers.ModelSerializer):
     """Serializer para perfil de doctor"""
     user = UserSerializer(read_only=True)
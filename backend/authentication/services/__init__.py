@@ -1,3 +1,5 @@
+from .envelope import EnvelopeEncryption, EnvelopeEncryptionError
+from .hashing import PasswordHashingService
 from .two_factor_service import TwoFactorService
 
-__all__ = ['TwoFactorService']
+__all__ = ['EnvelopeEncryption', 'EnvelopeEncryptionError', 'PasswordHashingService', 'TwoFactorService']
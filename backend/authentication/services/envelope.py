@@ -0,0 +1,184 @@
+"""
+Cifrado en aplicación (envelope encryption) para los campos encriptados.
+
+Cada valor se cifra con AES-GCM usando una clave de datos; las claves de
+datos se guardan en ``DataKey`` envueltas con una clave maestra derivada de
+``PGCRYPTO_KEY``. El texto cifrado lleva el id de su clave, así que rotar
+solo crea una clave principal nueva: los valores antiguos se siguen leyendo
+con su clave mientras ``reencrypt_fields`` los migra por lotes.
+
+Las claves desenvueltas se mantienen en memoria del proceso, por lo que
+desencriptar no requiere ir a la base de datos salvo la primera vez que se
+ve una clave.
+"""
+import base64
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PREFIX = 'enc:v1:'
+NONCE_SIZE = 12
+WRAP_AAD = b'data-key'
+
+
+class EnvelopeEncryptionError(Exception):
+    """Error al cifrar o descifrar un valor"""
+
+
+class EnvelopeEncryption:
+    """Servicio de cifrado en aplicación con caché de claves en memoria"""
+    
+    _keys = {}
+    _primary = None
+    _primary_loaded_at = 0.0
+    _lock = threading.Lock()
+    
+    @staticmethod
+    def enabled() -> bool:
+        """Indica si los campos encriptados se escriben con este backend"""
+        return getattr(settings, 'ENCRYPTION_BACKEND', 'pgcrypto') == 'envelope'
+    
+    @staticmethod
+    def is_encrypted(value) -> bool:
+        return isinstance(value, str) and value.startswith(TOKEN_PREFIX)
+    
+    @staticmethod
+    def key_id_of(token: str) -> int:
+        """Id de la clave de datos con la que se cifró ``token``"""
+        return int(token[len(TOKEN_PREFIX):].split(':', 1)[0])
+    
+    @staticmethod
+    def token_prefix(key_id: int) -> str:
+        return f'{TOKEN_PREFIX}{key_id}:'
+    
+    @staticmethod
+    def _master() -> AESGCM:
+        master = getattr(settings, 'PGCRYPTO_KEY', os.environ.get('PGCRYPTO_KEY', 'default-encryption-key'))
+        return AESGCM(hashlib.sha256(b'envelope:' + master.encode('utf-8')).digest())
+    
+    @classmethod
+    def _unwrap(cls, wrapped) -> AESGCM:
+        wrapped = bytes(wrapped)
+        try:
+            key = cls._master().decrypt(wrapped[:NONCE_SIZE], wrapped[NONCE_SIZE:], WRAP_AAD)
+        except InvalidTag:
+            raise EnvelopeEncryptionError('No se pudo desenvolver la clave de datos: clave maestra incorrecta')
+        return AESGCM(key)
+    
+    @classmethod
+    def _wrap(cls, key: bytes) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + cls._master().encrypt(nonce, key, WRAP_AAD)
+    
+    @classmethod
+    def _get_key(cls, key_id: int) -> AESGCM:
+        """Clave de datos desenvuelta, desde la caché o la base de datos"""
+        aead = cls._keys.get(key_id)
+        if aead is not None:
+            return aead
+        
+        from authentication.models import DataKey
+        try:
+            wrapped = DataKey.objects.values_list('wrapped_key', flat=True).get(pk=key_id)
+        except DataKey.DoesNotExist:
+            raise EnvelopeEncryptionError(f'Clave de datos {key_id} no encontrada')
+        aead = cls._unwrap(wrapped)
+        with cls._lock:
+            cls._keys[key_id] = aead
+        return aead
+    
+    @classmethod
+    def primary_key_id(cls) -> int:
+        """
+        Id de la clave principal; se crea una si no existe.
+        
+        Se recuerda durante ``ENVELOPE_PRIMARY_KEY_TTL`` segundos, de modo que
+        tras una rotación los demás procesos adoptan la clave nueva sin
+        reiniciarse.
+        """
+        ttl = getattr(settings, 'ENVELOPE_PRIMARY_KEY_TTL', 300)
+        if cls._primary is not None and time.monotonic() - cls._primary_loaded_at < ttl:
+            return cls._primary
+        
+        from authentication.models import DataKey
+        key_id = DataKey.objects.filter(is_primary=True).values_list('pk', flat=True).first()
+        if key_id is None:
+            key_id = cls.create_primary_key()
+        with cls._lock:
+            cls._primary = key_id
+            cls._primary_loaded_at = time.monotonic()
+        return key_id
+    
+    @classmethod
+    def create_primary_key(cls) -> int:
+        """Generar una clave de datos nueva y marcarla como principal"""
+        from authentication.models import DataKey
+        key = AESGCM.generate_key(bit_length=256)
+        try:
+            with transaction.atomic():
+                DataKey.objects.filter(is_primary=True).update(is_primary=False)
+                data_key = DataKey.objects.create(wrapped_key=cls._wrap(key), is_primary=True)
+        except IntegrityError:
+            # Otro proceso creó la clave principal a la vez
+            return DataKey.objects.filter(is_primary=True).values_list('pk', flat=True).get()
+        
+        with cls._lock:
+            cls._keys[data_key.pk] = AESGCM(key)
+            cls._primary = data_key.pk
+            cls._primary_loaded_at = time.monotonic()
+        logger.info(f"Created primary data key {data_key.pk}")
+        return data_key.pk
+    
+    @classmethod
+    def retire_keys(cls, keep: int) -> int:
+        """Marcar como retiradas las claves distintas de ``keep``; devuelve cuántas"""
+        from authentication.models import DataKey
+        return DataKey.objects.exclude(pk=keep).filter(retired_at__isnull=True).update(
+            is_primary=False,
+            retired_at=timezone.now()
+        )
+    
+    @classmethod
+    def encrypt(cls, plaintext: str) -> str:
+        key_id = cls.primary_key_id()
+        prefix = cls.token_prefix(key_id)
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = cls._get_key(key_id).encrypt(nonce, str(plaintext).encode('utf-8'), prefix.encode('ascii'))
+        return prefix + base64.b64encode(nonce + ciphertext).decode('ascii')
+    
+    @classmethod
+    def decrypt(cls, token: str) -> str:
+        try:
+            key_id = cls.key_id_of(token)
+            payload = base64.b64decode(token[len(cls.token_prefix(key_id)):])
+        except (ValueError, TypeError):
+            raise EnvelopeEncryptionError('Formato de valor cifrado inválido')
+        try:
+            plaintext = cls._get_key(key_id).decrypt(
+                payload[:NONCE_SIZE], payload[NONCE_SIZE:], cls.token_prefix(key_id).encode('ascii')
+            )
+        except InvalidTag:
+            raise EnvelopeEncryptionError(f'Valor cifrado inválido para la clave {key_id}')
+        return plaintext.decode('utf-8')
+    
+    @classmethod
+    def clear_cache(cls, key_id: Optional[int] = None):
+        """Olvidar las claves desenvueltas (todas o una)"""
+        with cls._lock:
+            if key_id is None:
+                cls._keys.clear()
+            else:
+                cls._keys.pop(key_id, None)
+            cls._primary = None
+            cls._primary_loaded_at = 0.0
@@ -0,0 +1,170 @@
+"""
+Cálculo de hashes de contraseña en un pool de procesos.
+
+PBKDF2/argon2 ocupan la CPU durante decenas de milisegundos y, ejecutados en
+el hilo de la petición, bloquean al worker. Con ``PASSWORD_HASHING_WORKERS``
+mayor que cero el cálculo se envía a un ``ProcessPoolExecutor`` y el hilo
+solo espera el resultado. Un semáforo limita los trabajos en curso a
+``PASSWORD_HASHING_MAX_PENDING`` para que una avalancha de logins no acapare
+los núcleos que necesitan el resto de endpoints: las peticiones que superan
+el límite esperan su turno sin consumir CPU.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+logger = logging.getLogger(__name__)
+
+
+def _init_worker():
+    """Configurar Django en procesos creados con spawn"""
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _make_password(raw_password):
+    return hashers.make_password(raw_password)
+
+
+def _verify_password(raw_password, encoded):
+    """``(válida, requiere_actualizar)``; la actualización la hace el proceso web"""
+    # Incluye el hash falso y harden_runtime que igualan los tiempos de respuesta
+    return hashers.verify_password(raw_password, encoded)
+
+
+class PasswordHashingService:
+    """Servicio de hashing de contraseñas con pool de procesos acotado"""
+    
+    _executor = None
+    _semaphore = None
+    _lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _in_flight = 0
+    _waiting = 0
+    _completed = 0
+    
+    @staticmethod
+    def workers() -> int:
+        return getattr(settings, 'PASSWORD_HASHING_WORKERS', 0)
+    
+    @classmethod
+    def _get_executor(cls) -> Optional[ProcessPoolExecutor]:
+        workers = cls.workers()
+        if workers <= 0:
+            return None
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    max_pending = getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', workers * 4)
+                    cls._semaphore = threading.BoundedSemaphore(max(workers, max_pending))
+                    cls._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+                    logger.info(f"Started password hashing pool with {workers} workers")
+        return cls._executor
+    
+    @classmethod
+    def _acquire(cls):
+        with cls._stats_lock:
+            cls._waiting += 1
+        cls._semaphore.acquire()
+        with cls._stats_lock:
+            cls._waiting -= 1
+            cls._in_flight += 1
+    
+    @classmethod
+    def _release(cls):
+        cls._semaphore.release()
+        with cls._stats_lock:
+            cls._in_flight -= 1
+            cls._completed += 1
+    
+    @classmethod
+    def _run(cls, func, *args):
+        executor = cls._get_executor()
+        if executor is None:
+            return func(*args)
+        
+        cls._acquire()
+        try:
+            return executor.submit(func, *args).result()
+        finally:
+            cls._release()
+    
+    @classmethod
+    def make_password(cls, raw_password: str) -> str:
+        return cls._run(_make_password, raw_password)
+    
+    @classmethod
+    def make_passwords(cls, raw_passwords: Iterable[Optional[str]]) -> List[str]:
+        """
+        Hashes de un lote, en paralelo en el pool si está activo.
+        
+        El lote mantiene como mucho un trabajo en curso por worker, cada uno
+        con su hueco del semáforo, así que una importación masiva no deja sin
+        turno a los logins.
+        """
+        executor = cls._get_executor()
+        if executor is None:
+            return [_make_password(raw_password) for raw_password in raw_passwords]
+        
+        hashes = []
+        pending = deque()
+        try:
+            for raw_password in raw_passwords:
+                if len(pending) >= cls.workers():
+                    future = pending.popleft()
+                    try:
+                        hashes.append(future.result())
+                    finally:
+                        cls._release()
+                cls._acquire()
+                try:
+                    pending.append(executor.submit(_make_password, raw_password))
+                except Exception:
+                    cls._release()
+                    raise
+            while pending:
+                future = pending.popleft()
+                try:
+                    hashes.append(future.result())
+                finally:
+                    cls._release()
+        finally:
+            # Tras un error, esperar a los trabajos restantes antes de liberar sus huecos
+            while pending:
+                pending.popleft().exception()
+                cls._release()
+        return hashes
+    
+    @classmethod
+    def verify_password(cls, raw_password: str, encoded: str) -> Tuple[bool, bool]:
+        """Devuelve ``(válida, requiere_actualizar)``"""
+        return cls._run(_verify_password, raw_password, encoded)
+    
+    @classmethod
+    def stats(cls) -> dict:
+        """Profundidad de la cola: trabajos en el pool y peticiones esperando turno"""
+        with cls._stats_lock:
+            return {
+                'workers': cls.workers() if cls._executor is not None else 0,
+                'in_flight': cls._in_flight,
+                'waiting': cls._waiting,
+                'completed': cls._completed,
+            }
+    
+    @classmethod
+    def shutdown(cls):
+        """Cerrar el pool y reiniciar sus estadísticas (se vuelve a crear bajo demanda)"""
+        with cls._lock:
+            if cls._executor is not None:
+                cls._executor.shutdown(wait=True)
+            cls._executor = None
+            cls._semaphore = None
+            with cls._stats_lock:
+                cls._completed = 0
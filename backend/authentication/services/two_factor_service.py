@@ -3,8 +3,17 @@ import qrcode
 import io
 import base64
 import secrets
+import time
 from typing import List, Tuple, Optional
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from ..cache import TOTPReplayCache
+
+# Caracteres del token usados como prefijo de búsqueda (se guardan en claro)
+BACKUP_TOKEN_PREFIX_LENGTH = 4
 
 
 class TwoFactorService:
@@ -51,25 +60,51 @@ class TwoFactorService:
         """
         Verifica si el token proporcionado es válido
         """
+        return TwoFactorService.matching_timecode(secret, token) is not None
+    
+    @staticmethod
+    def matching_timecode(secret: str, token: str) -> Optional[int]:
+        """
+        Ventana de tiempo en la que el token es válido, o None
+        """
         if not secret or not token:
-            return False
+            return None
         
         totp = pyotp.TOTP(secret)
+        now = int(time.time())
+        current = now // totp.interval
         # Permitir un margen de tiempo de 30 segundos (1 ventana)
-        return totp.verify(token, valid_window=1)
+        for offset in (0, -1, 1):
+            if constant_time_compare(str(token), totp.at(now, offset)):
+                return current + offset
+        return None
+    
+    @staticmethod
+    def verify_user_token(user, token: str) -> bool:
+        """
+        Verifica el código TOTP del usuario y lo consume: un código ya usado
+        (o verificado a la vez por otra petición) no vuelve a ser válido
+        """
+        timecode = TwoFactorService.matching_timecode(user.two_factor_secret, token)
+        if timecode is None:
+            return False
+        return TOTPReplayCache.mark_used(user.pk, timecode)
     
     @staticmethod
     def generate_backup_tokens(count: int = 10) -> List[str]:
         """
-        Genera tokens de respaldo para recuperación
+        Genera tokens de respaldo para recuperación, con prefijos distintos
         """
         tokens = []
-        for _ in range(count):
-            # Generar token de 8 caracteres
-            token = secrets.token_hex(4).upper()
-            # Formatear como XXXX-XXXX
-            formatted_token = f"{token[:4]}-{token[4:]}"
-            tokens.append(formatted_token)
+        prefixes = set()
+        while len(tokens) < count:
+            # Generar token de 12 caracteres; los 4 primeros son el prefijo
+            token = secrets.token_hex(6).upper()
+            if token[:BACKUP_TOKEN_PREFIX_LENGTH] in prefixes:
+                continue
+            prefixes.add(token[:BACKUP_TOKEN_PREFIX_LENGTH])
+            # Formatear como XXXX-XXXX-XXXX
+            tokens.append(f"{token[:4]}-{token[4:8]}-{token[8:]}")
         return tokens
     
     @staticmethod
@@ -80,19 +115,64 @@ class TwoFactorService:
         return token.replace('-', '').replace(' ', '').upper()
     
     @staticmethod
-    def verify_backup_token(stored_tokens: List[str], provided_token: str) -> Tuple[bool, Optional[str]]:
+    def hash_backup_token(token: str, salt: str) -> str:
         """
-        Verifica si un token de respaldo es válido
-        Retorna (es_valido, token_usado)
+        HMAC con sal del token ya formateado, con la SECRET_KEY como clave
+        """
+        return salted_hmac('authentication.backup_token', salt + token, algorithm='sha256').hexdigest()
+    
+    @staticmethod
+    def store_backup_tokens(user, tokens: List[str]) -> None:
         """
-        formatted_token = TwoFactorService.format_backup_token(provided_token)
+        Reemplaza los tokens de respaldo del usuario por los hashes de ``tokens``
+        """
+        from authentication.models import BackupToken
+        
+        rows = []
+        for token in tokens:
+            formatted = TwoFactorService.format_backup_token(token)
+            salt = secrets.token_hex(16)
+            rows.append(BackupToken(
+                user=user,
+                prefix=formatted[:BACKUP_TOKEN_PREFIX_LENGTH],
+                salt=salt,
+                token_hash=TwoFactorService.hash_backup_token(formatted, salt)
+            ))
+        with transaction.atomic():
+            BackupToken.objects.filter(user=user).delete()
+            BackupToken.objects.bulk_create(rows)
+    
+    @staticmethod
+    def consume_backup_token(user, provided_token: str) -> bool:
+        """
+        Verifica un token de respaldo y lo marca como usado.
+        
+        Solo se comparan los tokens con el mismo prefijo y el consumo es un
+        ``UPDATE`` condicional: si dos peticiones usan el mismo token a la
+        vez, solo una lo consigue.
+        """
+        from authentication.models import BackupToken
         
-        for stored_token in stored_tokens:
-            formatted_stored = TwoFactorService.format_backup_token(stored_token)
-            if formatted_stored == formatted_token:
-                return True, stored_token
+        formatted = TwoFactorService.format_backup_token(provided_token or '')
+        if len(formatted) <= BACKUP_TOKEN_PREFIX_LENGTH:
+            return False
         
-        return False, None
+        candidates = BackupToken.objects.filter(
+            user=user,
+            prefix=formatted[:BACKUP_TOKEN_PREFIX_LENGTH],
+            used_at__isnull=True
+        ).values_list('pk', 'salt', 'token_hash')
+        for pk, salt, token_hash in candidates:
+            if constant_time_compare(TwoFactorService.hash_backup_token(formatted, salt), token_hash):
+                return BackupToken.objects.filter(pk=pk, used_at__isnull=True).update(used_at=timezone.now()) == 1
+        return False
+    
+    @staticmethod
+    def remaining_backup_tokens(user) -> int:
+        """
+        Número de tokens de respaldo sin usar
+        """
+        return user.backup_codes.filter(used_at__isnull=True).count()
     
     @staticmethod
     def enable_two_factor(user) -> Tuple[str, List[str], str]:
@@ -111,9 +191,9 @@ class TwoFactorService:
         
         # Actualizar usuario
         user.two_factor_secret = secret
-        user.backup_tokens = backup_tokens
         user.two_factor_enabled = False  # Se habilitará después de verificar
         user.save()
+        TwoFactorService.store_backup_tokens(user, backup_tokens)
         
         return secret, backup_tokens, qr_code
     
@@ -122,7 +202,7 @@ class TwoFactorService:
         """
         Confirma la activación de 2FA verificando el primer token
         """
-        if TwoFactorService.verify_token(user.two_factor_secret, token):
+        if TwoFactorService.verify_user_token(user, token):
             user.two_factor_enabled = True
             user.save()
             return True
@@ -135,8 +215,8 @@ class TwoFactorService:
         """
         user.two_factor_enabled = False
         user.two_factor_secret = ''
-        user.backup_tokens = []
         user.save()
+        user.backup_codes.all().delete()
     
     @staticmethod
     def regenerate_backup_tokens(user) -> List[str]:
@@ -144,6 +224,5 @@ class TwoFactorService:
         Regenera los tokens de respaldo para un usuario
         """
         new_tokens = TwoFactorService.generate_backup_tokens()
-        user.backup_tokens = new_tokens
-        user.save()
+        TwoFactorService.store_backup_tokens(user, new_tokens)
         return new_tokens
@@ -0,0 +1,57 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .cache import PrincipalCache
+from .models import DoctorProfile, PatientProfile
+from .search import index_patient
+
+User = get_user_model()
+
+# Campos que forman el documento de búsqueda o deciden si el usuario se indexa
+SEARCH_USER_FIELDS = {'first_name', 'last_name', 'phone', 'email', 'role', 'is_active'}
+
+# Campos que afectan a la entrada de PrincipalCache (la contraseña revoca tokens)
+PRINCIPAL_USER_FIELDS = set(PrincipalCache.FIELDS) | {'password'}
+
+
+@receiver(post_save, sender=User)
+def update_patient_search_index(sender, instance, created, update_fields=None, **kwargs):
+    """Mantener al día la entrada de búsqueda del paciente"""
+    if update_fields is not None and not SEARCH_USER_FIELDS.intersection(update_fields):
+        return
+    if created and instance.role != 'patient':
+        return
+    index_patient(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_principal(sender, instance, update_fields=None, **kwargs):
+    """Invalidar el usuario cacheado para la autenticación JWT"""
+    if update_fields is not None and not PRINCIPAL_USER_FIELDS.intersection(update_fields):
+        return
+    PrincipalCache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_save, sender=PatientProfile)
+def invalidate_principal_new_profile(sender, instance, created, **kwargs):
+    """El usuario cacheado guarda los ids de sus perfiles"""
+    if created:
+        PrincipalCache.invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=DoctorProfile)
+@receiver(post_delete, sender=PatientProfile)
+def invalidate_principal_deleted_profile(sender, instance, **kwargs):
+    PrincipalCache.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_principal_on_blacklist(sender, instance, **kwargs):
+    """Revocar un token obliga a volver a leer el usuario"""
+    user_id = instance.token.user_id
+    if user_id:
+        PrincipalCache.invalidate(user_id)
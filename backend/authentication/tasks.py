@@ -0,0 +1,25 @@
+from celery import shared_task
+from django.utils.dateparse import parse_datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def record_login_attempts(rows):
+    """Insertar en bloque los intentos de login acumulados por LoginAttemptWriter"""
+    from .models import LoginAttempt
+
+    attempts = [
+        LoginAttempt(
+            email=row['email'],
+            ip_address=row['ip_address'],
+            user_agent=row['user_agent'],
+            success=row['success'],
+            attempted_at=parse_datetime(row['attempted_at'])
+        )
+        for row in rows
+    ]
+    LoginAttempt.objects.bulk_create(attempts, batch_size=500)
+    logger.info(f"Recorded {len(attempts)} login attempts")
+    return len(attempts)
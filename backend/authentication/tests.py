@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model, authenticate
 from django.urls import reverse
 from rest_framework.test import APITestCase
@@ -7,8 +7,10 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from tests.base import BaseTestCase, BaseAPITestCase, TimestampTestMixin, DatabaseTestMixin
 from .models import User
 from .serializers import UserSerializer, RegisterSerializer
-from datetime import timedelta
+from datetime import date, time, timedelta
 from django.utils import timezone
+import pyotp
+import time as time_module
 
 User = get_user_model()
 
@@ -477,3 +479,835 @@ class PermissionTests(BaseAPITestCase):
         url = reverse('authentication:user-list')
         response = self.client.get(url)
         self.assertForbidden(response)
+
+
+class BlindIndexTests(BaseAPITestCase):
+    """Tests para los índices ciegos de DNI e identificación"""
+
+    def test_hash_set_on_create_and_update(self):
+        """El índice se calcula al crear y al actualizar el DNI"""
+        from .fields import blind_index
+
+        user = self.create_user('blind', 'blind@test.com', 'patient', dni='11223344')
+        self.assertEqual(user.dni_hash, blind_index('11223344'))
+        self.assertNotEqual(user.dni_hash, '11223344')
+
+        user.dni = '55667788'
+        user.save(update_fields=['dni'])
+        user.refresh_from_db()
+        self.assertEqual(user.dni_hash, blind_index('55667788'))
+
+    def test_get_by_dni_uses_single_query(self):
+        """La búsqueda exacta por DNI es una igualdad sobre el índice"""
+        user = self.create_user('blind', 'blind@test.com', 'patient', dni='11223344')
+        with self.assertNumQueries(1):
+            found = User.objects.get_by_dni(' 11223344 ')
+        self.assertEqual(found, user)
+
+    def test_check_dni_view(self):
+        """El endpoint de verificación usa el índice ciego"""
+        self.create_user('blind', 'blind@test.com', 'patient', dni='11223344')
+        url = reverse('check_dni')
+
+        response = self.client.post(url, {'dni': '11223344'})
+        self.assertTrue(response.data['exists'])
+
+        response = self.client.post(url, {'dni': '99999999'})
+        self.assertFalse(response.data['exists'])
+
+    def test_duplicate_dni_rejected(self):
+        """El serializer rechaza un DNI ya registrado"""
+        self.create_user('blind', 'blind@test.com', 'patient', dni='11223344')
+        serializer = RegisterSerializer(data={
+            'username': 'other',
+            'email': 'other@test.com',
+            'password': 'newpass123',
+            'password_confirm': 'newpass123',
+            'dni': '11223344',
+            'role': 'patient'
+        })
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('dni', serializer.errors)
+
+    def test_backfill_command(self):
+        """El comando rellena los índices faltantes"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .fields import blind_index
+
+        user = self.create_user('blind', 'blind@test.com', 'patient', dni='11223344')
+        User.objects.update(dni_hash=None, identification_number_hash=None)
+
+        call_command('backfill_blind_indexes', batch_size=2, stdout=StringIO())
+
+        user.refresh_from_db()
+        self.assertEqual(user.dni_hash, blind_index('11223344'))
+        self.assertFalse(User.objects.filter(dni__isnull=False, dni_hash__isnull=True).exists())
+
+
+class BatchDecryptionTests(BaseAPITestCase):
+    """Tests para la desencriptación en bloque de campos encriptados"""
+
+    def setUp(self):
+        super().setUp()
+        from django.db import connection
+        from unittest import mock
+
+        for index in range(5):
+            self.create_user(f'enc{index}', f'enc{index}@test.com', 'patient')
+        # Simular valores encriptados: la columna devuelve bytes
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE authentication_user SET dni = CAST('cipher-' || id AS BLOB) WHERE role = 'patient'"
+            )
+
+        def fake_decrypt(values, connection):
+            return [bytes(value).decode().replace('cipher-', 'plain-') for value in values]
+
+        patcher = mock.patch('authentication.fields.decrypt_values', side_effect=fake_decrypt)
+        self.decrypt = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_queryset_decrypts_in_one_batch(self):
+        """Todas las filas se desencriptan con una sola llamada"""
+        with self.assertNumQueries(1):
+            users = list(User.objects.filter(role='patient'))
+
+        self.assertEqual(len(users), 6)
+        self.assertEqual(self.decrypt.call_count, 1)
+        self.assertEqual(len(self.decrypt.call_args[0][0]), 6)
+        for user in users:
+            self.assertEqual(user.dni, f'plain-{user.pk}')
+
+    def test_values_decrypted_in_one_batch(self):
+        """values() y values_list() también se desencriptan en bloque"""
+        rows = list(User.objects.filter(role='patient').values('pk', 'dni'))
+        dnis = list(User.objects.filter(role='patient').values_list('dni', flat=True))
+
+        self.assertEqual(self.decrypt.call_count, 2)
+        self.assertTrue(all(row['dni'] == f"plain-{row['pk']}" for row in rows))
+        self.assertTrue(all(dni.startswith('plain-') for dni in dnis))
+
+    def test_patient_list_decrypts_once(self):
+        """El listado de pacientes desencripta la página con una sola llamada"""
+        self.authenticate(self.doctor)
+        url = reverse('patient_list')
+
+        response = self.client.get(url)
+        self.assertSuccess(response)
+        self.assertEqual(self.decrypt.call_count, 1)
+        dnis = {patient['dni'] for patient in response.data['results']}
+        self.assertIn(f'plain-{self.patient.pk}', dnis)
+
+    def test_iterator_decrypts_per_chunk(self):
+        """iterator() desencripta una vez por bloque de chunk_size filas"""
+        users = list(User.objects.filter(role='patient').iterator(chunk_size=4))
+        self.assertEqual(self.decrypt.call_count, 2)
+        self.assertTrue(all(user.dni == f'plain-{user.pk}' for user in users))
+
+    def test_with_batch_decryption_on_other_models(self):
+        """Un QuerySet de otro modelo desencripta sus usuarios relacionados en bloque"""
+        from appointments.models import Appointment
+        from .managers import with_batch_decryption
+
+        self._appointments(4)
+        self.decrypt.reset_mock()
+        appointments = list(Appointment.objects.select_related('patient').iterator())
+        self.assertEqual(self.decrypt.call_count, 4)
+
+        self.decrypt.reset_mock()
+        appointments = list(with_batch_decryption(Appointment.objects.select_related('patient')))
+        self.assertEqual(self.decrypt.call_count, 1)
+        self.assertTrue(all(item.patient.dni == f'plain-{item.patient_id}' for item in appointments))
+
+        self.decrypt.reset_mock()
+        dnis = list(with_batch_decryption(Appointment.objects.values_list('patient__dni', flat=True)))
+        self.assertEqual(self.decrypt.call_count, 1)
+        self.assertTrue(all(dni.startswith('plain-') for dni in dnis))
+
+    def _appointments(self, count):
+        from datetime import date, time, timedelta
+        from appointments.models import Appointment
+
+        patients = list(User.objects.filter(role='patient').order_by('pk').values_list('pk', flat=True))
+        offset = Appointment.objects.count()
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient_id=patients[index % len(patients)], doctor=self.doctor,
+                appointment_date=date.today() + timedelta(days=1 + offset + index),
+                appointment_time=time(9, 0), reason='Control'
+            )
+            for index in range(count)
+        ])
+
+    def test_appointment_list_decrypts_related_users_once(self):
+        """Los pacientes de select_related se desencriptan en bloque con el listado de citas"""
+        from django.db import connection
+
+        fake_decrypt = self.decrypt.side_effect
+
+        def decrypt_with_query(values, using):
+            # Contar la desencriptación como la consulta que es en PostgreSQL
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return fake_decrypt(values, using)
+
+        self.decrypt.side_effect = decrypt_with_query
+        self.authenticate(self.admin_user)
+        url = reverse('appointment-list')
+
+        self._appointments(3)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertSuccess(response)
+
+        # El doble de citas no añade consultas
+        self._appointments(3)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertSuccess(response)
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertEqual(self.decrypt.call_count, 2)
+
+
+@override_settings(ENCRYPTION_BACKEND='envelope')
+class EnvelopeEncryptionTests(BaseAPITestCase):
+    """Tests para el cifrado en aplicación con claves de datos"""
+
+    def setUp(self):
+        from .services import EnvelopeEncryption
+
+        EnvelopeEncryption.clear_cache()
+        self.addCleanup(EnvelopeEncryption.clear_cache)
+        super().setUp()
+
+    def raw_dni(self, user):
+        from django.db import connection
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT dni FROM authentication_user WHERE id = %s", [user.pk])
+            return cursor.fetchone()[0]
+
+    def test_values_stored_encrypted(self):
+        """El DNI se guarda cifrado con el id de su clave y se lee en claro"""
+        from .services import EnvelopeEncryption
+
+        user = self.create_user('enc', 'enc@test.com', 'patient', dni='11223344')
+        raw = self.raw_dni(user)
+
+        self.assertTrue(EnvelopeEncryption.is_encrypted(raw))
+        self.assertNotIn('11223344', raw)
+        self.assertEqual(EnvelopeEncryption.key_id_of(raw), EnvelopeEncryption.primary_key_id())
+        self.assertEqual(User.objects.get(pk=user.pk).dni, '11223344')
+        self.assertEqual(User.objects.get_by_dni('11223344'), user)
+
+    def test_decryption_uses_key_cache(self):
+        """Con la clave en memoria, leer no consulta la tabla de claves"""
+        self.create_user('enc', 'enc@test.com', 'patient', dni='11223344')
+        with self.assertNumQueries(1):
+            users = list(User.objects.all())
+        self.assertIn('11223344', [user.dni for user in users])
+
+    def test_tampered_value_unreadable(self):
+        """Un valor alterado no se acepta"""
+        from django.db import connection
+        from .fields import UNREADABLE_VALUE
+
+        user = self.create_user('enc', 'enc@test.com', 'patient', dni='11223344')
+        raw = self.raw_dni(user)
+        tampered = raw[:-4] + ('AAAA' if not raw.endswith('AAAA') else 'BBBB')
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE authentication_user SET dni = %s WHERE id = %s", [tampered, user.pk])
+
+        self.assertEqual(User.objects.get(pk=user.pk).dni, UNREADABLE_VALUE)
+
+    def test_reencrypt_command_rotates_keys(self):
+        """La rotación re-cifra todas las filas y retira la clave anterior"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import DataKey
+        from .services import EnvelopeEncryption
+
+        user = self.create_user('enc', 'enc@test.com', 'patient', dni='11223344')
+        old_key = EnvelopeEncryption.key_id_of(self.raw_dni(user))
+        with override_settings(ENCRYPTION_BACKEND='pgcrypto'):
+            plain = self.create_user('plain', 'plain@test.com', 'patient', dni='55667788')
+        self.assertEqual(self.raw_dni(plain), '55667788')
+
+        call_command('reencrypt_fields', rotate=True, batch_size=2, stdout=StringIO())
+
+        new_key = EnvelopeEncryption.primary_key_id()
+        self.assertNotEqual(new_key, old_key)
+        for target, dni in ((user, '11223344'), (plain, '55667788')):
+            self.assertEqual(EnvelopeEncryption.key_id_of(self.raw_dni(target)), new_key)
+            self.assertEqual(User.objects.get(pk=target.pk).dni, dni)
+        self.assertIsNotNone(DataKey.objects.get(pk=old_key).retired_at)
+
+        # Otro proceso sin la clave en memoria también puede leer
+        EnvelopeEncryption.clear_cache()
+        self.assertEqual(User.objects.get(pk=user.pk).dni, '11223344')
+
+    def test_reencrypt_requires_envelope_backend(self):
+        """El comando exige el backend de cifrado en aplicación"""
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        with override_settings(ENCRYPTION_BACKEND='pgcrypto'):
+            with self.assertRaises(CommandError):
+                call_command('reencrypt_fields')
+
+
+class PatientSearchIndexTests(BaseAPITestCase):
+    """Tests para el índice de búsqueda de pacientes"""
+
+    def setUp(self):
+        super().setUp()
+        self.ana = self.create_user('ana', 'ana@test.com', 'patient', first_name='Ana', last_name='García')
+        self.juan = self.create_user('juan', 'juan@test.com', 'patient', first_name='Juan', last_name='Anaya')
+        self.mariana = self.create_user('mariana', 'mariana@test.com', 'patient', first_name='Mariana', last_name='López')
+        self.authenticate(self.doctor)
+        self.url = reverse('patient_search')
+
+    def search(self, query):
+        response = self.client.get(self.url, {'q': query})
+        self.assertSuccess(response)
+        return [result['id'] for result in response.data['results']]
+
+    def test_results_ranked(self):
+        """Coincidencia al inicio, luego al inicio de palabra, luego dentro de palabra"""
+        self.assertEqual(self.search('ana'), [self.ana.id, self.juan.id, self.mariana.id])
+
+    def test_accents_and_case_ignored(self):
+        """La búsqueda ignora acentos y mayúsculas"""
+        self.assertEqual(self.search('GARCIA'), [self.ana.id])
+        self.assertEqual(self.search('lópez'), [self.mariana.id])
+
+    def test_index_updated_on_save(self):
+        """El índice se actualiza al guardar el usuario"""
+        self.ana.last_name = 'Torres'
+        self.ana.save()
+
+        self.assertEqual(self.search('garcia'), [])
+        self.assertEqual(self.search('torres'), [self.ana.id])
+
+        self.ana.is_active = False
+        self.ana.save(update_fields=['is_active'])
+        self.assertEqual(self.search('torres'), [])
+
+    def test_only_patients_indexed(self):
+        """Solo los pacientes activos forman parte del índice"""
+        from .models import PatientSearchEntry
+
+        self.assertFalse(PatientSearchEntry.objects.filter(user=self.doctor).exists())
+        self.assertEqual(self.search('doctor'), [])
+
+    def test_exact_dni_match(self):
+        """El DNI exacto se encuentra por su índice ciego"""
+        self.mariana.dni = '12341234'
+        self.mariana.save(update_fields=['dni'])
+        self.assertEqual(self.search('12341234'), [self.mariana.id])
+
+    def test_patient_list_search(self):
+        """El listado de pacientes filtra con el índice de búsqueda"""
+        response = self.client.get(reverse('patient_list'), {'search': 'anaya'})
+        self.assertSuccess(response)
+        self.assertEqual([patient['id'] for patient in response.data['results']], [self.juan.id])
+
+    def test_rebuild_command(self):
+        """El comando reconstruye el índice completo"""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import PatientSearchEntry
+
+        PatientSearchEntry.objects.all().delete()
+        self.assertEqual(self.search('garcia'), [])
+
+        call_command('rebuild_patient_search_index', stdout=StringIO())
+        self.assertEqual(self.search('garcia'), [self.ana.id])
+
+
+class PatientListQueryTests(BaseAPITestCase):
+    """Tests para el número de consultas del listado de pacientes"""
+
+    def add_patients(self, count, start=0):
+        from appointments.models import Appointment
+
+        for index in range(start, start + count):
+            patient = self.create_user(f'list{index}', f'list{index}@test.com', 'patient')
+            for offset in (1, 2):
+                Appointment.objects.create(
+                    patient=patient,
+                    doctor=self.doctor,
+                    appointment_date=date.today() - timedelta(days=offset * 10 + index),
+                    appointment_time=time(9 + offset, 0),
+                    reason='Control'
+                )
+
+    def get_list(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('patient_list'))
+        self.assertSuccess(response)
+        return response, len(queries.captured_queries)
+
+    def test_query_count_independent_of_page_size(self):
+        """Las últimas citas de la página se obtienen en la misma consulta"""
+        self.authenticate(self.doctor)
+        self.add_patients(2)
+        _, few = self.get_list()
+
+        self.add_patients(6, start=2)
+        _, many = self.get_list()
+        self.assertEqual(few, many)
+
+    def test_last_appointment_data(self):
+        """La última cita se informa con fecha, hora y doctor"""
+        self.authenticate(self.doctor)
+        self.add_patients(1)
+        response, _ = self.get_list()
+
+        rows = {row['id']: row for row in response.data['results']}
+        patient = User.objects.get(username='list0')
+        last = rows[patient.id]['last_appointment']
+        self.assertEqual(last['date'], (date.today() - timedelta(days=10)).strftime('%Y-%m-%d'))
+        self.assertEqual(last['time'], '10:00')
+        self.assertEqual(last['doctor'], f'{self.doctor.first_name} {self.doctor.last_name}')
+        self.assertIsNone(rows[self.patient.id]['last_appointment'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedPrincipalTests(BaseAPITestCase):
+    """Tests para la resolución del usuario JWT desde caché"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        super().setUp()
+        self.token = self.authenticate(self.patient)
+        self.url = reverse('patient_search')
+
+    def get_user(self):
+        from .authentication import CachedJWTAuthentication
+
+        return CachedJWTAuthentication().get_user(self.token)
+
+    def test_cache_hit_skips_user_query(self):
+        """Con la caché caliente la autenticación no consulta la base de datos"""
+        with self.assertNumQueries(1):
+            self.client.get(self.url, {'q': 'a'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'q': 'a'})
+        self.assertSuccess(response)
+
+    def test_deferred_fields_loaded_together(self):
+        """Los campos no cacheados se cargan con una sola consulta"""
+        self.get_user()
+        user = self.get_user()
+        self.assertEqual(user.role, 'patient')
+        with self.assertNumQueries(1):
+            self.assertEqual(user.phone, self.patient.phone)
+            self.assertEqual(user.dni, self.patient.dni)
+            self.assertTrue(user.check_password('testpass123'))
+
+    def test_missing_profile_without_query(self):
+        """La ausencia de perfil se resuelve sin consultar la base de datos"""
+        self.get_user()
+        user = self.get_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(hasattr(user, 'doctor_profile'))
+
+    def test_invalidated_on_user_change(self):
+        """Cambiar el usuario invalida la entrada cacheada"""
+        from .cache import PrincipalCache
+
+        self.get_user()
+        self.assertIsNotNone(PrincipalCache.get(self.patient.pk))
+
+        self.patient.first_name = 'Nuevo'
+        self.patient.save(update_fields=['first_name'])
+        self.assertIsNone(PrincipalCache.get(self.patient.pk))
+        self.assertEqual(self.get_user().first_name, 'Nuevo')
+
+        # last_login no forma parte de la entrada
+        self.patient.save(update_fields=['last_login'])
+        self.assertIsNotNone(PrincipalCache.get(self.patient.pk))
+
+    def test_inactive_user_rejected(self):
+        """Un usuario desactivado deja de autenticarse aunque estuviera cacheado"""
+        self.get_user()
+        self.patient.is_active = False
+        self.patient.save()
+
+        response = self.client.get(self.url, {'q': 'a'})
+        self.assertUnauthorized(response)
+
+    def test_invalidated_on_blacklist(self):
+        """Revocar un token del usuario invalida la entrada"""
+        from .cache import PrincipalCache
+
+        self.get_user()
+        RefreshToken.for_user(self.patient).blacklist()
+        self.assertIsNone(PrincipalCache.get(self.patient.pk))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    LOGIN_THROTTLE_LIMITS={'email': {'limit': 3, 'window': 900}, 'ip': {'limit': 5, 'window': 900}},
+    LOGIN_ATTEMPT_BATCH_SIZE=100,
+    LOGIN_ATTEMPT_FLUSH_INTERVAL=3600
+)
+class LoginThrottleTests(BaseAPITestCase):
+    """Tests para el bloqueo de login por fallos recientes"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .login_protection import LoginAttemptWriter
+
+        cache.clear()
+        LoginAttemptWriter.flush()
+        super().setUp()
+        self.url = reverse('token_obtain_pair')
+
+    def login(self, email, password='wrongpass', url=None):
+        return self.client.post(url or self.url, {'email': email, 'password': password})
+
+    def test_email_locked_after_failures(self):
+        """Tras el límite de fallos el email queda bloqueado sin consultar la base de datos"""
+        for _ in range(3):
+            self.assertEqual(self.login('patient@test.com').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        with self.assertNumQueries(0):
+            response = self.login('patient@test.com', password='testpass123')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        # Otro email desde la misma IP sigue permitido
+        self.assertEqual(self.login('doctor@test.com').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_ip_locked_across_emails(self):
+        """Muchos emails distintos desde una IP bloquean la IP"""
+        for index in range(5):
+            self.login(f'unknown{index}@test.com')
+        response = self.login('patient@test.com', password='testpass123')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_desktop_login_throttled(self):
+        """El login de escritorio comparte los contadores"""
+        url = reverse('desktop_token_obtain_pair')
+        for _ in range(3):
+            self.login('doctor@test.com', url=url)
+        self.assertEqual(self.login('doctor@test.com', url=url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_success_resets_email_failures(self):
+        """Un login correcto limpia los fallos del email"""
+        for _ in range(2):
+            self.login('patient@test.com')
+        self.assertEqual(self.login('patient@test.com', password='testpass123').status_code, status.HTTP_200_OK)
+        for _ in range(2):
+            self.assertEqual(self.login('patient@test.com').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_client_ip_from_trusted_proxies(self):
+        """La IP sale de X-Forwarded-For solo con proxies de confianza configurados"""
+        from django.test import RequestFactory
+        from .login_protection import client_ip
+
+        request = RequestFactory().post(
+            self.url, HTTP_X_FORWARDED_FOR='1.1.1.1, 203.0.113.7, 10.0.0.2', REMOTE_ADDR='10.0.0.1'
+        )
+        self.assertEqual(client_ip(request), '10.0.0.1')
+        with override_settings(LOGIN_TRUSTED_PROXY_HOPS=1):
+            self.assertEqual(client_ip(request), '10.0.0.2')
+        with override_settings(LOGIN_TRUSTED_PROXY_HOPS=2):
+            self.assertEqual(client_ip(request), '203.0.113.7')
+        with override_settings(LOGIN_TRUSTED_PROXY_HOPS=5):
+            self.assertEqual(client_ip(request), '1.1.1.1')
+
+    @override_settings(LOGIN_TRUSTED_PROXY_HOPS=1)
+    def test_ip_lock_uses_forwarded_address(self):
+        """Detrás de un proxy se bloquea al cliente y no al proxy"""
+        for index in range(5):
+            self.client.post(
+                self.url, {'email': f'unknown{index}@test.com', 'password': 'x'},
+                HTTP_X_FORWARDED_FOR='spoofed, 203.0.113.7'
+            )
+        response = self.client.post(
+            self.url, {'email': 'patient@test.com', 'password': 'testpass123'},
+            HTTP_X_FORWARDED_FOR='203.0.113.8'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(
+            self.url, {'email': 'patient@test.com', 'password': 'testpass123'},
+            HTTP_X_FORWARDED_FOR='other, 203.0.113.7'
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_sliding_window_weights_previous_window(self):
+        """Los fallos de la ventana anterior pesan según su solapamiento"""
+        from .login_protection import LoginThrottle
+
+        start = 900 * 1000
+        for _ in range(3):
+            LoginThrottle.record_failure('a@test.com', '10.0.0.1', now=start + 600)
+        self.assertTrue(LoginThrottle.retry_after('a@test.com', '10.0.0.2', now=start + 700))
+        # A mitad de la ventana siguiente pesan 1.5 < 3
+        self.assertEqual(LoginThrottle.retry_after('a@test.com', '10.0.0.2', now=start + 900 + 450), 0)
+
+    def test_attempts_written_in_batches(self):
+        """Los intentos se escriben en bloque al volcar el buffer"""
+        from .login_protection import LoginAttemptWriter
+        from .models import LoginAttempt
+
+        self.login('patient@test.com')
+        self.login('patient@test.com', password='testpass123')
+        self.assertEqual(LoginAttempt.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(LoginAttemptWriter.flush(), 2)
+        self.assertEqual(
+            list(LoginAttempt.objects.order_by('attempted_at').values_list('success', flat=True)),
+            [False, True]
+        )
+
+
+    @override_settings(LOGIN_ATTEMPT_FLUSH_INTERVAL=0.05)
+    def test_buffer_flushed_by_timer(self):
+        """El buffer se vuelca al vencer el intervalo aunque no haya más logins"""
+        import threading
+        from unittest.mock import patch
+        from .login_protection import LoginAttemptWriter
+
+        flushed = threading.Event()
+        with patch('authentication.tasks.record_login_attempts.delay', side_effect=lambda rows: flushed.set()) as delay:
+            LoginAttemptWriter.record('a@test.com', '10.0.0.1', 'agent', success=False)
+            self.assertTrue(flushed.wait(5))
+
+        self.assertEqual(len(delay.call_args.args[0]), 1)
+        self.assertIsNone(LoginAttemptWriter._timer)
+
+class PasswordHashingPoolTests(BaseAPITestCase):
+    """Tests para el hashing de contraseñas en el pool de procesos"""
+
+    def setUp(self):
+        from .services import PasswordHashingService
+
+        super().setUp()
+        self.addCleanup(PasswordHashingService.shutdown)
+
+    def test_pool_hashes_and_verifies(self):
+        """Con el pool activo los usuarios se crean y autentican igual"""
+        from .services import PasswordHashingService
+
+        with override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_PENDING=2):
+            user = self.create_user('pooled', 'pooled@test.com', 'patient')
+            self.assertTrue(user.check_password('testpass123'))
+            self.assertFalse(user.check_password('wrong'))
+            stats = PasswordHashingService.stats()
+
+        self.assertEqual(stats['workers'], 1)
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertTrue(authenticate(email='pooled@test.com', password='testpass123'))
+
+    def test_outdated_hash_upgraded(self):
+        """Un hash con un algoritmo antiguo se actualiza al verificarlo"""
+        from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+        hasher = PBKDF2PasswordHasher()
+        self.patient.password = hasher.encode('oldpass123', hasher.salt(), iterations=1)
+        self.patient.save(update_fields=['password'])
+        with override_settings(PASSWORD_HASHERS=[
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        ]):
+            self.assertTrue(self.patient.check_password('oldpass123'))
+            self.patient.refresh_from_db()
+            self.assertTrue(self.patient.password.startswith('md5$'))
+
+    def test_unusable_password_runs_fake_hash(self):
+        """Verificar sin contraseña usable calcula un hash igualmente, como Django"""
+        from unittest import mock
+        from django.contrib.auth import hashers
+        from .services import PasswordHashingService
+
+        with mock.patch.object(hashers, 'make_password', wraps=hashers.make_password) as make_password:
+            self.assertEqual(PasswordHashingService.verify_password('x', '!unusable'), (False, False))
+        make_password.assert_called_once()
+
+    def test_stats_endpoint_admin_only(self):
+        """Las métricas del pool son solo para administradores"""
+        url = reverse('password_hashing_stats')
+        self.authenticate(self.patient)
+        self.assertForbidden(self.client.get(url))
+
+        self.admin_user.is_staff = True
+        self.admin_user.save()
+        self.authenticate(self.admin_user)
+        response = self.client.get(url)
+        self.assertSuccess(response)
+        self.assertIn('waiting', response.data)
+
+
+class PatientImportTests(BaseAPITestCase):
+    """Tests para la importación masiva de pacientes"""
+
+    CSV = (
+        'email,password,first_name,last_name,dni,birth_date,gender,phone,blood_type\n'
+        'ana@import.com,secreto123,Ana,Pérez,11111111,1990-05-01,F,+51987654321,O+\n'
+        'luis@import.com,,Luis,Gómez,22222222,,M,+51987654322,\n'
+        'mala@import.com,corta,Mala,Fila,abc,,X,+51987654323,\n'
+        'ana@import.com,secreto123,Ana,Duplicada,33333333,,F,+51987654324,\n'
+    )
+
+    def _import(self, content, fmt='csv', **kwargs):
+        from io import BytesIO
+        from .imports import import_patients
+
+        return import_patients(BytesIO(content.encode('utf-8')), fmt, **kwargs)
+
+    def test_csv_import_creates_related_rows(self):
+        """Usuarios, perfiles, preferencias e índice de búsqueda en bloque"""
+        from notifications.models import NotificationPreference
+        from .models import PatientSearchEntry
+
+        summary = self._import(self.CSV, chunk_size=2)
+
+        self.assertEqual(summary['processed'], 4)
+        self.assertEqual(summary['created'], 2)
+        self.assertEqual([result['row'] for result in summary['error_rows']], [3, 4])
+        self.assertIn('dni', summary['error_rows'][0]['errors'])
+        self.assertIn('email', summary['error_rows'][1]['errors'])
+
+        ana = User.objects.get(email='ana@import.com')
+        self.assertEqual(ana.role, 'patient')
+        self.assertEqual(ana.dni, '11111111')
+        self.assertEqual(ana.patient_profile.blood_type, 'O+')
+        self.assertTrue(ana.check_password('secreto123'))
+        self.assertEqual(User.objects.get_by_dni('11111111'), ana)
+
+        luis = User.objects.get(email='luis@import.com')
+        self.assertFalse(luis.has_usable_password())
+        self.assertEqual(
+            NotificationPreference.objects.filter(user__in=[ana, luis]).count(), 2
+        )
+        self.assertTrue(PatientSearchEntry.objects.filter(user=luis).exists())
+
+    def test_ndjson_checks_existing_users(self):
+        """Email y DNI existentes se rechazan; un username ocupado usa el email"""
+        self.patient.dni = '44444444'
+        self.patient.save()
+        content = '\n'.join([
+            '{"email": "%s", "first_name": "A", "last_name": "B", "phone": "+51900000001"}' % self.patient.email,
+            '{"email": "otro@import.com", "first_name": "C", "last_name": "D", "phone": "+51900000002", "dni": "44444444"}',
+            '{"email": "%s@otro.com", "first_name": "E", "last_name": "F", "phone": "+51900000003"}' % self.patient.username,
+            'no es json',
+        ])
+
+        with self.assertNumQueries(12):
+            summary = self._import(content, 'ndjson')
+
+        self.assertEqual(summary['created'], 1)
+        self.assertEqual([result['row'] for result in summary['error_rows']], [1, 2, 4])
+        created = User.objects.get(email=f'{self.patient.username}@otro.com')
+        self.assertEqual(created.username, created.email)
+
+    def test_pool_hashes_batch(self):
+        """Los hashes del lote se calculan en el pool cuando está activo"""
+        from .services import PasswordHashingService
+
+        self.addCleanup(PasswordHashingService.shutdown)
+        with override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_MAX_PENDING=1):
+            hashes = PasswordHashingService.make_passwords(['uno12345', 'dos12345', None])
+            stats = PasswordHashingService.stats()
+
+        self.assertEqual(stats['workers'], 1)
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertTrue(User(password=hashes[0]).check_password('uno12345'))
+        self.assertFalse(User(password=hashes[2]).has_usable_password())
+
+    def test_import_endpoint(self):
+        """El endpoint acepta ficheros de recepcionistas y administradores"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        url = reverse('patient_import')
+        upload = SimpleUploadedFile('pacientes.csv', self.CSV.encode('utf-8'), content_type='text/csv')
+
+        self.authenticate(self.patient)
+        self.assertForbidden(self.client.post(url, {'file': upload}, format='multipart'))
+
+        upload.seek(0)
+        self.authenticate(self.admin_user)
+        response = self.client.post(url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(response.data['errors'], 2)
+
+
+class TwoFactorTokenTests(BaseAPITestCase):
+    """Tests para los tokens de respaldo con hash y la caché de códigos TOTP usados"""
+
+    def setUp(self):
+        from .services import TwoFactorService
+
+        super().setUp()
+        secret, self.backup_tokens, _ = TwoFactorService.enable_two_factor(self.patient)
+        self.patient.two_factor_enabled = True
+        self.patient.save()
+        self.totp = pyotp.TOTP(secret)
+        self.url = reverse('verify_2fa')
+
+    def test_tokens_stored_as_hashes(self):
+        """Solo se guardan prefijo y HMAC con sal de cada token"""
+        rows = list(self.patient.backup_codes.values_list('prefix', 'token_hash'))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(len({prefix for prefix, _ in rows}), 10)
+        for token in self.backup_tokens:
+            self.assertRegex(token, r'^[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}$')
+            self.assertNotIn(token.replace('-', ''), {token_hash for _, token_hash in rows})
+
+    def test_backup_token_consumed_once(self):
+        """Un token de respaldo se consume con un UPDATE condicional y no se reutiliza"""
+        from .services import TwoFactorService
+
+        token = self.backup_tokens[0].lower().replace('-', ' ')
+        with self.assertNumQueries(2):
+            self.assertTrue(TwoFactorService.consume_backup_token(self.patient, token))
+        self.assertFalse(TwoFactorService.consume_backup_token(self.patient, token))
+        self.assertFalse(TwoFactorService.consume_backup_token(self.patient, 'FFFF-0000-0000'))
+        self.assertEqual(TwoFactorService.remaining_backup_tokens(self.patient), 9)
+
+    def test_verify_with_backup_token(self):
+        """El login con token de respaldo informa de los tokens restantes"""
+        response = self.client.post(self.url, {'email': self.patient.email, 'token': self.backup_tokens[1]})
+        self.assertSuccess(response)
+        self.assertEqual(response.data['warning'], 'Te quedan 9 tokens de respaldo')
+
+        response = self.client.post(self.url, {'email': self.patient.email, 'token': self.backup_tokens[1]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_totp_code_not_replayed(self):
+        """Un código TOTP solo se acepta una vez"""
+        code = self.totp.now()
+        self.assertSuccess(self.client.post(self.url, {'email': self.patient.email, 'token': code}))
+
+        response = self.client.post(self.url, {'email': self.patient.email, 'token': code})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_previous_window_accepted(self):
+        """Se mantiene el margen de una ventana de 30 segundos"""
+        from .services import TwoFactorService
+
+        previous = self.totp.at(time_module.time() - self.totp.interval)
+        self.assertTrue(TwoFactorService.verify_token(self.patient.two_factor_secret, previous))
+        self.assertFalse(TwoFactorService.verify_token(self.patient.two_factor_secret, '000000x'))
+
+    def test_disable_removes_tokens(self):
+        """Desactivar 2FA borra los tokens de respaldo"""
+        from .services import TwoFactorService
+
+        TwoFactorService.disable_two_factor(self.patient)
+        self.assertFalse(self.patient.backup_codes.exists())
@@ -4,7 +4,8 @@ from .views import (
     CustomTokenObtainPairView, DesktopTokenObtainPairView, RegisterView, ProfileView,
     ChangePasswordView, UserListView, Enable2FAView, Confirm2FAView,
     Disable2FAView, Verify2FAView, RegenerateBackupTokensView,
-    CheckEmailView, CheckDNIView, PatientListView, PatientDetailView, PatientSearchView
+    CheckEmailView, CheckDNIView, PatientListView, PatientDetailView, PatientSearchView,
+    PasswordHashingStatsView, PatientImportView
 )
 
 urlpatterns = [
@@ -18,6 +19,7 @@ urlpatterns = [
     path('profile/', ProfileView.as_view(), name='profile'),
     path('change-password/', ChangePasswordView.as_view(), name='change_password'),
     path('users/', UserListView.as_view(), name='user_list'),
+    path('password-hashing-stats/', PasswordHashingStatsView.as_view(), name='password_hashing_stats'),
     
     # Two-Factor Authentication
     path('2fa/enable/', Enable2FAView.as_view(), name='enable_2fa'),
@@ -34,4 +36,5 @@ urlpatterns = [
     path('patients/', PatientListView.as_view(), name='patient_list'),
     path('patients/<int:pk>/', PatientDetailView.as_view(), name='patient_detail'),
     path('patients/search/', PatientSearchView.as_view(), name='patient_search'),
+    path('patients/import/', PatientImportView.as_view(), name='patient_import'),
 ]
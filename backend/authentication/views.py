@@ -1,26 +1,68 @@
 from rest_framework import generics, status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.parsers import FormParser, MultiPartParser
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import OuterRef, Q, Subquery
 from datetime import datetime, date
 from .serializers import (
     UserSerializer, RegisterSerializer, ChangePasswordSerializer,
     CustomTokenObtainPairSerializer, DesktopTokenObtainPairSerializer
 )
-from .services import TwoFactorService
+from .services import PasswordHashingService, TwoFactorService
+from .fields import blind_index
+from .login_protection import LoginAttemptWriter, LoginThrottle, client_ip
+from .models import calculate_age
+from .search import matching_entries, search_patient_ids
+from .imports import FORMATS, detect_format, import_patients
+from appointments.permissions import IsReceptionistOrAdmin
 
 User = get_user_model()
 
 
-class CustomTokenObtainPairView(TokenObtainPairView):
+class LoginThrottleMixin:
+    """
+    Bloqueo por fallos recientes del email o de la IP.
+    
+    El bloqueo se comprueba antes de validar credenciales, así que un intento
+    bloqueado no consulta la base de datos ni calcula el hash.
+    """
+    
+    def post(self, request, *args, **kwargs):
+        email = request.data.get('email', '') if hasattr(request.data, 'get') else ''
+        ip = client_ip(request)
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        
+        retry_after = LoginThrottle.retry_after(email, ip)
+        if retry_after:
+            return Response(
+                {'detail': 'Demasiados intentos fallidos. Intente de nuevo más tarde.', 'retry_after': retry_after},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(retry_after)}
+            )
+        
+        try:
+            response = super().post(request, *args, **kwargs)
+        except AuthenticationFailed:
+            LoginThrottle.record_failure(email, ip)
+            LoginAttemptWriter.record(email, ip, user_agent, success=False)
+            raise
+        
+        if response.status_code == status.HTTP_200_OK:
+            LoginThrottle.reset(email)
+            LoginAttemptWriter.record(email, ip, user_agent, success=True)
+        return response
+
+
+class CustomTokenObtainPairView(LoginThrottleMixin, TokenObtainPairView):
     """Vista personalizada para obtención de tokens JWT - Frontend Web (solo pacientes)"""
     serializer_class = CustomTokenObtainPairSerializer
 
 
-class DesktopTokenObtainPairView(TokenObtainPairView):
+class DesktopTokenObtainPairView(LoginThrottleMixin, TokenObtainPairView):
     """Vista personalizada para obtención de tokens JWT - Frontend Desktop (personal médico y administrativo)"""
     serializer_class = DesktopTokenObtainPairSerializer
 
@@ -62,6 +104,14 @@ class ChangePasswordView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class PasswordHashingStatsView(APIView):
+    """Profundidad de la cola del pool de hashing de contraseñas (solo administradores)"""
+    permission_classes = (permissions.IsAuthenticated, permissions.IsAdminUser)
+    
+    def get(self, request):
+        return Response(PasswordHashingService.stats())
+
+
 class UserListView(generics.ListAPIView):
     """Vista para listar usuarios (solo para administradores)"""
     serializer_class = UserSerializer
@@ -198,18 +248,13 @@ class Verify2FAView(APIView):
             
             return Response(response_data, status=status.HTTP_200_OK)
         
-        # Intentar verificar con código TOTP
-        if TwoFactorService.verify_token(user.two_factor_secret, token):
+        # Intentar verificar con código TOTP (cada código solo se acepta una vez)
+        if TwoFactorService.verify_user_token(user, token):
             return generate_success_response(user)
         
         # Si no funciona, intentar con token de respaldo
-        is_valid, used_token = TwoFactorService.verify_backup_token(user.backup_tokens, token)
-        if is_valid:
-            # Remover el token usado
-            user.backup_tokens.remove(used_token)
-            user.save()
-            
-            warning = f'Te quedan {len(user.backup_tokens)} tokens de respaldo'
+        if TwoFactorService.consume_backup_token(user, token):
+            warning = f'Te quedan {TwoFactorService.remaining_backup_tokens(user)} tokens de respaldo'
             return generate_success_response(
                 user, 
                 'Token de respaldo verificado exitosamente',
@@ -279,8 +324,8 @@ class CheckDNIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Verificar si el DNI ya existe
-        dni_exists = User.objects.filter(dni=dni).exists()
+        # Verificar si el DNI ya existe (igualdad sobre el índice ciego)
+        dni_exists = User.objects.filter(dni_hash=blind_index(dni)).exists()
         
         return Response({
             'exists': dni_exists,
@@ -304,12 +349,11 @@ class PatientListView(generics.ListCreateAPIView):
         # Filtro de búsqueda
         search = self.request.query_params.get('search', None)
         if search:
+            # Índice de búsqueda para nombre, teléfono y email; el DNI está
+            # encriptado y solo admite coincidencia exacta por índice ciego
             queryset = queryset.filter(
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(dni__icontains=search) |
-                Q(phone__icontains=search) |
-                Q(email__icontains=search)
+                Q(pk__in=matching_entries(search).values('user_id')) |
+                Q(dni_hash=blind_index(search))
             )
         
         # Filtro por género
@@ -346,48 +390,72 @@ class PatientListView(generics.ListCreateAPIView):
         
         return queryset.select_related('patient_profile').order_by('-date_joined')
     
+    # Columnas del listado; la página se construye con .values() sin instanciar modelos
+    LIST_FIELDS = (
+        'id', 'first_name', 'last_name', 'dni', 'email', 'phone', 'gender',
+        'date_of_birth', 'birth_date', 'address', 'city', 'state', 'date_joined', 'is_active',
+        'patient_profile__id', 'patient_profile__blood_type',
+        'patient_profile__allergies', 'patient_profile__chronic_conditions',
+    )
+    
+    def with_last_appointment(self, queryset):
+        """Anotar la última cita de cada paciente con subconsultas correlacionadas"""
+        from appointments.models import Appointment
+        last = Appointment.objects.filter(
+            patient=OuterRef('pk')
+        ).order_by('-appointment_date', '-appointment_time')
+        return queryset.annotate(**{
+            f'last_appointment_{name}': Subquery(last.values(field)[:1])
+            for name, field in (
+                ('date', 'appointment_date'),
+                ('time', 'appointment_time'),
+                ('doctor_first_name', 'doctor__first_name'),
+                ('doctor_last_name', 'doctor__last_name'),
+            )
+        })
+    
     def list(self, request, *args, **kwargs):
         """Listar pacientes con paginación"""
         queryset = self.get_queryset()
-        page = self.paginate_queryset(queryset)
+        page = self.paginate_queryset(
+            self.with_last_appointment(queryset).values(
+                *self.LIST_FIELDS,
+                'last_appointment_date', 'last_appointment_time',
+                'last_appointment_doctor_first_name', 'last_appointment_doctor_last_name'
+            )
+        )
         
         if page is not None:
             # Agregar información adicional de cada paciente
             patients_data = []
-            for patient in page:
-                # Obtener última cita
-                from appointments.models import Appointment
-                last_appointment = Appointment.objects.filter(
-                    patient=patient
-                ).order_by('-appointment_date', '-appointment_time').first()
-                
+            for row in page:
                 patient_data = {
-                    'id': patient.id,
-                    'first_name': patient.first_name,
-                    'last_name': patient.last_name,
-                    'dni': patient.dni,
-                    'email': patient.email,
-                    'phone': patient.phone,
-                    'gender': patient.gender,
-                    'date_of_birth': patient.date_of_birth,
-                    'birth_date': patient.birth_date,  # Campo alternativo
-                    'address': patient.address,
-                    'city': patient.city,
-                    'state': patient.state,
-                    'date_joined': patient.date_joined,
-                    'is_active': patient.is_active,
-                    'age': patient.age,
+                    'id': row['id'],
+                    'first_name': row['first_name'],
+                    'last_name': row['last_name'],
+                    'dni': row['dni'],
+                    'email': row['email'],
+                    'phone': row['phone'],
+                    'gender': row['gender'],
+                    'date_of_birth': row['date_of_birth'],
+                    'birth_date': row['birth_date'],  # Campo alternativo
+                    'address': row['address'],
+                    'city': row['city'],
+                    'state': row['state'],
+                    'date_joined': row['date_joined'],
+                    'is_active': row['is_active'],
+                    'age': calculate_age(row['date_of_birth'] or row['birth_date']),
                     'last_appointment': {
-                        'date': last_appointment.appointment_date.strftime('%Y-%m-%d') if last_appointment else None,
-                        'time': last_appointment.appointment_time.strftime('%H:%M') if last_appointment else None,
-                        'doctor': f"{last_appointment.doctor.first_name} {last_appointment.doctor.last_name}" if last_appointment else None
-                    } if last_appointment else None,
+                        'date': row['last_appointment_date'].strftime('%Y-%m-%d'),
+                        'time': row['last_appointment_time'].strftime('%H:%M'),
+                        'doctor': f"{row['last_appointment_doctor_first_name']} {row['last_appointment_doctor_last_name']}"
+                    } if row['last_appointment_date'] else None,
                     # Información del perfil de paciente si existe
                     'patient_profile': {
-                        'blood_type': getattr(patient, 'patient_profile', {}).blood_type if hasattr(patient, 'patient_profile') and patient.patient_profile else None,
-                        'allergies': getattr(patient, 'patient_profile', {}).allergies if hasattr(patient, 'patient_profile') and patient.patient_profile else None,
-                        'chronic_conditions': getattr(patient, 'patient_profile', {}).chronic_conditions if hasattr(patient, 'patient_profile') and patient.patient_profile else None,
-                    } if hasattr(patient, 'patient_profile') and patient.patient_profile else None
+                        'blood_type': row['patient_profile__blood_type'],
+                        'allergies': row['patient_profile__allergies'],
+                        'chronic_conditions': row['patient_profile__chronic_conditions'],
+                    } if row['patient_profile__id'] else None
                 }
                 patients_data.append(patient_data)
             
@@ -402,6 +470,33 @@ class PatientListView(generics.ListCreateAPIView):
         serializer.save(role='patient')
 
 
+class PatientImportView(APIView):
+    """Importación masiva de pacientes desde un fichero CSV o NDJSON"""
+    permission_classes = (IsReceptionistOrAdmin,)
+    parser_classes = (MultiPartParser, FormParser)
+    
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Se requiere un fichero en el campo "file"'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        fmt = request.data.get('format') or detect_format(upload.name)
+        if fmt not in FORMATS:
+            return Response(
+                {'error': f'Formato no soportado; use uno de: {", ".join(FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        summary = import_patients(upload, fmt)
+        if not summary['errors']:
+            response_status = status.HTTP_201_CREATED
+        elif not summary['created']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(summary, status=response_status)
+
+
 class PatientDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Vista para obtener, actualizar o eliminar un paciente específico"""
     serializer_class = UserSerializer
@@ -481,15 +576,18 @@ class PatientSearchView(APIView):
                 'message': 'Ingresa al menos 2 caracteres para buscar'
             })
         
+        # Índice de búsqueda ordenado por relevancia; una coincidencia exacta
+        # de DNI (índice ciego) va primero
+        ranked_ids = search_patient_ids(query, limit=10)
+        ranking = {patient_id: position for position, patient_id in enumerate(ranked_ids)}
         patients = User.objects.filter(
             role='patient',
             is_active=True
         ).filter(
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(dni__icontains=query) |
-            Q(phone__icontains=query)
-        )[:10]  # Limitar a 10 resultados
+            Q(pk__in=ranked_ids) |
+            Q(dni_hash=blind_index(query))
+        )
+        patients = sorted(patients, key=lambda patient: ranking.get(patient.id, -1))[:10]
         
         results = []
         for patient in patients:
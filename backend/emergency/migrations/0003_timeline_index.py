@@ -0,0 +1,22 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emergency", "0002_emergencytreatment_triageassessment"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="emergencycase",
+            index=models.Index(
+                fields=["patient", "arrival_time", "id"],
+                name="emergency_patient_arrival_id",
+            ),
+        ),
+    ]
@@ -93,6 +93,7 @@ class EmergencyCase(models.Model):
         indexes = [
             models.Index(fields=['status', 'triage_level']),
             models.Index(fields=['arrival_time']),
+            models.Index(fields=['patient', 'arrival_time', 'id'], name='emergency_patient_arrival_id'),
         ]
     
     @property
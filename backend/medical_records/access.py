@@ -0,0 +1,43 @@
+"""
+Acceso al historial clínico por rol.
+
+La misma política rige la búsqueda clínica y los endpoints que reciben
+``patient_id`` (resumen, expediente, línea de tiempo, estadísticas y
+tendencias de signos vitales): el paciente solo se ve a sí mismo, los roles
+clínicos ven a todos y los roles tratantes solo a los pacientes con los que
+tienen relación asistencial (una entrada clínica propia o una cita).
+"""
+from django.db.models import Q
+
+from appointments.models import Appointment
+
+from .models import ClinicalSearchEntry
+
+# Roles que ven todo el texto clínico, solo el de sus pacientes o solo algunas fuentes
+CLINICAL_ROLES = ('admin', 'nurse', 'emergency')
+TREATING_ROLES = ('doctor', 'obstetriz', 'odontologo')
+SOURCE_ROLES = {'pharmacist': ('prescription',)}
+
+
+def care_relationship(user, field='patient_id'):
+    """Filtro de los pacientes con los que ``user`` tiene relación asistencial"""
+    return (
+        Q(**{f'{field}__in': ClinicalSearchEntry.objects.filter(author=user).values('patient_id')}) |
+        Q(**{f'{field}__in': Appointment.objects.filter(doctor=user).values('patient_id')})
+    )
+
+
+def can_access_patient(user, patient_id):
+    """Si ``user`` puede consultar el historial completo del paciente"""
+    role = getattr(user, 'role', None)
+    if role == 'patient':
+        return user.id == patient_id
+    if role in CLINICAL_ROLES or user.is_superuser:
+        return True
+    if role in TREATING_ROLES:
+        return (
+            ClinicalSearchEntry.objects.filter(author=user, patient_id=patient_id).exists() or
+            Appointment.objects.filter(doctor=user, patient_id=patient_id).exists()
+        )
+    # Recepción, farmacia (solo sus fuentes en la búsqueda) y demás roles
+    return False
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from medical_records.search import rebuild_clinical_search
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de texto completo del historial clínico'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Registros indexados por bloque'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_clinical_search(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Índice de búsqueda clínica reconstruido con {total} entradas')
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from medical_records.summary import rebuild_health_summaries
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el resumen de salud de todos los pacientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Pacientes recalculados por bloque'
+        )
+
+    def handle(self, *args, **options):
+        total = rebuild_health_summaries(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Resumen de salud reconstruido para {total} pacientes')
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from medical_records.vitals import rebuild_vital_signs_rollups
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los agregados por hora, día y semana de los signos vitales'
+
+    def handle(self, *args, **options):
+        total = rebuild_vital_signs_rollups()
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Agregados de signos vitales reconstruidos para {total} pacientes')
+        )
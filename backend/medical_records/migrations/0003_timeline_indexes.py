@@ -0,0 +1,52 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("appointments", "0010_doctor_directory"),
+        (
+            "medical_records",
+            "0002_alter_prescription_doctor_alter_prescription_patient",
+        ),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="allergy",
+            index=models.Index(
+                fields=["patient", "created_at", "id"],
+                name="allergy_patient_created_id",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="labtest",
+            index=models.Index(
+                fields=["patient", "ordered_date", "id"],
+                name="labtest_patient_ordered_id",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="medicalrecord",
+            index=models.Index(
+                fields=["patient", "created_at", "id"], name="medrec_patient_created_id"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prescription",
+            index=models.Index(
+                fields=["patient", "issue_date", "id"], name="rx_patient_issued_id"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="vitalsigns",
+            index=models.Index(
+                fields=["patient", "recorded_at", "id"],
+                name="vitals_patient_recorded_id",
+            ),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0013_backup_token_store"),
+        ("medical_records", "0003_timeline_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PatientHealthSummary",
+            fields=[
+                (
+                    "patient",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="health_summary",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("total_consultations", models.PositiveIntegerField(default=0)),
+                ("consultations_this_year", models.PositiveIntegerField(default=0)),
+                (
+                    "consultations_year",
+                    models.PositiveIntegerField(blank=True, null=True),
+                ),
+                ("last_consultation_date", models.DateField(blank=True, null=True)),
+                ("active_treatments", models.PositiveIntegerField(default=0)),
+                ("completed_treatments", models.PositiveIntegerField(default=0)),
+                ("next_treatment_expiry", models.DateField(blank=True, null=True)),
+                ("pending_exams", models.PositiveIntegerField(default=0)),
+                ("allergies_count", models.PositiveIntegerField(default=0)),
+                ("last_vital_signs", models.JSONField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Resumen de Salud",
+                "verbose_name_plural": "Resúmenes de Salud",
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.3 on 2026-10-17 00:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("medical_records", "0004_patient_health_summary"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VitalSignsRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("hour", "Hora"), ("day", "Día"), ("week", "Semana")],
+                        max_length=4,
+                    ),
+                ),
+                ("bucket_start", models.DateTimeField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("blood_pressure_systolic_min", models.FloatField()),
+                ("blood_pressure_systolic_max", models.FloatField()),
+                ("blood_pressure_systolic_sum", models.FloatField()),
+                ("blood_pressure_diastolic_min", models.FloatField()),
+                ("blood_pressure_diastolic_max", models.FloatField()),
+                ("blood_pressure_diastolic_sum", models.FloatField()),
+                ("heart_rate_min", models.FloatField()),
+                ("heart_rate_max", models.FloatField()),
+                ("heart_rate_sum", models.FloatField()),
+                ("respiratory_rate_min", models.FloatField()),
+                ("respiratory_rate_max", models.FloatField()),
+                ("respiratory_rate_sum", models.FloatField()),
+                ("temperature_min", models.FloatField()),
+                ("temperature_max", models.FloatField()),
+                ("temperature_sum", models.FloatField()),
+                ("oxygen_saturation_min", models.FloatField()),
+                ("oxygen_saturation_max", models.FloatField()),
+                ("oxygen_saturation_sum", models.FloatField()),
+                ("weight_min", models.FloatField()),
+                ("weight_max", models.FloatField()),
+                ("weight_sum", models.FloatField()),
+                ("bmi_min", models.FloatField()),
+                ("bmi_max", models.FloatField()),
+                ("bmi_sum", models.FloatField()),
+                (
+                    "patient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="vital_signs_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Agregado de Signos Vitales",
+                "verbose_name_plural": "Agregados de Signos Vitales",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("patient", "resolution", "bucket_start"),
+                        name="vitals_rollup_bucket",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -34,6 +34,10 @@ class MedicalRecord(models.Model):
         verbose_name = 'Registro Médico'
         verbose_name_plural = 'Registros Médicos'
         ordering = ['-record_date', '-created_at']
+        indexes = [
+            # Línea de tiempo del paciente (ver timeline.py)
+            models.Index(fields=['patient', 'created_at', 'id'], name='medrec_patient_created_id'),
+        ]
 
     def __str__(self):
         return f"Registro de {self.patient.get_full_name()} - {self.record_date}"
@@ -84,6 +88,7 @@ class Prescription(models.Model):
         indexes = [
             models.Index(fields=['patient', 'is_active']),
             models.Index(fields=['doctor', 'issue_date']),
+            models.Index(fields=['patient', 'issue_date', 'id'], name='rx_patient_issued_id'),
         ]
 
     def __str__(self):
@@ -209,6 +214,9 @@ class VitalSigns(models.Model):
         verbose_name = 'Signos Vitales'
         verbose_name_plural = 'Signos Vitales'
         ordering = ['-recorded_at']
+        indexes = [
+            models.Index(fields=['patient', 'recorded_at', 'id'], name='vitals_patient_recorded_id'),
+        ]
 
     def __str__(self):
         return f"Signos vitales de {self.patient.get_full_name()} - {self.recorded_at}"
@@ -279,6 +287,9 @@ class Allergy(models.Model):
         verbose_name = 'Alergia'
         verbose_name_plural = 'Alergias'
         ordering = ['-severity', 'allergen']
+        indexes = [
+            models.Index(fields=['patient', 'created_at', 'id'], name='allergy_patient_created_id'),
+        ]
         unique_together = ['patient', 'allergen']
 
     def __str__(self):
@@ -366,6 +377,7 @@ class LabTest(models.Model):
         indexes = [
             models.Index(fields=['patient', 'status']),
             models.Index(fields=['ordered_date']),
+            models.Index(fields=['patient', 'ordered_date', 'id'], name='labtest_patient_ordered_id'),
         ]
 
     def __str__(self):
@@ -402,3 +414,235 @@ class MedicalDocument(models.Model):
 
     def __str__(self):
         return f"{self.document_name} - {self.record.patient.get_full_name()}"
+
+
+class PatientHealthSummary(models.Model):
+    """
+    Resumen de salud del paciente para el portal.
+
+    Se mantiene por partes desde las señales de cada modelo (ver
+    ``summary.py``): un cambio en una receta solo recalcula los campos de
+    recetas de ese paciente.
+    """
+    patient = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='health_summary'
+    )
+    total_consultations = models.PositiveIntegerField(default=0)
+    consultations_this_year = models.PositiveIntegerField(default=0)
+    # Año al que se refiere consultations_this_year
+    consultations_year = models.PositiveIntegerField(null=True, blank=True)
+    last_consultation_date = models.DateField(null=True, blank=True)
+    active_treatments = models.PositiveIntegerField(default=0)
+    completed_treatments = models.PositiveIntegerField(default=0)
+    # Primera fecha de vencimiento entre las recetas activas
+    next_treatment_expiry = models.DateField(null=True, blank=True)
+    pending_exams = models.PositiveIntegerField(default=0)
+    allergies_count = models.PositiveIntegerField(default=0)
+    last_vital_signs = models.JSONField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Resumen de Salud'
+        verbose_name_plural = 'Resúmenes de Salud'
+
+    def __str__(self):
+        return f"Resumen de salud de {self.patient_id}"
+
+
+class VitalSignsRollup(models.Model):
+    """
+    Agregados de signos vitales por paciente y periodo (hora, día o semana).
+
+    Se guardan mínimo, máximo y suma de cada métrica; el promedio es
+    ``suma / count``, lo que permite sumar una lectura nueva con un
+    ``UPDATE`` atómico (ver ``vitals.py``).
+    """
+    RESOLUTION_CHOICES = [
+        ('hour', 'Hora'),
+        ('day', 'Día'),
+        ('week', 'Semana'),
+    ]
+    METRICS = (
+        'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'respiratory_rate',
+        'temperature', 'oxygen_saturation', 'weight', 'bmi',
+    )
+
+    patient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='vital_signs_rollups'
+    )
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES)
+    # Inicio del periodo en la zona horaria local
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    blood_pressure_systolic_min = models.FloatField()
+    blood_pressure_systolic_max = models.FloatField()
+    blood_pressure_systolic_sum = models.FloatField()
+    blood_pressure_diastolic_min = models.FloatField()
+    blood_pressure_diastolic_max = models.FloatField()
+    blood_pressure_diastolic_sum = models.FloatField()
+    heart_rate_min = models.FloatField()
+    heart_rate_max = models.FloatField()
+    heart_rate_sum = models.FloatField()
+    respiratory_rate_min = models.FloatField()
+    respiratory_rate_max = models.FloatField()
+    respiratory_rate_sum = models.FloatField()
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_sum = models.FloatField()
+    oxygen_saturation_min = models.FloatField()
+    oxygen_saturation_max = models.FloatField()
+    oxygen_saturation_sum = models.FloatField()
+    weight_min = models.FloatField()
+    weight_max = models.FloatField()
+    weight_sum = models.FloatField()
+    bmi_min = models.FloatField()
+    bmi_max = models.FloatField()
+    bmi_sum = models.FloatField()
+
+    class Meta:
+        verbose_name = 'Agregado de Signos Vitales'
+        verbose_name_plural = 'Agregados de Signos Vitales'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['patient', 'resolution', 'bucket_start'],
+                name='vitals_rollup_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Signos vitales de {self.patient_id} ({self.resolution} {self.bucket_start})"
+
+
+class ClinicalSearchEntry(models.Model):
+    """
+    Texto clínico indexado para la búsqueda de texto completo.
+
+    Hay una entrada por consulta, receta, emergencia o examen con texto. El
+    índice vive fuera del modelo (ver ``search.py``): en PostgreSQL es una
+    columna ``tsvector`` generada con un índice GIN, y en SQLite una tabla
+    FTS5 sincronizada con triggers.
+    """
+    SOURCE_CHOICES = [
+        ('consultation', 'Consulta'),
+        ('prescription', 'Receta'),
+        ('emergency', 'Emergencia'),
+        ('lab', 'Examen de laboratorio'),
+    ]
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    patient = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='clinical_search_entries'
+    )
+    # Médico responsable, para limitar la búsqueda de cada doctor
+    author = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='authored_search_entries'
+    )
+    date = models.DateTimeField()
+    title = models.CharField(max_length=255)
+    document = models.TextField()
+
+    class Meta:
+        verbose_name = 'Entrada de búsqueda clínica'
+        verbose_name_plural = 'Entradas de búsqueda clínica'
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'object_id'], name='clinical_search_source_object'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'date'], name='clinical_search_patient_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.object_id}: {self.title}"
+
+
+class StoredFile(models.Model):
+    """
+    Contenido de un archivo subido, direccionado por su SHA-256.
+
+    Los documentos y resultados que suben el mismo contenido apuntan al
+    mismo archivo (``cas/ab/cd/<sha256>.<ext>``), que se guarda una sola vez.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to='cas/', max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Archivo Almacenado'
+        verbose_name_plural = 'Archivos Almacenados'
+
+    def __str__(self):
+        return f"{self.sha256} ({self.size} bytes)"
+
+
+class UploadSession(models.Model):
+    """Subida por partes de un documento médico o de un resultado de laboratorio"""
+    TARGET_CHOICES = [
+        ('medical_document', 'Documento médico'),
+        ('lab_result', 'Resultado de laboratorio'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pendiente'),
+        ('completed', 'Completada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    record = models.ForeignKey(
+        MedicalRecord,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='upload_sessions'
+    )
+    lab_test = models.ForeignKey(
+        LabTest,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='upload_sessions'
+    )
+    document_name = models.CharField(max_length=255, blank=True)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True)
+    size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Resultado de la subida, para que repetir "complete" sea idempotente
+    stored_file = models.ForeignKey(StoredFile, on_delete=models.SET_NULL, null=True, blank=True)
+    document = models.ForeignKey(MedicalDocument, on_delete=models.SET_NULL, null=True, blank=True)
+    deduplicated = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Subida por Partes'
+        verbose_name_plural = 'Subidas por Partes'
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='upload_status_expires'),
+        ]
+
+    def __str__(self):
+        return f"Subida {self.id} - {self.filename}"
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
@@ -0,0 +1,240 @@
+"""
+Búsqueda de texto completo en el historial clínico.
+
+Diagnósticos, tratamientos, notas, recetas, altas de emergencia y resultados
+de laboratorio se copian a ``ClinicalSearchEntry`` al guardarse (ver
+``signals.py``). En PostgreSQL la tabla tiene una columna ``tsvector``
+generada con la configuración ``spanish`` (título con peso A) y un índice
+GIN; la consulta usa ``websearch_to_tsquery``, ``ts_rank_cd`` y
+``ts_headline``. En SQLite, para desarrollo y pruebas, una tabla FTS5 de
+contenido externo se mantiene con triggers y se consulta con ``bm25`` y
+``snippet``; al no haber lematizador español, cada palabra se busca como
+prefijo de su raíz aproximada.
+"""
+import html
+import logging
+import re
+from collections import namedtuple
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVectorField
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
+
+from authentication.search import normalize
+from emergency.models import EmergencyCase
+
+from .access import CLINICAL_ROLES, SOURCE_ROLES, TREATING_ROLES, care_relationship
+from .models import ClinicalSearchEntry, LabTest, MedicalRecord, Prescription
+
+logger = logging.getLogger(__name__)
+
+TABLE = ClinicalSearchEntry._meta.db_table
+FTS_TABLE = f'{TABLE}_fts'
+SEARCH_CONFIG = 'spanish'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+# Marcas de resaltado; se cambian por <mark> después de escapar el texto
+START_MARK = '\ue000'
+STOP_MARK = '\ue001'
+
+SearchSource = namedtuple('SearchSource', ['model', 'author', 'date', 'title', 'fields'])
+
+SOURCES = {
+    'consultation': SearchSource(
+        MedicalRecord, 'doctor_id', 'created_at', 'diagnosis', ('diagnosis', 'treatment', 'notes')
+    ),
+    'prescription': SearchSource(Prescription, 'doctor_id', 'issue_date', 'diagnosis', ('diagnosis',)),
+    'emergency': SearchSource(
+        EmergencyCase, 'attending_doctor_id', 'arrival_time', 'discharge_diagnosis', ('discharge_diagnosis',)
+    ),
+    'lab': SearchSource(LabTest, 'ordered_by_id', 'ordered_date', 'test_name', ('results',)),
+}
+SOURCE_BY_MODEL = {source.model: name for name, source in SOURCES.items()}
+ENTRY_FIELDS = ('patient_id', 'author_id', 'date', 'title', 'document')
+
+POSTGRES_INDEX_SQL = [
+    f"ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(document, '')), 'B')) STORED",
+    f"CREATE INDEX IF NOT EXISTS clinical_search_vector_gin ON {TABLE} USING gin (search_vector)",
+]
+SQLITE_INDEX_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, document, content='{TABLE}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, document) VALUES (new.id, new.title, new.document); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, document) "
+    f"VALUES ('delete', old.id, old.title, old.document); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON {TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, document) "
+    f"VALUES ('delete', old.id, old.title, old.document); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, document) VALUES (new.id, new.title, new.document); END",
+]
+
+
+def install_search_index(target=connection):
+    """Crear el índice de texto completo de la base de datos (idempotente)"""
+    if TABLE not in target.introspection.table_names():
+        # Migraciones revertidas por debajo de la tabla de búsqueda
+        return
+    statements = {'postgresql': POSTGRES_INDEX_SQL, 'sqlite': SQLITE_INDEX_SQL}.get(target.vendor, [])
+    with target.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def _entry(name, instance):
+    """Entrada de búsqueda de ``instance``; ``None`` si no tiene texto clínico"""
+    source = SOURCES[name]
+    texts = [str(getattr(instance, field) or '').strip() for field in source.fields]
+    document = '\n'.join(text for text in texts if text)
+    if not document:
+        return None
+    title = str(getattr(instance, source.title) or '').strip().split('\n')[0]
+    return ClinicalSearchEntry(
+        source=name,
+        object_id=instance.pk,
+        patient_id=instance.patient_id,
+        author_id=getattr(instance, source.author),
+        date=getattr(instance, source.date),
+        title=(title or ClinicalSearchEntry(source=name).get_source_display())[:255],
+        document=document,
+    )
+
+
+def _write(entries):
+    ClinicalSearchEntry.objects.bulk_create(
+        entries,
+        update_conflicts=True,
+        unique_fields=['source', 'object_id'],
+        update_fields=['patient', 'author', 'date', 'title', 'document'],
+        batch_size=1000
+    )
+
+
+def index_clinical_record(instance):
+    """Crear, actualizar o borrar la entrada de búsqueda de un registro clínico"""
+    name = SOURCE_BY_MODEL[type(instance)]
+    entry = _entry(name, instance)
+    if entry is None:
+        unindex_clinical_record(instance)
+        return
+    current = ClinicalSearchEntry.objects.filter(source=name, object_id=instance.pk).values(*ENTRY_FIELDS).first()
+    if current == {field: getattr(entry, field) for field in ENTRY_FIELDS}:
+        return
+    _write([entry])
+
+
+def unindex_clinical_record(instance):
+    ClinicalSearchEntry.objects.filter(source=SOURCE_BY_MODEL[type(instance)], object_id=instance.pk).delete()
+
+
+def rebuild_clinical_search(batch_size=1000):
+    """Reindexar todo el texto clínico; devuelve el número de entradas"""
+    install_search_index()
+    total = 0
+    with transaction.atomic():
+        ClinicalSearchEntry.objects.all().delete()
+        for name, source in SOURCES.items():
+            fields = dict.fromkeys(('pk', 'patient_id', source.author, source.date, source.title) + source.fields)
+            entries = []
+            for instance in source.model.objects.only(*fields).iterator(chunk_size=batch_size):
+                entry = _entry(name, instance)
+                if entry is not None:
+                    entries.append(entry)
+                if len(entries) >= batch_size:
+                    _write(entries)
+                    total += len(entries)
+                    entries = []
+            _write(entries)
+            total += len(entries)
+    logger.info(f"Rebuilt clinical search index with {total} entries")
+    return total
+
+
+def scoped_entries(user):
+    """Entradas que ``user`` puede buscar; ``None`` si su rol no tiene acceso"""
+    entries = ClinicalSearchEntry.objects.all()
+    role = getattr(user, 'role', None)
+    if role == 'patient':
+        return entries.filter(patient=user)
+    if role in CLINICAL_ROLES or user.is_superuser:
+        return entries
+    if role in TREATING_ROLES:
+        return entries.filter(care_relationship(user))
+    if role in SOURCE_ROLES:
+        return entries.filter(source__in=SOURCE_ROLES[role])
+    return None
+
+
+def _highlight(text):
+    return html.escape(text or '').replace(START_MARK, '<mark>').replace(STOP_MARK, '</mark>')
+
+
+def _stem(word):
+    """Raíz aproximada para buscar por prefijo: sin plural ni vocal final"""
+    if len(word) > 4:
+        word = re.sub(r'(es|s)$', '', word)
+    if len(word) > 4:
+        word = re.sub(r'[aeiou]$', '', word)
+    return word
+
+
+def fts_query(query):
+    """Consulta FTS5: todas las palabras, cada una como prefijo de su raíz"""
+    words = re.findall(r'\w+', normalize(query))
+    return ' '.join(f'"{_stem(word)}"*' for word in words)
+
+
+def _search_postgres(entries, query, limit):
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    vector = RawSQL(f'{TABLE}.search_vector', [], output_field=SearchVectorField())
+    rows = entries.alias(vector=vector).filter(vector=search_query).annotate(
+        rank=SearchRank(vector, search_query, cover_density=True),
+        highlight=SearchHeadline(
+            'document', search_query, config=SEARCH_CONFIG, start_sel=START_MARK, stop_sel=STOP_MARK,
+            max_fragments=2, fragment_delimiter=' … '
+        )
+    ).select_related('patient').order_by('-rank', '-date', '-id')[:limit]
+    return [(entry, entry.rank, entry.highlight) for entry in rows]
+
+
+def _search_sqlite(entries, query, limit):
+    match = fts_query(query)
+    if not match:
+        return []
+    scope_sql, scope_params = entries.values('id').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, bm25({FTS_TABLE}, 2.0, 1.0), snippet({FTS_TABLE}, 1, %s, %s, ' … ', 24) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid IN ({scope_sql}) "
+            f"ORDER BY 2, rowid DESC LIMIT %s",
+            [START_MARK, STOP_MARK, match, *scope_params, limit]
+        )
+        hits = cursor.fetchall()
+    found = ClinicalSearchEntry.objects.select_related('patient').in_bulk([pk for pk, _, _ in hits])
+    # bm25 es menor cuanto más relevante
+    return [(found[pk], -score, snippet) for pk, score, snippet in hits if pk in found]
+
+
+def search_clinical_records(entries, query, limit=DEFAULT_LIMIT):
+    """Entradas de ``entries`` que coinciden con ``query``, ordenadas por relevancia y resaltadas"""
+    if connection.vendor == 'postgresql':
+        hits = _search_postgres(entries, query, limit)
+    else:
+        hits = _search_sqlite(entries, query, limit)
+    return [
+        {
+            'id': f'{entry.source}_{entry.object_id}',
+            'type': entry.source,
+            'source_id': entry.object_id,
+            'patient_id': entry.patient_id,
+            'patient_name': entry.patient.get_full_name(),
+            'date': entry.date.isoformat(),
+            'title': entry.title,
+            'highlight': _highlight(highlight),
+            'rank': round(float(rank), 4),
+        }
+        for entry, rank, highlight in hits
+    ]
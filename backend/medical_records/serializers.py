@@ -1,8 +1,9 @@
 from rest_framework import serializers
 from .models import (
     MedicalRecord, Allergy, Prescription, PrescriptionItem,
-    LabTest, VitalSigns, MedicalDocument
+    LabTest, VitalSigns, MedicalDocument, UploadSession
 )
+from .uploads import MAX_UPLOAD_SIZE, UPLOAD_EXTENSIONS, received_chunks
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -125,7 +126,46 @@ class MedicalSummarySerializer(serializers.Serializer):
     allergies_count = serializers.IntegerField()
     active_prescriptions = serializers.IntegerField()
     pending_lab_results = serializers.IntegerField()
-    last_visit = serializers.DateTimeField(allow_null=True)
+    last_visit = serializers.DateField(allow_null=True)
     total_visits = serializers.IntegerField()
     total_records = serializers.IntegerField()
     recent_vital_signs = RecentVitalSignsSerializer(allow_null=True)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Inicio y estado de una subida por partes"""
+    chunk_size = serializers.IntegerField(required=False, min_value=1)
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_chunks = serializers.SerializerMethodField()
+    sha256 = serializers.CharField(source='stored_file_id', read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'record', 'lab_test', 'document_name', 'filename',
+                  'content_type', 'size', 'chunk_size', 'chunk_count', 'received_chunks',
+                  'status', 'sha256', 'document', 'deduplicated', 'created_at', 'expires_at']
+        read_only_fields = ['status', 'document', 'deduplicated', 'created_at', 'expires_at']
+
+    def get_received_chunks(self, obj):
+        if obj.status == 'completed':
+            return list(range(obj.chunk_count))
+        return received_chunks(obj)
+
+    def validate_filename(self, value):
+        extension = value.rsplit('.', 1)[-1].lower() if '.' in value else ''
+        if extension not in UPLOAD_EXTENSIONS:
+            raise serializers.ValidationError(f"Extensiones permitidas: {', '.join(UPLOAD_EXTENSIONS)}")
+        return value
+
+    def validate_size(self, value):
+        if not 0 < value <= MAX_UPLOAD_SIZE:
+            raise serializers.ValidationError(f'El tamaño debe estar entre 1 y {MAX_UPLOAD_SIZE} bytes')
+        return value
+
+    def validate(self, attrs):
+        if attrs['target'] == 'medical_document':
+            if not attrs.get('record') or attrs.get('lab_test'):
+                raise serializers.ValidationError({'record': 'Los documentos médicos requieren solo record'})
+        elif not attrs.get('lab_test') or attrs.get('record'):
+            raise serializers.ValidationError({'lab_test': 'Los resultados de laboratorio requieren solo lab_test'})
+        return attrs
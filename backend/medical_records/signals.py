@@ -0,0 +1,106 @@
+from django.db import connections
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save
+from django.dispatch import receiver
+
+from emergency.models import EmergencyCase
+
+from .models import Allergy, LabTest, MedicalRecord, Prescription, VitalSigns
+from .search import index_clinical_record, install_search_index, unindex_clinical_record
+from .summary import refresh_patient_summary
+from .vitals import record_reading, refresh_buckets
+
+# Nota: las actualizaciones masivas (QuerySet.update) no emiten señales; el
+# comando rebuild_health_summaries recalcula la tabla completa, y
+# rebuild_vital_signs_rollups y rebuild_clinical_search los agregados de signos
+# vitales y el índice de búsqueda clínica.
+
+
+@receiver(post_init, sender=MedicalRecord)
+@receiver(post_init, sender=Prescription)
+@receiver(post_init, sender=LabTest)
+@receiver(post_init, sender=Allergy)
+@receiver(post_init, sender=VitalSigns)
+def remember_summary_patient(sender, instance, **kwargs):
+    """Recordar el paciente original para recalcular también su resumen"""
+    # Leer de __dict__ para no disparar consultas en campos diferidos
+    instance._summary_patient_id = instance.__dict__.get('patient_id')
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_save, sender=Prescription)
+@receiver(post_save, sender=LabTest)
+@receiver(post_save, sender=Allergy)
+@receiver(post_save, sender=VitalSigns)
+def refresh_health_summary(sender, instance, **kwargs):
+    """Recalcular solo la sección del resumen que depende del modelo"""
+    patient_ids = {instance.patient_id, getattr(instance, '_summary_patient_id', None)}
+    for patient_id in patient_ids - {None}:
+        refresh_patient_summary(patient_id, sender)
+    instance._summary_patient_id = instance.patient_id
+
+
+@receiver(post_delete, sender=MedicalRecord)
+@receiver(post_delete, sender=Prescription)
+@receiver(post_delete, sender=LabTest)
+@receiver(post_delete, sender=Allergy)
+@receiver(post_delete, sender=VitalSigns)
+def refresh_health_summary_on_delete(sender, instance, **kwargs):
+    """
+    Recalcular la sección tras un borrado.
+
+    Solo se actualizan resúmenes existentes: al borrar un paciente en cascada
+    no se debe crear uno nuevo que apunte a él.
+    """
+    refresh_patient_summary(instance.patient_id, sender, create=False)
+
+
+@receiver(post_init, sender=VitalSigns)
+def remember_vital_signs_bucket(sender, instance, **kwargs):
+    """Recordar paciente y fecha originales para recalcular sus agregados"""
+    instance._rollup_key = (instance.__dict__.get('patient_id'), instance.__dict__.get('recorded_at'))
+
+
+@receiver(post_save, sender=VitalSigns)
+def update_vital_signs_rollups(sender, instance, created, **kwargs):
+    """Sumar las lecturas nuevas; una edición recalcula los periodos afectados"""
+    if created:
+        record_reading(instance)
+    else:
+        keys = {getattr(instance, '_rollup_key', (None, None)), (instance.patient_id, instance.recorded_at)}
+        for patient_id, recorded_at in keys:
+            if patient_id is not None and recorded_at is not None:
+                refresh_buckets(patient_id, recorded_at)
+    instance._rollup_key = (instance.patient_id, instance.recorded_at)
+
+
+@receiver(post_delete, sender=VitalSigns)
+def update_vital_signs_rollups_on_delete(sender, instance, **kwargs):
+    refresh_buckets(instance.patient_id, instance.recorded_at)
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_save, sender=Prescription)
+@receiver(post_save, sender=LabTest)
+@receiver(post_save, sender=EmergencyCase)
+def update_clinical_search_index(sender, instance, **kwargs):
+    index_clinical_record(instance)
+
+
+@receiver(post_delete, sender=MedicalRecord)
+@receiver(post_delete, sender=Prescription)
+@receiver(post_delete, sender=LabTest)
+@receiver(post_delete, sender=EmergencyCase)
+def remove_from_clinical_search_index(sender, instance, **kwargs):
+    unindex_clinical_record(instance)
+
+
+@receiver(post_migrate)
+def ensure_clinical_search_index(sender, using, **kwargs):
+    """
+    Crear el índice de texto completo tras ``migrate``.
+
+    La migración ya lo crea; esto cubre las bases creadas sin migraciones,
+    como las de pruebas.
+    """
+    if sender.name == 'medical_records':
+        install_search_index(connections[using])
@@ -0,0 +1,200 @@
+"""
+Mantenimiento del resumen de salud (``PatientHealthSummary``).
+
+Cada sección del resumen se calcula a partir de un solo modelo, así que un
+cambio en una receta solo recalcula las columnas de recetas de ese
+paciente con una consulta de agregación y un ``UPDATE``. Las secciones se
+calculan para una lista de pacientes, lo que permite reconstruir la tabla
+por bloques con el mismo código.
+"""
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .models import Allergy, LabTest, MedicalRecord, PatientHealthSummary, Prescription, VitalSigns
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+PENDING_LAB_STATUSES = ('ordered', 'sample_collected', 'in_progress')
+
+
+def _consultations(patient_ids, today):
+    values = {
+        patient_id: {
+            'total_consultations': 0,
+            'consultations_this_year': 0,
+            'consultations_year': today.year,
+            'last_consultation_date': None,
+        }
+        for patient_id in patient_ids
+    }
+    rows = MedicalRecord.objects.filter(patient_id__in=patient_ids).values('patient_id').annotate(
+        total=Count('id'),
+        this_year=Count('id', filter=Q(record_date__year=today.year)),
+        last=Max('record_date')
+    ).order_by()
+    for row in rows:
+        values[row['patient_id']].update(
+            total_consultations=row['total'],
+            consultations_this_year=row['this_year'],
+            last_consultation_date=row['last']
+        )
+    return values
+
+
+def _treatments(patient_ids, today):
+    values = {
+        patient_id: {'active_treatments': 0, 'completed_treatments': 0, 'next_treatment_expiry': None}
+        for patient_id in patient_ids
+    }
+    active = Q(is_active=True, valid_until__gte=today)
+    rows = Prescription.objects.filter(patient_id__in=patient_ids).values('patient_id').annotate(
+        total=Count('id'),
+        active=Count('id', filter=active),
+        next_expiry=Min('valid_until', filter=active)
+    ).order_by()
+    for row in rows:
+        values[row['patient_id']].update(
+            active_treatments=row['active'],
+            completed_treatments=row['total'] - row['active'],
+            next_treatment_expiry=row['next_expiry']
+        )
+    return values
+
+
+def _exams(patient_ids, today):
+    values = {patient_id: {'pending_exams': 0} for patient_id in patient_ids}
+    rows = LabTest.objects.filter(
+        patient_id__in=patient_ids,
+        status__in=PENDING_LAB_STATUSES
+    ).values('patient_id').annotate(total=Count('id')).order_by()
+    for row in rows:
+        values[row['patient_id']]['pending_exams'] = row['total']
+    return values
+
+
+def _allergies(patient_ids, today):
+    values = {patient_id: {'allergies_count': 0} for patient_id in patient_ids}
+    rows = Allergy.objects.filter(
+        patient_id__in=patient_ids,
+        is_active=True
+    ).values('patient_id').annotate(total=Count('id')).order_by()
+    for row in rows:
+        values[row['patient_id']]['allergies_count'] = row['total']
+    return values
+
+
+def _vital_signs(patient_ids, today):
+    values = {patient_id: {'last_vital_signs': None} for patient_id in patient_ids}
+    latest = VitalSigns.objects.filter(patient_id=OuterRef('pk')).order_by('-recorded_at', '-id').values('id')[:1]
+    rows = VitalSigns.objects.filter(
+        id__in=User.objects.filter(pk__in=patient_ids).annotate(latest=Subquery(latest)).values('latest')
+    ).values(
+        'patient_id', 'recorded_at', 'blood_pressure_systolic', 'blood_pressure_diastolic',
+        'heart_rate', 'temperature', 'weight', 'height'
+    )
+    for row in rows:
+        values[row['patient_id']]['last_vital_signs'] = {
+            'date': row['recorded_at'].isoformat(),
+            'blood_pressure': f"{row['blood_pressure_systolic']}/{row['blood_pressure_diastolic']}",
+            'heart_rate': row['heart_rate'],
+            'temperature': float(row['temperature']),
+            'weight': float(row['weight']),
+            'height': float(row['height']),
+        }
+    return values
+
+
+# Sección del resumen que depende de cada modelo
+SECTIONS = {
+    MedicalRecord: _consultations,
+    Prescription: _treatments,
+    LabTest: _exams,
+    Allergy: _allergies,
+    VitalSigns: _vital_signs,
+}
+
+SUMMARY_FIELDS = [
+    field.name for field in PatientHealthSummary._meta.concrete_fields
+    if field.name not in ('patient', 'updated_at')
+]
+
+
+def _compute(patient_ids, models):
+    today = timezone.localdate()
+    values = {patient_id: {} for patient_id in patient_ids}
+    for model in models:
+        for patient_id, section in SECTIONS[model](patient_ids, today).items():
+            values[patient_id].update(section)
+    return values
+
+
+def _write(values):
+    """Insertar o reemplazar resúmenes completos"""
+    PatientHealthSummary.objects.bulk_create(
+        [PatientHealthSummary(patient_id=patient_id, **fields) for patient_id, fields in values.items()],
+        update_conflicts=True,
+        unique_fields=['patient'],
+        update_fields=SUMMARY_FIELDS + ['updated_at']
+    )
+
+
+def refresh_patient_summary(patient_id, *models, create=True):
+    """
+    Recalcular las secciones del resumen que dependen de ``models``.
+
+    Sin modelos, o si el paciente aún no tiene resumen, se calcula completo;
+    con ``create=False`` un resumen inexistente se deja para la próxima
+    lectura.
+    """
+    if models:
+        fields = _compute([patient_id], models)[patient_id]
+        if PatientHealthSummary.objects.filter(patient_id=patient_id).update(updated_at=timezone.now(), **fields):
+            return
+    if create:
+        _write(_compute([patient_id], SECTIONS))
+
+
+def get_patient_summary(patient_id):
+    """
+    Resumen del paciente con una lectura por clave primaria.
+
+    Solo se recalcula si no existe o si depende de la fecha: cambio de año
+    o una receta activa que ya venció.
+    """
+    summary = PatientHealthSummary.objects.filter(patient_id=patient_id).first()
+    today = timezone.localdate()
+    stale = []
+    if summary is None:
+        stale = list(SECTIONS)
+    else:
+        if summary.consultations_year != today.year:
+            stale.append(MedicalRecord)
+        if summary.next_treatment_expiry and summary.next_treatment_expiry < today:
+            stale.append(Prescription)
+    if not stale:
+        return summary
+
+    refresh_patient_summary(patient_id, *stale)
+    return PatientHealthSummary.objects.get(patient_id=patient_id)
+
+
+def rebuild_health_summaries(batch_size=500):
+    """Recalcular los resúmenes de todos los pacientes por bloques; devuelve cuántos"""
+    PatientHealthSummary.objects.exclude(patient__role='patient').delete()
+    patient_ids = User.objects.filter(role='patient').order_by('id').values_list('id', flat=True)
+    total = 0
+    last_id = 0
+    while True:
+        chunk = list(patient_ids.filter(id__gt=last_id)[:batch_size])
+        if not chunk:
+            break
+        _write(_compute(chunk, SECTIONS))
+        total += len(chunk)
+        last_id = chunk[-1]
+    logger.info(f"Rebuilt health summaries for {total} patients")
+    return total
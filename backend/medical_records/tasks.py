@@ -0,0 +1,20 @@
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def cleanup_expired_uploads():
+    """
+    Tarea periódica para borrar subidas por partes abandonadas
+
+    Elimina las sesiones pendientes vencidas y sus partes en disco. Los
+    archivos ya almacenados (``StoredFile``) no se tocan.
+    """
+    from .uploads import cleanup_expired_uploads as cleanup
+
+    removed = cleanup()
+    if removed:
+        logger.info(f"Removed {removed} expired upload sessions")
+    return removed
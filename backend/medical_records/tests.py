@@ -7,7 +7,11 @@ from rest_framework.test import APITestCase
 from rest_framework import status
 from datetime import datetime, date, timedelta
 from decimal import Decimal
+import os
 import uuid
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from tests.base import BaseAPITestCase
 
 from .models import (
     MedicalRecord, Prescription, PrescriptionItem, VitalSigns,
@@ -770,4 +774,709 @@ class MedicalRecordAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         
         response = self.client.get(self.medical_record_detail_url)
-        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+class PatientTimelineTests(BaseAPITestCase):
+    """Tests para la línea de tiempo paginada por cursor"""
+
+    def setUp(self):
+        from appointments.models import Specialty
+        from emergency.models import EmergencyCase
+
+        super().setUp()
+        base = timezone.now().replace(microsecond=0) - timedelta(days=3650)
+        self.expected = []
+
+        def stamp(model, obj, field, days, name):
+            moment = base + timedelta(days=days)
+            model.objects.filter(pk=obj.pk).update(**{field: moment})
+            self.expected.append((moment, f'{name}_{obj.pk}'))
+
+        for days in (0, 400, 2000):
+            record = MedicalRecord.objects.create(
+                patient=self.patient, doctor=self.doctor, description='Control',
+                diagnosis=f'Diagnóstico {days}', treatment='Reposo'
+            )
+            stamp(MedicalRecord, record, 'created_at', days, 'consultation')
+        for days in (10, 2500):
+            prescription = Prescription.objects.create(
+                patient=self.patient, doctor=self.doctor, valid_until=date.today(),
+                diagnosis='Gripe', instructions='Cada 8 horas'
+            )
+            stamp(Prescription, prescription, 'issue_date', days, 'prescription')
+        lab = LabTest.objects.create(patient=self.patient, ordered_by=self.doctor, test_name='Hemograma')
+        stamp(LabTest, lab, 'ordered_date', 1500, 'lab')
+        allergy = Allergy.objects.create(
+            patient=self.patient, allergen='Penicilina', allergen_type='medication',
+            severity='severe', reaction='Urticaria'
+        )
+        stamp(Allergy, allergy, 'created_at', 20, 'allergy')
+        vitals = VitalSigns.objects.create(
+            patient=self.patient, recorded_by=self.nurse, blood_pressure_systolic=120,
+            blood_pressure_diastolic=80, heart_rate=72, respiratory_rate=16, temperature=Decimal('36.5'),
+            oxygen_saturation=98, weight=Decimal('70.0'), height=Decimal('170.0')
+        )
+        stamp(VitalSigns, vitals, 'recorded_at', 2000, 'vital_signs')
+        case = EmergencyCase.objects.create(patient=self.patient, chief_complaint='Dolor torácico')
+        stamp(EmergencyCase, case, 'arrival_time', 3000, 'emergency')
+
+        moment = timezone.localtime(base + timedelta(days=3100)).replace(second=0)
+        appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, specialty=Specialty.objects.create(name='Cardiología'),
+            appointment_date=moment.date(), appointment_time=moment.time(), reason='Control'
+        )
+        self.expected.append((moment, f'appointment_{appointment.pk}'))
+        self.expected.sort(reverse=True)
+
+        # Datos de otro paciente que no deben aparecer
+        other = self.create_user('other_patient', 'other_patient@test.com', 'patient')
+        MedicalRecord.objects.create(patient=other, doctor=self.doctor, description='x', diagnosis='x', treatment='x')
+
+        self.url = reverse('medical-record-timeline')
+
+    def test_pages_merge_all_sources_in_order(self):
+        """Las páginas recorren todas las fuentes sin repetir ni saltar elementos"""
+        from .timeline import SOURCES, decode_cursor, patient_timeline
+
+        seen = []
+        cursor = None
+        while True:
+            # Una consulta por fuente no agotada y otra para los medicamentos de las recetas
+            exhausted = sum(1 for value in decode_cursor(cursor).values() if value is None)
+            with CaptureQueriesContext(connection) as queries:
+                items, cursor = patient_timeline(self.patient.id, cursor, page_size=3)
+            has_prescriptions = any(item['type'] == 'prescription' for item in items)
+            self.assertEqual(len(queries), len(SOURCES) - exhausted + has_prescriptions)
+            seen.extend(items)
+            if cursor is None:
+                break
+
+        self.assertEqual([item['id'] for item in seen], [item_id for _, item_id in self.expected])
+        self.assertTrue(all('medications' in item for item in seen if item['type'] == 'prescription'))
+
+    def test_api_scopes_timeline_to_patient(self):
+        """El paciente ve su línea de tiempo; el personal indica el paciente"""
+        self.authenticate(self.patient)
+        response = self.client.get(self.url, {'page_size': 4})
+        self.assertSuccess(response)
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIn('cursor=', response.data['next'])
+
+        response = self.client.get(response.data['next'])
+        self.assertSuccess(response)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [item_id for _, item_id in self.expected[4:8]]
+        )
+
+        self.authenticate(self.doctor)
+        self.assertBadRequest(self.client.get(self.url))
+        response = self.client.get(self.url, {'patient_id': self.patient.id, 'page_size': 50})
+        self.assertEqual(len(response.data['results']), len(self.expected))
+        self.assertIsNone(response.data['next'])
+
+        self.assertNotFound(self.client.get(self.url, {'patient_id': self.patient.id, 'cursor': 'basura'}))
+
+    def test_patient_endpoints_follow_access_policy(self):
+        """Resumen, expediente, estadísticas y línea de tiempo aplican la misma política que la búsqueda"""
+        stranger = self.create_user('stranger', 'stranger@test.com', 'patient')
+        receptionist = self.create_user('receptionist', 'receptionist@test.com', 'receptionist')
+        pharmacist = self.create_user('pharmacist', 'pharmacist@test.com', 'pharmacist')
+        urls = [
+            self.url, reverse('medical-record-summary'), reverse('medical-record-my-record'),
+            reverse('medical-record-stats'), reverse('vital-signs-trend'),
+        ]
+        cases = [
+            (self.doctor, self.patient, True),
+            (self.doctor, stranger, False),
+            (self.nurse, stranger, True),
+            (self.admin_user, stranger, True),
+            (receptionist, self.patient, False),
+            (pharmacist, self.patient, False),
+        ]
+        for user, patient, allowed in cases:
+            self.authenticate(user)
+            for url in urls:
+                with self.subTest(role=user.role, patient=patient.username, url=url):
+                    response = self.client.get(url, {'patient_id': patient.id})
+                    if allowed:
+                        self.assertSuccess(response)
+                    else:
+                        self.assertForbidden(response)
+
+        self.authenticate(self.nurse)
+        self.assertNotFound(self.client.get(self.url, {'patient_id': self.doctor.id}))
+
+
+class PatientHealthSummaryTests(BaseAPITestCase):
+    """Tests para el resumen de salud mantenido desde las señales"""
+
+    def setUp(self):
+        super().setUp()
+        self.record = MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, description='Control',
+            diagnosis='Hipertensión', treatment='Dieta'
+        )
+        self.prescription = Prescription.objects.create(
+            patient=self.patient, doctor=self.doctor, valid_until=date.today() + timedelta(days=10),
+            diagnosis='Hipertensión', instructions='Cada 24 horas'
+        )
+        self.lab = LabTest.objects.create(patient=self.patient, ordered_by=self.doctor, test_name='Perfil lipídico')
+
+    def _summary(self):
+        from .models import PatientHealthSummary
+
+        return PatientHealthSummary.objects.get(patient=self.patient)
+
+    def test_sections_updated_from_signals(self):
+        """Cada guardado o borrado recalcula solo su sección"""
+        summary = self._summary()
+        self.assertEqual(summary.total_consultations, 1)
+        self.assertEqual(summary.consultations_this_year, 1)
+        self.assertEqual(summary.active_treatments, 1)
+        self.assertEqual(summary.pending_exams, 1)
+        self.assertIsNone(summary.last_vital_signs)
+
+        self.lab.update_status('completed')
+        self.prescription.is_active = False
+        self.prescription.save()
+        VitalSigns.objects.create(
+            patient=self.patient, recorded_by=self.nurse, blood_pressure_systolic=130,
+            blood_pressure_diastolic=85, heart_rate=70, respiratory_rate=16, temperature=Decimal('36.7'),
+            oxygen_saturation=97, weight=Decimal('80.0'), height=Decimal('175.0')
+        )
+        self.record.delete()
+
+        summary = self._summary()
+        self.assertEqual(summary.total_consultations, 0)
+        self.assertEqual(summary.active_treatments, 0)
+        self.assertEqual(summary.completed_treatments, 1)
+        self.assertEqual(summary.pending_exams, 0)
+        self.assertEqual(summary.last_vital_signs['blood_pressure'], '130/85')
+
+    def test_moving_record_updates_both_patients(self):
+        """Cambiar el paciente de un registro recalcula ambos resúmenes"""
+        from .models import PatientHealthSummary
+
+        other = self.create_user('other_patient', 'other_patient@test.com', 'patient')
+        record = MedicalRecord.objects.get(pk=self.record.pk)
+        record.patient = other
+        record.save()
+
+        self.assertEqual(self._summary().total_consultations, 0)
+        self.assertEqual(PatientHealthSummary.objects.get(patient=other).total_consultations, 1)
+
+    def test_stats_is_single_read(self):
+        """Las estadísticas se leen de una fila sin recalcular"""
+        from .summary import get_patient_summary
+
+        with self.assertNumQueries(1):
+            summary = get_patient_summary(self.patient.id)
+        self.assertEqual(summary.active_treatments, 1)
+
+        self.authenticate(self.patient)
+        response = self.client.get(reverse('medical-record-stats'))
+        self.assertSuccess(response)
+        self.assertEqual(response.data['total_consultations'], 1)
+        self.assertEqual(response.data['pending_exams'], 1)
+
+        response = self.client.get(reverse('medical-record-summary'))
+        self.assertSuccess(response)
+        self.assertEqual(response.data['active_prescriptions'], 1)
+        self.assertEqual(response.data['last_visit'], date.today().isoformat())
+        # Consulta, receta y examen
+        self.assertEqual(response.data['total_records'], 3)
+
+    def test_my_record_reads_summary_and_profile(self):
+        """El expediente del paciente sale del resumen y su perfil"""
+        VitalSigns.objects.create(
+            patient=self.patient, recorded_by=self.nurse, blood_pressure_systolic=120,
+            blood_pressure_diastolic=80, heart_rate=70, respiratory_rate=16, temperature=Decimal('36.5'),
+            oxygen_saturation=98, weight=Decimal('70.0'), height=Decimal('170.0')
+        )
+        self.patient.emergency_contact_name = 'María González'
+        self.patient.emergency_contact_phone = '987654321'
+        self.patient.save()
+
+        self.authenticate(self.patient)
+        response = self.client.get(reverse('medical-record-my-record'))
+        self.assertSuccess(response)
+        self.assertEqual(response.data['patient_name'], self.patient.get_full_name())
+        self.assertEqual(response.data['weight'], 70.0)
+        self.assertEqual(response.data['height'], 170.0)
+        self.assertEqual(response.data['emergency_contact'], 'María González - 987654321')
+
+    def test_expired_treatment_recalculated_on_read(self):
+        """Una receta activa vencida invalida la sección de tratamientos"""
+        from .models import PatientHealthSummary
+        from .summary import get_patient_summary
+
+        # Simular el paso del tiempo: la receta y el resumen quedan vencidos
+        Prescription.objects.filter(pk=self.prescription.pk).update(valid_until=date.today() - timedelta(days=1))
+        PatientHealthSummary.objects.filter(patient=self.patient).update(
+            next_treatment_expiry=date.today() - timedelta(days=1)
+        )
+        summary = get_patient_summary(self.patient.id)
+        self.assertEqual(summary.active_treatments, 0)
+        self.assertEqual(summary.completed_treatments, 1)
+
+    def test_rebuild_command(self):
+        """El comando reconstruye la tabla completa por bloques"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import PatientHealthSummary
+
+        PatientHealthSummary.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_health_summaries', batch_size=1, stdout=out)
+
+        self.assertIn('✅', out.getvalue())
+        self.assertEqual(self._summary().total_consultations, 1)
+        self.assertEqual(PatientHealthSummary.objects.count(), 1)
+
+
+class VitalSignsTrendTests(BaseAPITestCase):
+    """Tests para los agregados de signos vitales y la API de tendencia"""
+
+    def _reading(self, heart_rate, recorded_at=None, weight='80.0', patient=None):
+        reading = VitalSigns.objects.create(
+            patient=patient or self.patient, recorded_by=self.nurse, blood_pressure_systolic=120,
+            blood_pressure_diastolic=80, heart_rate=heart_rate, respiratory_rate=16,
+            temperature=Decimal('36.5'), oxygen_saturation=98, weight=Decimal(weight), height=Decimal('200.0')
+        )
+        if recorded_at is not None:
+            # recorded_at es auto_now_add: se mueve con un segundo guardado
+            reading.recorded_at = recorded_at
+            reading.save()
+        return reading
+
+    def _rollups(self, resolution):
+        from .models import VitalSignsRollup
+
+        return list(VitalSignsRollup.objects.filter(patient=self.patient, resolution=resolution).order_by('bucket_start'))
+
+    def test_rollups_maintained_on_insert(self):
+        """Cada lectura se suma a sus periodos por hora, día y semana"""
+        self._reading(60)
+        self._reading(90)
+        self._reading(75, weight='100.0')
+
+        for resolution in ('hour', 'day', 'week'):
+            rollups = self._rollups(resolution)
+            self.assertGreaterEqual(len(rollups), 1)
+            self.assertEqual(sum(rollup.count for rollup in rollups), 3)
+        week = self._rollups('week')[-1]
+        self.assertEqual(week.heart_rate_min, 60)
+        self.assertEqual(week.heart_rate_max, 90)
+        self.assertAlmostEqual(week.heart_rate_sum / week.count, 75)
+        self.assertAlmostEqual(week.bmi_min, 20)
+        self.assertAlmostEqual(week.bmi_max, 25)
+
+    def test_edit_and_delete_recompute_buckets(self):
+        """Mover o borrar una lectura recalcula los periodos afectados"""
+        reading = self._reading(70)
+        self._reading(80)
+        self._reading(100, recorded_at=timezone.now() - timedelta(days=30))
+
+        hours = self._rollups('hour')
+        self.assertEqual([rollup.count for rollup in hours], [1, 2])
+        self.assertEqual(hours[1].heart_rate_max, 80)
+
+        reading.delete()
+        hours = self._rollups('hour')
+        self.assertEqual([rollup.count for rollup in hours], [1, 1])
+        self.assertEqual(hours[1].heart_rate_min, 80)
+
+        VitalSigns.objects.all().delete()
+        self.assertEqual(self._rollups('week'), [])
+
+    def test_rebuild_command_matches_incremental(self):
+        """La reconstrucción con NumPy produce los mismos agregados"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import VitalSignsRollup
+        from .vitals import ROLLUP_FIELDS
+
+        now = timezone.now()
+        for days, heart_rate in ((0, 70), (0, 72), (1, 90), (9, 65), (40, 88)):
+            self._reading(heart_rate, recorded_at=now - timedelta(days=days))
+
+        def snapshot():
+            return list(VitalSignsRollup.objects.order_by('resolution', 'bucket_start').values_list(
+                'resolution', 'bucket_start', *ROLLUP_FIELDS
+            ))
+
+        before = snapshot()
+        VitalSignsRollup.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_vital_signs_rollups', stdout=out)
+
+        self.assertIn('✅', out.getvalue())
+        after = snapshot()
+        self.assertEqual(len(before), len(after))
+        for expected, actual in zip(before, after):
+            self.assertEqual(expected[:3], actual[:3])
+            for left, right in zip(expected[3:], actual[3:]):
+                self.assertAlmostEqual(left, right)
+
+    def test_trend_resolution_from_window(self):
+        """La resolución depende de la ventana y la respuesta va en columnas"""
+        from .vitals import MAX_POINTS
+
+        now = timezone.now()
+        for days, heart_rate in ((0, 70), (0, 80), (20, 60), (200, 90)):
+            self._reading(heart_rate, recorded_at=now - timedelta(hours=1, days=days))
+
+        self.authenticate(self.patient)
+        url = reverse('vital-signs-trend')
+        cases = [(1, 'raw', 2), (10, 'hour', 1), (90, 'day', 2), (365 * 5, 'week', 3)]
+        for days, resolution, points in cases:
+            response = self.client.get(url, {
+                'start': (now - timedelta(days=days)).isoformat(),
+                'end': now.isoformat(),
+                'metrics': 'heart_rate,bmi',
+            })
+            self.assertSuccess(response)
+            self.assertEqual(response.data['resolution'], resolution)
+            self.assertEqual(len(response.data['timestamps']), points)
+            self.assertEqual(set(response.data['metrics']), {'heart_rate', 'bmi'})
+            self.assertEqual(len(response.data['metrics']['heart_rate']['avg']), points)
+        self.assertEqual(response.data['count'], [1, 1, 2])
+        self.assertEqual(response.data['metrics']['heart_rate']['avg'], [90, 60, 75])
+        self.assertEqual(response.data['metrics']['heart_rate']['min'][-1], 70)
+
+        # Ventanas más largas que MAX_POINTS semanas se agrupan al vuelo
+        response = self.client.get(url, {'start': (now - timedelta(weeks=MAX_POINTS * 3)).isoformat()})
+        self.assertSuccess(response)
+        self.assertEqual(response.data['resolution'], 'week')
+        self.assertEqual(sum(response.data['count']), 4)
+        self.assertEqual(len(response.data['metrics']), 8)
+
+    def test_trend_validation_and_access(self):
+        """El personal indica el paciente y los parámetros se validan"""
+        other = self.create_user('other_patient', 'other_patient@test.com', 'patient')
+        self._reading(70)
+        self._reading(90, patient=other)
+        url = reverse('vital-signs-trend')
+
+        self.authenticate(self.patient)
+        response = self.client.get(url, {'patient_id': other.id, 'start': date.today().isoformat()})
+        self.assertSuccess(response)
+        self.assertEqual(response.data['patient_id'], self.patient.id)
+        self.assertEqual(response.data['metrics']['heart_rate']['max'], [70])
+
+        self.authenticate(self.doctor)
+        self.assertBadRequest(self.client.get(url))
+        # Sin relación asistencial con el paciente
+        self.assertForbidden(self.client.get(url, {'patient_id': other.id}))
+        MedicalRecord.objects.create(patient=other, doctor=self.doctor, description='x', diagnosis='x', treatment='x')
+        self.assertBadRequest(self.client.get(url, {'patient_id': other.id, 'metrics': 'glucose'}))
+        self.assertBadRequest(self.client.get(url, {'patient_id': other.id, 'start': 'ayer'}))
+        self.assertBadRequest(self.client.get(url, {
+            'patient_id': other.id, 'start': date.today().isoformat(), 'end': '2020-01-01'
+        }))
+        response = self.client.get(url, {'patient_id': other.id})
+        self.assertSuccess(response)
+        self.assertEqual(response.data['metrics']['heart_rate']['max'], [90])
+
+
+class ClinicalSearchTests(BaseAPITestCase):
+    """Tests para la búsqueda de texto completo del historial clínico"""
+
+    def setUp(self):
+        super().setUp()
+        self.record = MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, description='Control',
+            diagnosis='Hipertensión arterial', treatment='Losartán 50 mg y dieta hiposódica',
+            notes='Paciente refiere <b>cefalea</b> matutina'
+        )
+        self.other = self.create_user('other_patient', 'other_patient@test.com', 'patient')
+        self.other_doctor = self.create_user('other_doctor', 'other_doctor@test.com', 'doctor')
+        self.prescription = Prescription.objects.create(
+            patient=self.other, doctor=self.other_doctor, valid_until=date.today() + timedelta(days=10),
+            diagnosis='Fractura de radio distal', instructions='Cada 8 horas'
+        )
+        self.url = reverse('clinical-search')
+
+    def _search(self, user, query, **params):
+        self.authenticate(user)
+        return self.client.get(self.url, {'q': query, **params})
+
+    def test_index_maintained_on_save(self):
+        """Guardar y borrar registros actualiza el índice"""
+        from .models import ClinicalSearchEntry
+
+        entry = ClinicalSearchEntry.objects.get(source='consultation', object_id=self.record.pk)
+        self.assertEqual(entry.title, 'Hipertensión arterial')
+        self.assertEqual(entry.author, self.doctor)
+
+        lab = LabTest.objects.create(patient=self.patient, ordered_by=self.doctor, test_name='Hemograma')
+        self.assertFalse(ClinicalSearchEntry.objects.filter(source='lab', object_id=lab.pk).exists())
+        lab.results = 'Anemia ferropénica leve'
+        lab.save()
+        self.assertTrue(ClinicalSearchEntry.objects.filter(source='lab', object_id=lab.pk).exists())
+
+        self.record.treatment = 'Enalapril 10 mg'
+        self.record.save()
+        response = self._search(self.nurse, 'enalapril')
+        self.assertEqual([item['source_id'] for item in response.data['results']], [self.record.pk])
+        self.assertEqual(self._search(self.nurse, 'losartan').data['count'], 0)
+
+        self.record.delete()
+        self.assertFalse(ClinicalSearchEntry.objects.filter(source='consultation').exists())
+        self.assertEqual(self._search(self.nurse, 'enalapril').data['count'], 0)
+
+    def test_ranked_highlighted_results(self):
+        """Sin acentos, con plurales, ordenado por relevancia y con HTML escapado"""
+        from emergency.models import EmergencyCase
+
+        EmergencyCase.objects.create(
+            patient=self.patient, chief_complaint='Cefalea intensa',
+            discharge_diagnosis='Crisis hipertensiva; antecedente de hipertensión arterial'
+        )
+        response = self._search(self.nurse, 'hipertension arterial')
+        self.assertSuccess(response)
+        self.assertEqual(response.data['count'], 2)
+        ranks = [item['rank'] for item in response.data['results']]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertEqual({item['type'] for item in response.data['results']}, {'consultation', 'emergency'})
+        for item in response.data['results']:
+            self.assertIn('<mark>', item['highlight'])
+
+        response = self._search(self.nurse, 'fracturas')
+        self.assertEqual([item['type'] for item in response.data['results']], ['prescription'])
+        self.assertEqual(response.data['results'][0]['patient_id'], self.other.id)
+
+        response = self._search(self.nurse, 'cefalea', types='consultation')
+        highlight = response.data['results'][0]['highlight']
+        self.assertIn('&lt;b&gt;<mark>cefalea</mark>&lt;/b&gt;', highlight)
+        self.assertNotIn('<b>', highlight)
+
+    def test_role_scoping(self):
+        """Cada rol busca solo en los registros que puede ver"""
+        def found(user, query, **params):
+            response = self._search(user, query, **params)
+            self.assertSuccess(response)
+            return {item['type'] for item in response.data['results']}
+
+        self.assertEqual(found(self.patient, 'hipertension'), {'consultation'})
+        self.assertEqual(found(self.patient, 'fractura'), set())
+        self.assertEqual(found(self.doctor, 'hipertension'), {'consultation'})
+        self.assertEqual(found(self.doctor, 'fractura'), set())
+        self.assertEqual(found(self.other_doctor, 'fractura'), {'prescription'})
+        self.assertEqual(found(self.nurse, 'fractura'), {'prescription'})
+        self.assertEqual(found(self.admin_user, 'hipertension', patient_id=self.other.id), set())
+
+        pharmacist = self.create_user('pharmacist', 'pharmacist@test.com', 'pharmacist')
+        self.assertEqual(found(pharmacist, 'fractura'), {'prescription'})
+        self.assertEqual(found(pharmacist, 'hipertension'), set())
+
+        receptionist = self.create_user('receptionist', 'receptionist@test.com', 'receptionist')
+        self.assertForbidden(self._search(receptionist, 'hipertension'))
+
+    def test_validation(self):
+        """Consultas cortas o tipos desconocidos se rechazan"""
+        self.assertBadRequest(self._search(self.nurse, 'h'))
+        self.assertBadRequest(self._search(self.nurse, 'hipertension', types='notes'))
+        self.assertBadRequest(self._search(self.nurse, 'hipertension', patient_id='abc'))
+        # Caracteres de sintaxis FTS5 en la consulta no rompen la búsqueda
+        self.assertSuccess(self._search(self.nurse, '"hiper* OR (NEAR'))
+
+    def test_rebuild_command(self):
+        """El comando reconstruye el índice desde los registros"""
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ClinicalSearchEntry
+
+        ClinicalSearchEntry.objects.all().delete()
+        self.assertEqual(self._search(self.nurse, 'hipertension').data['count'], 0)
+
+        out = StringIO()
+        call_command('rebuild_clinical_search', batch_size=1, stdout=out)
+        self.assertIn('✅', out.getvalue())
+        self.assertEqual(ClinicalSearchEntry.objects.count(), 2)
+        self.assertEqual(self._search(self.nurse, 'hipertension').data['count'], 1)
+
+
+
+class ChunkedUploadTests(BaseAPITestCase):
+    """Tests para las subidas por partes, el almacenamiento por contenido y las descargas con Range"""
+
+    CHUNK_SIZE = 64 * 1024
+
+    def setUp(self):
+        super().setUp()
+        import tempfile
+
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.record = MedicalRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, description='Control',
+            diagnosis='Fractura', treatment='Yeso'
+        )
+        self.content = os.urandom(self.CHUNK_SIZE * 2 + 1000)
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+    def _start(self, user, **data):
+        self.authenticate(user)
+        payload = {
+            'target': 'medical_document', 'record': self.record.id, 'document_name': 'Radiografía',
+            'filename': 'radiografia.pdf', 'content_type': 'application/pdf',
+            'size': len(self.content), 'chunk_size': self.CHUNK_SIZE,
+        }
+        payload.update(data)
+        return self.client.post(reverse('chunked-upload'), payload, format='json')
+
+    def _put(self, upload_id, index, body=None, **headers):
+        if body is None:
+            body = self.content[index * self.CHUNK_SIZE:(index + 1) * self.CHUNK_SIZE]
+        return self.client.put(
+            reverse('chunked-upload-chunk', args=[upload_id, index]), body,
+            content_type='application/octet-stream', **headers
+        )
+
+    def _complete(self, upload_id, **data):
+        return self.client.post(reverse('chunked-upload-complete', args=[upload_id]), data, format='json')
+
+    def _upload(self, user, **data):
+        upload_id = self._start(user, **data).data['id']
+        for index in range(3):
+            self._put(upload_id, index)
+        return self._complete(upload_id)
+
+    def test_resumable_upload_out_of_order(self):
+        """Las partes llegan en cualquier orden y la subida se puede reanudar"""
+        import hashlib
+        from .models import MedicalDocument
+
+        response = self._start(self.doctor)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_id = response.data['id']
+        self.assertEqual(response.data['chunk_count'], 3)
+
+        self.assertSuccess(self._put(upload_id, 2))
+        self.assertSuccess(self._put(upload_id, 0))
+        response = self.client.get(reverse('chunked-upload-detail', args=[upload_id]))
+        self.assertEqual(response.data['received_chunks'], [0, 2])
+
+        response = self._complete(upload_id)
+        self.assertBadRequest(response)
+        self.assertIn('Partes pendientes (1): 1', str(response.data['detail']))
+
+        chunk = self.content[self.CHUNK_SIZE:self.CHUNK_SIZE * 2]
+        response = self._put(upload_id, 1, HTTP_X_CHUNK_SHA256=hashlib.sha256(chunk).hexdigest())
+        self.assertSuccess(response)
+        digest = hashlib.sha256(self.content).hexdigest()
+        response = self._complete(upload_id, sha256=digest)
+        self.assertSuccess(response)
+        self.assertEqual(response.data['upload']['sha256'], digest)
+        self.assertFalse(response.data['upload']['deduplicated'])
+
+        document = MedicalDocument.objects.get(pk=response.data['document']['id'])
+        self.assertEqual(document.document_file.name, f'cas/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        with document.document_file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.content)
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'chunked_uploads', upload_id)))
+
+        # Repetir "complete" devuelve el mismo documento
+        response = self._complete(upload_id)
+        self.assertSuccess(response)
+        self.assertEqual(response.data['document']['id'], document.id)
+        self.assertEqual(MedicalDocument.objects.count(), 1)
+
+    def test_invalid_chunks_rejected(self):
+        """Partes con tamaño, índice o SHA-256 incorrectos se rechazan"""
+        upload_id = self._start(self.doctor).data['id']
+        self.assertBadRequest(self._put(upload_id, 0, b'corto'))
+        self.assertBadRequest(self._put(upload_id, 2, self.content[-1000:] + b'x'))
+        self.assertBadRequest(self._put(upload_id, 3, b'x'))
+        self.assertBadRequest(self._put(upload_id, 0, HTTP_X_CHUNK_SHA256='0' * 64))
+        self.assertEqual(self.client.get(reverse('chunked-upload-detail', args=[upload_id])).data['received_chunks'], [])
+
+        for index in range(3):
+            self._put(upload_id, index)
+        self.assertBadRequest(self._complete(upload_id, sha256='0' * 64))
+
+    def test_identical_content_stored_once(self):
+        """El mismo contenido para varios pacientes y registros se guarda una vez"""
+        from .models import StoredFile
+
+        other = self.create_user('other_patient', 'other_patient@test.com', 'patient')
+        other_record = MedicalRecord.objects.create(
+            patient=other, doctor=self.doctor, description='Control', diagnosis='Esguince', treatment='Reposo'
+        )
+        lab_test = LabTest.objects.create(patient=other, ordered_by=self.doctor, test_name='Resonancia')
+
+        first = self._upload(self.doctor)
+        second = self._upload(self.doctor, record=other_record.id)
+        third = self._upload(self.doctor, target='lab_result', record=None, lab_test=lab_test.id)
+        for response in (first, second, third):
+            self.assertSuccess(response)
+
+        self.assertEqual(StoredFile.objects.count(), 1)
+        self.assertTrue(second.data['upload']['deduplicated'])
+        lab_test.refresh_from_db()
+        self.assertEqual(lab_test.result_file.name, StoredFile.objects.get().file.name)
+        self.assertEqual(second.data['document']['record'], other_record.id)
+
+    def test_range_download(self):
+        """Las descargas aceptan Range, If-Range y ETag"""
+        document_id = self._upload(self.doctor).data['document']['id']
+        url = reverse('document-download', args=[document_id])
+
+        self.authenticate(self.patient)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5', HTTP_IF_RANGE=etag)
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+        response = self.client.get(url, HTTP_RANGE=f'bytes={self.CHUNK_SIZE}-')
+        self.assertEqual(b''.join(response.streaming_content), self.content[self.CHUNK_SIZE:])
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.content)}-').status_code, 416)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"otro"').status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        other = self.create_user('other_patient', 'other_patient@test.com', 'patient')
+        self.authenticate(other)
+        self.assertForbidden(self.client.get(url))
+
+    def test_access_and_expiry(self):
+        """Permisos al iniciar, sesiones ajenas y limpieza de sesiones vencidas"""
+        from .models import UploadSession
+        from .tasks import cleanup_expired_uploads
+
+        other = self.create_user('other_patient', 'other_patient@test.com', 'patient')
+        lab_test = LabTest.objects.create(patient=self.patient, ordered_by=self.doctor, test_name='Resonancia')
+        self.assertForbidden(self._start(other))
+        self.assertForbidden(self._start(self.patient, target='lab_result', record=None, lab_test=lab_test.id))
+        self.assertBadRequest(self._start(self.doctor, filename='virus.exe'))
+        self.assertBadRequest(self._start(self.doctor, target='lab_result'))
+
+        upload_id = self._start(self.patient).data['id']
+        self.assertSuccess(self._put(upload_id, 0))
+        self.authenticate(self.doctor)
+        self.assertNotFound(self._put(upload_id, 1))
+
+        UploadSession.objects.filter(pk=upload_id).update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.authenticate(self.patient)
+        self.assertNotFound(self._put(upload_id, 1))
+        self.assertEqual(cleanup_expired_uploads(), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'chunked_uploads', upload_id)))
@@ -0,0 +1,259 @@
+"""
+Línea de tiempo unificada del paciente.
+
+Cada fuente (consultas, recetas, laboratorio, alergias, signos vitales,
+emergencias y citas) se lee con una consulta sobre su índice
+``(patient, fecha, id)`` limitada al tamaño de página, y las filas se
+combinan con un ``heapq.merge`` de k vías de la más reciente a la más
+antigua. El cursor guarda la última posición consumida de cada fuente, así
+que la página siguiente vuelve a leer como mucho una página por fuente sin
+importar la antigüedad del historial.
+"""
+import base64
+import heapq
+import json
+from collections import namedtuple
+from datetime import datetime
+from itertools import islice
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+
+from appointments.models import Appointment
+from emergency.models import EmergencyCase
+
+from .models import Allergy, LabTest, MedicalRecord, Prescription, PrescriptionItem, VitalSigns
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+Source = namedtuple('Source', ['model', 'ordering', 'fields', 'render'])
+
+
+def _name(row, prefix):
+    first, last = row.get(f'{prefix}__first_name'), row.get(f'{prefix}__last_name')
+    return f"{first} {last}" if first or last else 'No especificado'
+
+
+def _render_consultation(row):
+    return {
+        'title': row['diagnosis'] or 'Consulta médica',
+        'description': row['treatment'] or 'Sin descripción disponible',
+        'doctor': _name(row, 'doctor'),
+    }
+
+
+def _render_prescription(row):
+    return {
+        'title': 'Receta médica',
+        'description': row['diagnosis'],
+        'doctor': _name(row, 'doctor'),
+        'status': 'active' if row['is_active'] else 'inactive',
+    }
+
+
+def _render_lab_test(row):
+    return {
+        'title': row['test_name'],
+        'description': row['description'] or 'Resultados pendientes',
+        'doctor': _name(row, 'ordered_by'),
+        'status': row['status'],
+    }
+
+
+def _render_allergy(row):
+    return {
+        'title': f"Alergia a {row['allergen']}",
+        'description': row['reaction'],
+        'doctor': _name(row, 'created_by'),
+        'severity': row['severity'],
+    }
+
+
+def _render_vital_signs(row):
+    return {
+        'title': 'Signos vitales',
+        'description': (
+            f"PA {row['blood_pressure_systolic']}/{row['blood_pressure_diastolic']}, "
+            f"FC {row['heart_rate']}, T {row['temperature']}"
+        ),
+        'doctor': _name(row, 'recorded_by'),
+    }
+
+
+def _render_emergency(row):
+    return {
+        'title': 'Emergencia',
+        'description': row['chief_complaint'],
+        'doctor': _name(row, 'attending_doctor'),
+        'status': row['status'],
+    }
+
+
+def _render_appointment(row):
+    return {
+        'title': f"Cita de {row['specialty__name']}" if row['specialty__name'] else 'Cita médica',
+        'description': row['reason'],
+        'doctor': _name(row, 'doctor'),
+        'status': row['status'],
+    }
+
+
+# Las fuentes se ordenan por sus campos de ``ordering`` de forma descendente;
+# el último campo es siempre ``id`` para desempatar
+SOURCES = {
+    'consultation': Source(
+        MedicalRecord, ('created_at', 'id'),
+        ('diagnosis', 'treatment', 'doctor__first_name', 'doctor__last_name'),
+        _render_consultation
+    ),
+    'prescription': Source(
+        Prescription, ('issue_date', 'id'),
+        ('diagnosis', 'is_active', 'doctor__first_name', 'doctor__last_name'),
+        _render_prescription
+    ),
+    'lab': Source(
+        LabTest, ('ordered_date', 'id'),
+        ('test_name', 'description', 'status', 'ordered_by__first_name', 'ordered_by__last_name'),
+        _render_lab_test
+    ),
+    'allergy': Source(
+        Allergy, ('created_at', 'id'),
+        ('allergen', 'reaction', 'severity', 'created_by__first_name', 'created_by__last_name'),
+        _render_allergy
+    ),
+    'vital_signs': Source(
+        VitalSigns, ('recorded_at', 'id'),
+        ('blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate', 'temperature',
+         'recorded_by__first_name', 'recorded_by__last_name'),
+        _render_vital_signs
+    ),
+    'emergency': Source(
+        EmergencyCase, ('arrival_time', 'id'),
+        ('chief_complaint', 'status', 'attending_doctor__first_name', 'attending_doctor__last_name'),
+        _render_emergency
+    ),
+    'appointment': Source(
+        Appointment, ('appointment_date', 'appointment_time', 'id'),
+        ('reason', 'status', 'specialty__name', 'doctor__first_name', 'doctor__last_name'),
+        _render_appointment
+    ),
+}
+
+
+def _timestamp(row, source):
+    if source.model is Appointment:
+        return timezone.make_aware(datetime.combine(row['appointment_date'], row['appointment_time']))
+    return row[source.ordering[0]]
+
+
+def _before(ordering, position):
+    """Filtro ``(a, b, c) < (x, y, z)`` expandido a OR de prefijos iguales"""
+    condition = Q()
+    equal = {}
+    for name, value in zip(ordering, position):
+        condition |= Q(**equal, **{f'{name}__lt': value})
+        equal[name] = value
+    return condition
+
+
+def encode_cursor(positions):
+    raw = json.dumps(positions, separators=(',', ':'), default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(token):
+    """Posición por fuente; ``None`` marca una fuente agotada"""
+    if not token:
+        return {}
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        positions = {}
+        for name, values in raw.items():
+            source = SOURCES[name]
+            if values is None:
+                positions[name] = None
+                continue
+            if len(values) != len(source.ordering):
+                raise ValueError
+            positions[name] = tuple(
+                source.model._meta.get_field(field).to_python(value)
+                for field, value in zip(source.ordering, values)
+            )
+    except Exception:
+        raise NotFound('Cursor inválido')
+    return positions
+
+
+def _read_source(name, patient_id, position, limit):
+    """Filas de una fuente posteriores a ``position``, de la más reciente a la más antigua"""
+    source = SOURCES[name]
+    queryset = source.model.objects.filter(patient_id=patient_id)
+    if position is not None:
+        queryset = queryset.filter(_before(source.ordering, position))
+    rows = queryset.order_by(*[f'-{field}' for field in source.ordering]).values(
+        *dict.fromkeys(source.ordering + source.fields)
+    )[:limit]
+    return [
+        (_timestamp(row, source), name, row['id'], row)
+        for row in rows
+    ]
+
+
+def _attach_medications(items):
+    """Medicamentos de las recetas de la página, con una sola consulta"""
+    prescriptions = {item['source_id']: item for item in items if item['type'] == 'prescription'}
+    if not prescriptions:
+        return
+    for item in prescriptions.values():
+        item['medications'] = []
+    for prescription_id, name in PrescriptionItem.objects.filter(
+        prescription_id__in=prescriptions
+    ).order_by('id').values_list('prescription_id', 'medication__name'):
+        prescriptions[prescription_id]['medications'].append(name)
+
+
+def patient_timeline(patient_id, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Página de la línea de tiempo del paciente.
+
+    Devuelve ``(elementos, cursor_siguiente)``; el cursor es ``None`` cuando
+    no quedan elementos.
+    """
+    positions = decode_cursor(cursor)
+    streams = {}
+    for name in SOURCES:
+        if name in positions and positions[name] is None:
+            continue
+        streams[name] = _read_source(name, patient_id, positions.get(name), page_size)
+
+    merged = heapq.merge(*streams.values(), key=lambda entry: entry[:3], reverse=True)
+    page = list(islice(merged, page_size))
+
+    consumed = {}
+    for _, name, _, row in page:
+        consumed[name] = consumed.get(name, 0) + 1
+        positions[name] = tuple(row[field] for field in SOURCES[name].ordering)
+
+    has_more = False
+    for name, rows in streams.items():
+        if consumed.get(name, 0) == len(rows) and len(rows) < page_size:
+            # Fuente agotada: las páginas siguientes no la consultan
+            positions[name] = None
+        else:
+            has_more = True
+
+    items = []
+    for timestamp, name, pk, row in page:
+        item = {
+            'id': f'{name}_{pk}',
+            'source_id': pk,
+            'type': name,
+            'date': timestamp.isoformat(),
+        }
+        item.update(SOURCES[name].render(row))
+        items.append(item)
+    _attach_medications(items)
+
+    return items, encode_cursor(positions) if has_more else None
@@ -0,0 +1,323 @@
+"""
+Subidas por partes y almacenamiento direccionado por contenido.
+
+Una subida se inicia con su tamaño total, el cliente envía las partes
+numeradas con ``PUT`` (cuerpo binario, en cualquier orden y reintentables)
+y al completarla se unen en orden mientras se calcula el SHA-256. Cada parte
+se escribe a disco directamente desde el cuerpo de la petición, sin pasar
+por memoria. El archivo final se guarda en ``cas/`` con su hash como nombre:
+si el contenido ya existía solo se enlaza. Las descargas aceptan
+``Range`` para reanudar o ver PDFs grandes por páginas.
+"""
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from rest_framework.exceptions import NotFound, ValidationError
+
+from .models import MedicalDocument, StoredFile, UploadSession
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_EXTENSIONS = ('pdf', 'jpg', 'jpeg', 'png')
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+SESSION_TTL = timedelta(hours=24)
+# Bloque de lectura y escritura al copiar partes y servir descargas
+BUFFER_SIZE = 1024 * 1024
+
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def upload_root():
+    """Directorio temporal de las partes, en el mismo disco que MEDIA_ROOT"""
+    return os.path.join(settings.MEDIA_ROOT, 'chunked_uploads')
+
+
+def session_dir(session):
+    return os.path.join(upload_root(), str(session.pk))
+
+
+def chunk_path(session, index):
+    return os.path.join(session_dir(session), f'{index}.part')
+
+
+def expected_chunk_size(session, index):
+    if index == session.chunk_count - 1:
+        return session.size - session.chunk_size * index
+    return session.chunk_size
+
+
+def received_chunks(session):
+    """Índices de las partes ya escritas, para reanudar la subida"""
+    try:
+        names = os.listdir(session_dir(session))
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-5]) for name in names if name.endswith('.part') and name[:-5].isdigit())
+
+
+def start_upload(user, **fields):
+    """Crear una sesión de subida; el tamaño de parte se ajusta a los límites"""
+    chunk_size = fields.pop('chunk_size', None) or DEFAULT_CHUNK_SIZE
+    return UploadSession.objects.create(
+        user=user,
+        chunk_size=min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE),
+        expires_at=timezone.now() + SESSION_TTL,
+        **fields
+    )
+
+
+def get_session(user, session_id):
+    """Sesión de ``user`` aún vigente"""
+    session = UploadSession.objects.filter(pk=session_id, user=user).select_related(
+        'stored_file', 'document', 'lab_test'
+    ).first()
+    if session is None or (session.status == 'pending' and session.expires_at <= timezone.now()):
+        raise NotFound('Sesión de subida no encontrada o vencida')
+    return session
+
+
+def _check_digest(value):
+    value = (value or '').strip().lower()
+    if value and not SHA256_PATTERN.match(value):
+        raise ValidationError({'sha256': 'Debe ser un SHA-256 en hexadecimal'})
+    return value
+
+
+def write_chunk(session, index, stream, sha256=None):
+    """
+    Escribir la parte ``index`` desde ``stream`` y devolver su SHA-256.
+
+    La parte se escribe en un temporal y se renombra al terminar, así que un
+    reintento reemplaza la parte anterior sin dejarla a medias.
+    """
+    if session.status != 'pending':
+        raise ValidationError({'detail': 'La subida ya se completó'})
+    if not 0 <= index < session.chunk_count:
+        raise ValidationError({'index': f'Debe estar entre 0 y {session.chunk_count - 1}'})
+    sha256 = _check_digest(sha256)
+    size = expected_chunk_size(session, index)
+
+    os.makedirs(session_dir(session), exist_ok=True)
+    final_path = chunk_path(session, index)
+    temp_path = f'{final_path}.{uuid.uuid4().hex}.tmp'
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(temp_path, 'wb') as output:
+            while stream is not None and written <= size:
+                # Leer un byte de más para detectar partes demasiado grandes
+                block = stream.read(min(BUFFER_SIZE, size - written + 1))
+                if not block:
+                    break
+                written += len(block)
+                digest.update(block)
+                output.write(block)
+        if written != size:
+            raise ValidationError({'detail': f'La parte {index} debe tener {size} bytes'})
+        if sha256 and digest.hexdigest() != sha256:
+            raise ValidationError({'sha256': 'El contenido de la parte no coincide con su SHA-256'})
+        os.replace(temp_path, final_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return digest.hexdigest()
+
+
+def _assemble(session):
+    """Unir las partes en orden en un archivo temporal, calculando el SHA-256"""
+    missing = sorted(set(range(session.chunk_count)) - set(received_chunks(session)))
+    if missing:
+        shown = ', '.join(str(index) for index in missing[:20])
+        raise ValidationError({'detail': f"Partes pendientes ({len(missing)}): {shown}{'…' if len(missing) > 20 else ''}"})
+    path = os.path.join(session_dir(session), f'assembled.{uuid.uuid4().hex}.tmp')
+    digest = hashlib.sha256()
+    with open(path, 'wb') as output:
+        for index in range(session.chunk_count):
+            with open(chunk_path(session, index), 'rb') as chunk:
+                for block in iter(lambda: chunk.read(BUFFER_SIZE), b''):
+                    digest.update(block)
+                    output.write(block)
+    return path, digest.hexdigest()
+
+
+def store_file(path, sha256, size, content_type='', extension=''):
+    """
+    Guardar el archivo ``path`` bajo su hash; devuelve ``(StoredFile, creado)``.
+
+    Si el contenido ya estaba almacenado el temporal se descarta y se
+    conserva la extensión de la primera subida.
+    """
+    stored = StoredFile.objects.filter(pk=sha256).first()
+    if stored is not None:
+        os.remove(path)
+        return stored, False
+
+    name = f'cas/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+    try:
+        target = default_storage.path(name)
+    except NotImplementedError:
+        target = None
+    if target is not None:
+        # Mismo disco: renombrar sin volver a copiar. Dos subidas simultáneas
+        # del mismo contenido escriben el mismo archivo.
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    else:
+        with open(path, 'rb') as source:
+            name = default_storage.save(name, File(source))
+        os.remove(path)
+    return StoredFile.objects.get_or_create(
+        sha256=sha256,
+        defaults={'file': name, 'size': size, 'content_type': content_type}
+    )
+
+
+def complete_upload(session_id, user, sha256=None):
+    """
+    Unir, verificar, almacenar y enlazar la subida.
+
+    Repetir la llamada sobre una sesión completada devuelve el mismo
+    resultado.
+    """
+    sha256 = _check_digest(sha256)
+    with transaction.atomic():
+        session = get_session(user, session_id)
+        session = UploadSession.objects.select_for_update().get(pk=session.pk)
+        if session.status == 'completed':
+            return session
+
+        path, actual = _assemble(session)
+        if sha256 and actual != sha256:
+            os.remove(path)
+            raise ValidationError({'sha256': 'El archivo recibido no coincide con su SHA-256'})
+        stored, created = store_file(
+            path, actual, session.size, session.content_type, os.path.splitext(session.filename)[1].lower()
+        )
+
+        if session.target == 'medical_document':
+            session.document = MedicalDocument.objects.create(
+                record_id=session.record_id,
+                document_name=session.document_name or session.filename,
+                document_file=stored.file.name
+            )
+        else:
+            lab_test = session.lab_test
+            lab_test.result_file = stored.file.name
+            lab_test.save(update_fields=['result_file', 'updated_at'])
+        session.stored_file = stored
+        session.deduplicated = not created
+        session.status = 'completed'
+        session.save(update_fields=['document', 'stored_file', 'deduplicated', 'status'])
+
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    logger.info(f"Upload {session.pk} completed ({session.size} bytes, deduplicated={session.deduplicated})")
+    return session
+
+
+def cleanup_expired_uploads():
+    """Borrar sesiones pendientes vencidas y sus partes; devuelve cuántas"""
+    expired = list(UploadSession.objects.filter(
+        status='pending',
+        expires_at__lt=timezone.now()
+    ).values_list('pk', flat=True))
+    for session_id in expired:
+        shutil.rmtree(os.path.join(upload_root(), str(session_id)), ignore_errors=True)
+    UploadSession.objects.filter(pk__in=expired).delete()
+    return len(expired)
+
+
+def _parse_range(header, size):
+    """
+    Rango ``(inicio, fin)`` de una cabecera ``Range`` de un solo tramo.
+
+    Devuelve ``None`` si la cabecera no se entiende o pide varios tramos (se
+    sirve el archivo completo) y lanza ``ValueError`` si no es satisfacible.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Sufijo: los últimos N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError
+    return start, end
+
+
+def _read_range(handle, length):
+    try:
+        while length > 0:
+            block = handle.read(min(BUFFER_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        handle.close()
+
+
+def file_response(request, field_file, filename):
+    """Descarga de ``field_file`` con soporte de ``Range``, ``If-Range`` y ETag"""
+    stored = StoredFile.objects.filter(file=field_file.name).first()
+    content_type = (
+        (stored.content_type if stored else '') or
+        mimetypes.guess_type(filename)[0] or
+        'application/octet-stream'
+    )
+    size = field_file.size
+    etag = f'"{stored.sha256}"' if stored else None
+
+    if etag and request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    start, end, status_code = 0, size - 1, 200
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and size and (not if_range or if_range == etag):
+        try:
+            requested = _parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if requested is not None:
+            start, end = requested
+            status_code = 206
+
+    handle = field_file.storage.open(field_file.name, 'rb')
+    handle.seek(start)
+    response = StreamingHttpResponse(_read_range(handle, end - start + 1), status=status_code, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = content_disposition_header(False, filename)
+    response['Cache-Control'] = 'private'
+    if etag:
+        response['ETag'] = etag
+    if status_code == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
@@ -21,6 +21,13 @@ urlpatterns = [
     path('doctor/prescriptions/', views.DoctorPrescriptionsView.as_view(), name='doctor-prescriptions'),
     path('patients/<int:patient_id>/documents/', views.PatientDocumentsView.as_view(), name='patient-documents'),
     path('patients/<int:patient_id>/history/', views.PatientHistoryView.as_view(), name='patient-history'),
+    path('search/', views.ClinicalSearchView.as_view(), name='clinical-search'),
+    path('uploads/', views.ChunkedUploadView.as_view(), name='chunked-upload'),
+    path('uploads/<uuid:upload_id>/', views.ChunkedUploadDetailView.as_view(), name='chunked-upload-detail'),
+    path('uploads/<uuid:upload_id>/chunks/<int:index>/', views.ChunkedUploadChunkView.as_view(), name='chunked-upload-chunk'),
+    path('uploads/<uuid:upload_id>/complete/', views.ChunkedUploadCompleteView.as_view(), name='chunked-upload-complete'),
+    path('documents/<int:pk>/download/', views.MedicalDocumentDownloadView.as_view(), name='document-download'),
+    path('lab-tests/<int:pk>/result/', views.LabResultDownloadView.as_view(), name='lab-result-download'),
     
     # Incluir rutas del router
     path('', include(router.urls)),
@@ -1,15 +1,50 @@
+import os
+
 from rest_framework import viewsets, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.shortcuts import get_object_or_404
-from datetime import datetime, date, timedelta
+from django.contrib.auth import get_user_model
+from datetime import datetime, date, time, timedelta
+from authentication.models import PatientProfile
+from .access import can_access_patient
 from .models import (MedicalRecord, Allergy, Prescription, LabTest, VitalSigns, MedicalDocument)
+from .search import DEFAULT_LIMIT, MAX_LIMIT, SOURCES, scoped_entries, search_clinical_records
+from .summary import get_patient_summary
+from .timeline import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, patient_timeline
+from .uploads import complete_upload, file_response, get_session, start_upload, write_chunk
+from .vitals import METRICS, vital_signs_trend
 from .serializers import (
     MedicalRecordSerializer, AllergySerializer, PrescriptionSerializer,
-    LabTestSerializer, VitalSignsSerializer, MedicalDocumentSerializer, MedicalSummarySerializer)
+    LabTestSerializer, VitalSignsSerializer, MedicalDocumentSerializer, MedicalSummarySerializer,
+    UploadSessionSerializer)
+
+User = get_user_model()
+
+
+def requested_patient_id(request):
+    """
+    Paciente consultado: el propio usuario o ``patient_id`` para el personal
+    con acceso a él según ``access.can_access_patient``
+    """
+    user = request.user
+    if getattr(user, 'role', None) == 'patient':
+        return user.id
+    try:
+        patient_id = int(request.query_params['patient_id'])
+    except (KeyError, ValueError):
+        raise ValidationError({'patient_id': 'Se requiere patient_id'})
+    if not can_access_patient(user, patient_id):
+        raise PermissionDenied('No tienes permiso para acceder a este expediente')
+    if not User.objects.filter(pk=patient_id, role='patient').exists():
+        raise NotFound('Paciente no encontrado')
+    return patient_id
 
 
 class MedicalRecordViewSet(viewsets.ViewSet):
@@ -35,26 +70,27 @@ class MedicalRecordViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def summary(self, request):
         """Obtener resumen del expediente médico"""
-        user = request.user
+        patient_id = requested_patient_id(request)
+        patient = request.user if patient_id == request.user.id else User.objects.get(pk=patient_id)
+        health = get_patient_summary(patient_id)
+        profile = PatientProfile.objects.filter(user_id=patient_id).values('blood_type').first()
+        # Consultas, recetas y exámenes del paciente
+        total_records = (
+            health.total_consultations + health.active_treatments + health.completed_treatments +
+            LabTest.objects.filter(patient_id=patient_id).count()
+        )
         
-        # Datos de ejemplo para demostración
         summary = {
-            'patient_name': user.get_full_name() if user.get_full_name() else 'Paciente',
-            'blood_type': 'O+',
-            'age': 28,
-            'allergies_count': 0,
-            'active_prescriptions': 2,
-            'pending_lab_results': 1,
-            'last_visit': (datetime.now() - timedelta(days=15)).isoformat(),
-            'total_visits': 8,
-            'total_records': 12,
-            'recent_vital_signs': {
-                'blood_pressure': '120/80',
-                'heart_rate': 72,
-                'temperature': 36.5,
-                'weight': 70.5,
-                'height': 175
-            }
+            'patient_name': patient.get_full_name() or 'Paciente',
+            'blood_type': (profile or {}).get('blood_type') or '',
+            'age': patient.age,
+            'allergies_count': health.allergies_count,
+            'active_prescriptions': health.active_treatments,
+            'pending_lab_results': health.pending_exams,
+            'last_visit': health.last_consultation_date,
+            'total_visits': health.total_consultations,
+            'total_records': total_records,
+            'recent_vital_signs': health.last_vital_signs
         }
         serializer = MedicalSummarySerializer(summary)
         return Response(serializer.data)
@@ -62,21 +98,29 @@ class MedicalRecordViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], url_path='my-record')
     def my_record(self, request):
         """Obtener expediente médico del paciente autenticado"""
-        user = request.user
+        patient_id = requested_patient_id(request)
+        patient = request.user if patient_id == request.user.id else User.objects.get(pk=patient_id)
+        health = get_patient_summary(patient_id)
+        profile = PatientProfile.objects.filter(user_id=patient_id).values(
+            'blood_type', 'emergency_contact_name', 'emergency_contact_relationship', 'created_at'
+        ).first() or {}
+        vital_signs = health.last_vital_signs or {}
         
-        # Datos de ejemplo
+        contact_name = profile.get('emergency_contact_name') or patient.emergency_contact_name
+        emergency_contact = ' - '.join(filter(None, [contact_name, patient.emergency_contact_phone]))
         record_data = {
-            'patient_name': user.get_full_name() if user.get_full_name() else 'Paciente',
-            'blood_type': 'O+',
-            'age': 28,
-            'height': 175,
-            'weight': 70.5,
-            'emergency_contact': 'María González - 987654321',
-            'created_at': datetime.now().isoformat()
+            'patient_name': patient.get_full_name() or 'Paciente',
+            'blood_type': profile.get('blood_type') or '',
+            'age': patient.age,
+            'height': vital_signs.get('height'),
+            'weight': vital_signs.get('weight'),
+            'emergency_contact': emergency_contact,
+            'emergency_contact_relationship': profile.get('emergency_contact_relationship') or '',
+            'created_at': (profile.get('created_at') or patient.date_joined).isoformat()
         }
         
         return Response(record_data)
-    
+
     @action(detail=False, methods=['get'])
     def diagnoses(self, request):
         """Obtener historial de diagnósticos"""
@@ -214,73 +258,173 @@ class MedicalRecordViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def timeline(self, request):
-        """Obtener línea de tiempo médica"""
-        timeline_data = [
-            {
-                'id': 1,
-                'title': 'Control Prenatal',
-                'description': 'Consulta de rutina. Presión arterial normal, peso adecuado.',
-                'date': (datetime.now() - timedelta(days=15)).isoformat(),
-                'doctor': 'María González',
-                'specialty': 'Ginecología y Obstetricia',
-                'type': 'consultation'
-            },
-            {
-                'id': 2,
-                'title': 'Consulta Cardiológica',
-                'description': 'Evaluación de hipertensión. Ajuste de medicación.',
-                'date': (datetime.now() - timedelta(days=30)).isoformat(),
-                'doctor': 'Roberto Silva',
-                'specialty': 'Medicina General',
-                'type': 'consultation'
-            },
-            {
-                'id': 3,
-                'title': 'Exámenes de Laboratorio',
-                'description': 'Hemograma y perfil lipídico realizados.',
-                'date': (datetime.now() - timedelta(days=45)).isoformat(),
-                'doctor': 'Roberto Silva',
-                'specialty': 'Medicina General',
-                'type': 'lab'
-            },
-            {
-                'id': 4,
-                'title': 'Tratamiento Gastritis',
-                'description': 'Inicio de tratamiento con omeprazol. Recomendaciones dietéticas.',
-                'date': (datetime.now() - timedelta(days=90)).isoformat(),
-                'doctor': 'Juan Pérez',
-                'specialty': 'Medicina General',
-                'type': 'treatment'
-            }
-        ]
+        """
+        Línea de tiempo médica paginada por cursor.
         
-        return Response(timeline_data)
+        Los pacientes ven la suya; el personal indica ``patient_id``.
+        """
+        patient_id = requested_patient_id(request)
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = DEFAULT_PAGE_SIZE
+        
+        items, cursor = patient_timeline(patient_id, request.query_params.get('cursor'), page_size)
+        next_link = None
+        if cursor:
+            next_link = replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+        return Response({'next': next_link, 'results': items})
     
     @action(detail=False, methods=['get'])
     def stats(self, request):
-        """Obtener estadísticas de salud"""
-        stats_data = {
-            'total_consultations': 8,
-            'consultations_this_year': 5,
-            'active_treatments': 2,
-            'completed_treatments': 3,
-            'pending_exams': 1,
-            'last_vital_signs': {
-                'date': (datetime.now() - timedelta(days=15)).isoformat(),
-                'blood_pressure': '125/82',
-                'heart_rate': 75,
-                'temperature': 36.6,
-                'weight': 70.8,
-                'height': 175
-            },
-            'health_trends': {
-                'weight_change': '+0.5kg (último mes)',
-                'blood_pressure_trend': 'Estable',
-                'medication_adherence': '95%'
-            }
-        }
-        
-        return Response(stats_data)
+        """Obtener estadísticas de salud desde el resumen precalculado"""
+        health = get_patient_summary(requested_patient_id(request))
+        return Response({
+            'total_consultations': health.total_consultations,
+            'consultations_this_year': health.consultations_this_year,
+            'active_treatments': health.active_treatments,
+            'completed_treatments': health.completed_treatments,
+            'pending_exams': health.pending_exams,
+            'last_vital_signs': health.last_vital_signs,
+        })
+
+
+class ClinicalSearchView(APIView):
+    """
+    Búsqueda de texto completo en diagnósticos, tratamientos, notas,
+    recetas, altas de emergencia y resultados de laboratorio.
+    
+    Cada rol busca solo en lo que puede ver (ver ``search.scoped_entries``);
+    ``patient_id`` y ``types`` acotan la búsqueda.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            raise ValidationError({'q': 'Ingresa al menos 2 caracteres para buscar'})
+
+        entries = scoped_entries(request.user)
+        if entries is None:
+            raise PermissionDenied('No tienes permiso para buscar en el historial clínico')
+
+        if request.query_params.get('patient_id'):
+            try:
+                entries = entries.filter(patient_id=int(request.query_params['patient_id']))
+            except ValueError:
+                raise ValidationError({'patient_id': 'Debe ser un número'})
+        if request.query_params.get('types'):
+            types = [name.strip() for name in request.query_params['types'].split(',') if name.strip()]
+            unknown = [name for name in types if name not in SOURCES]
+            if unknown:
+                raise ValidationError({'types': f"Tipos no válidos: {', '.join(unknown)}"})
+            entries = entries.filter(source__in=types)
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+
+        results = search_clinical_records(entries, query, limit)
+        return Response({'query': query, 'count': len(results), 'results': results})
+
+
+def _check_patient_access(user, patient_id):
+    """Los pacientes solo acceden a archivos de su propio expediente"""
+    if getattr(user, 'role', None) == 'patient' and user.id != patient_id:
+        raise PermissionDenied('No tienes permiso para acceder a este expediente')
+
+
+def _download_name(name, field_file):
+    """Nombre descriptivo con la extensión del archivo almacenado"""
+    extension = os.path.splitext(field_file.name)[1]
+    return name if name.lower().endswith(extension.lower()) else f'{name}{extension}'
+
+
+class ChunkedUploadView(APIView):
+    """
+    Iniciar una subida por partes de un documento médico o resultado de
+    laboratorio.
+    
+    El cliente envía después cada parte con ``PUT .../chunks/<n>/`` y cierra
+    con ``POST .../complete/``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        if data['target'] == 'lab_result':
+            if request.user.role == 'patient':
+                raise PermissionDenied('Solo el personal puede subir resultados de laboratorio')
+        else:
+            _check_patient_access(request.user, data['record'].patient_id)
+
+        session = start_upload(request.user, **data)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class ChunkedUploadDetailView(APIView):
+    """Estado de la subida (partes recibidas, para reanudar) o cancelación"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        return Response(UploadSessionSerializer(get_session(request.user, upload_id)).data)
+
+    def delete(self, request, upload_id):
+        session = get_session(request.user, upload_id)
+        if session.status == 'pending':
+            session.expires_at = timezone.now()
+            session.save(update_fields=['expires_at'])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ChunkedUploadChunkView(APIView):
+    """Recibir una parte como cuerpo binario; se escribe a disco sin cargarla en memoria"""
+    permission_classes = [IsAuthenticated]
+
+    def put(self, request, upload_id, index):
+        session = get_session(request.user, upload_id)
+        sha256 = write_chunk(session, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+        return Response({'index': index, 'sha256': sha256})
+
+
+class ChunkedUploadCompleteView(APIView):
+    """Unir las partes y enlazar el archivo; ``sha256`` opcional para verificarlo"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        session = complete_upload(upload_id, request.user, request.data.get('sha256'))
+        data = {'upload': UploadSessionSerializer(session).data}
+        if session.target == 'medical_document':
+            data['document'] = MedicalDocumentSerializer(session.document).data if session.document else None
+        else:
+            data['lab_test'] = LabTestSerializer(session.lab_test).data
+        return Response(data)
+
+
+class MedicalDocumentDownloadView(APIView):
+    """Descargar un documento médico con soporte de ``Range``"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        document = get_object_or_404(MedicalDocument.objects.select_related('record'), pk=pk)
+        _check_patient_access(request.user, document.record.patient_id)
+        if not document.document_file:
+            raise NotFound('El documento no tiene archivo')
+        return file_response(request, document.document_file, _download_name(document.document_name, document.document_file))
+
+
+class LabResultDownloadView(APIView):
+    """Descargar el archivo de resultados de un examen con soporte de ``Range``"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        lab_test = get_object_or_404(LabTest, pk=pk)
+        _check_patient_access(request.user, lab_test.patient_id)
+        if not lab_test.result_file:
+            raise NotFound('El examen no tiene archivo de resultados')
+        return file_response(request, lab_test.result_file, _download_name(lab_test.test_name, lab_test.result_file))
 
 
 # Consultations
@@ -337,6 +481,48 @@ class VitalSignsViewSet(viewsets.ModelViewSet):
     serializer_class = VitalSignsSerializer
     permission_classes = [IsAuthenticated]
 
+    # Ventana por defecto de la tendencia
+    TREND_DEFAULT_DAYS = 30
+
+    def _moment(self, request, name, default):
+        value = request.query_params.get(name)
+        if not value:
+            return default
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({name: 'Fecha inválida'})
+            moment = datetime.combine(day, time.min)
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    @action(detail=False, methods=['get'])
+    def trend(self, request):
+        """
+        Tendencia de signos vitales en columnas.
+
+        La resolución (lecturas, hora, día o semana) depende de la ventana
+        ``start``/``end``; ``metrics`` limita las métricas devueltas.
+        """
+        patient_id = requested_patient_id(request)
+        end = self._moment(request, 'end', timezone.now())
+        start = self._moment(request, 'start', end - timedelta(days=self.TREND_DEFAULT_DAYS))
+        if start >= end:
+            raise ValidationError({'start': 'Debe ser anterior a end'})
+
+        metrics = METRICS
+        if request.query_params.get('metrics'):
+            metrics = [name.strip() for name in request.query_params['metrics'].split(',') if name.strip()]
+            unknown = [name for name in metrics if name not in METRICS]
+            if unknown:
+                raise ValidationError({'metrics': f"Métricas no válidas: {', '.join(unknown)}"})
+
+        data = vital_signs_trend(patient_id, start, end, metrics)
+        data.update(patient_id=patient_id, start=start.isoformat(), end=end.isoformat())
+        return Response(data)
+
 # Prescription ViewSet
 class PrescriptionViewSet(viewsets.ModelViewSet):
     queryset = Prescription.objects.all()
@@ -485,7 +671,7 @@ class PatientHistoryView(APIView):
         """Obtener historial médico completo del paciente desde la base de datos"""
         try:
             # Obtener registros médicos (consultas)
-            medical_records = MedicalRecord.objects.filter(patient_id=patient_id)
+            medical_records = list(MedicalRecord.objects.filter(patient_id=patient_id).select_related('doctor'))
             consultations = []
             for record in medical_records:
                 consultations.append({
@@ -499,13 +685,13 @@ class PatientHistoryView(APIView):
                 })
 
             # Obtener prescripciones con sus items
-            prescriptions_qs = Prescription.objects.filter(patient_id=patient_id).prefetch_related('items__medication')
+            prescriptions_qs = Prescription.objects.filter(patient_id=patient_id).select_related('doctor').prefetch_related('items__medication')
             prescriptions = []
             for prescription in prescriptions_qs:
                 # Obtener items de la prescripción
                 prescription_items = prescription.items.all()
                 
-                if prescription_items.exists():
+                if prescription_items:
                     # Si hay items, crear una entrada por cada medicamento
                     for item in prescription_items:
                         prescriptions.append({
@@ -538,7 +724,7 @@ class PatientHistoryView(APIView):
                     })
 
             # Obtener resultados de laboratorio
-            lab_tests = LabTest.objects.filter(patient_id=patient_id)
+            lab_tests = LabTest.objects.filter(patient_id=patient_id).select_related('ordered_by')
             lab_results = []
             for test in lab_tests:
                 lab_results.append({
@@ -552,7 +738,7 @@ class PatientHistoryView(APIView):
                 })
 
             # Obtener alergias (como parte del historial)
-            allergies = Allergy.objects.filter(patient_id=patient_id)
+            allergies = Allergy.objects.filter(patient_id=patient_id).select_related('created_by')
             diagnoses = []
             for allergy in allergies:
                 diagnoses.append({
@@ -0,0 +1,258 @@
+"""
+Series temporales de signos vitales.
+
+Cada lectura se suma al insertarse en los agregados por hora, día y semana
+del paciente (``VitalSignsRollup``) con un ``UPDATE`` atómico de mínimo,
+máximo, suma y conteo, así que las gráficas de tendencia leen como mucho
+``MAX_POINTS`` filas en lugar de todas las lecturas. La resolución se elige
+según la ventana pedida y el resultado se devuelve en columnas; las
+agregaciones al vuelo (reconstrucción y reducción de semanas) se hacen con
+NumPy.
+"""
+import logging
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .models import VitalSigns, VitalSignsRollup
+
+logger = logging.getLogger(__name__)
+
+METRICS = VitalSignsRollup.METRICS
+RESOLUTIONS = ('hour', 'day', 'week')
+RESOLUTION_DELTAS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+# Ventanas hasta este tamaño se sirven con las lecturas originales
+RAW_WINDOW = timedelta(days=2)
+# Puntos máximos por serie; con más semanas se agrupan al vuelo
+MAX_POINTS = 400
+
+# Campos de la lectura en el orden de METRICS, con la altura en lugar del IMC
+READING_FIELDS = (
+    'recorded_at', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'heart_rate',
+    'respiratory_rate', 'temperature', 'oxygen_saturation', 'weight', 'height',
+)
+ROLLUP_FIELDS = ['count'] + [f'{metric}_{stat}' for metric in METRICS for stat in ('min', 'max', 'sum')]
+
+
+def bucket_start(moment, resolution):
+    """Inicio del periodo que contiene ``moment``, en la zona horaria local"""
+    local = timezone.localtime(moment)
+    if resolution == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+    start = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'week':
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def _matrix(rows):
+    """Filas ``READING_FIELDS`` como matriz lecturas × METRICS, con el IMC calculado"""
+    data = np.array([row[1:] for row in rows], dtype=float).reshape(len(rows), len(READING_FIELDS) - 1)
+    height_m = data[:, -1] / 100
+    data[:, -1] = data[:, -2] / (height_m ** 2)
+    return data
+
+
+def _reduce(starts, counts, mins, maxs, sums):
+    """Combinar los grupos de filas consecutivas que empiezan en ``starts``"""
+    return (
+        np.add.reduceat(counts, starts),
+        np.minimum.reduceat(mins, starts),
+        np.maximum.reduceat(maxs, starts),
+        np.add.reduceat(sums, starts),
+    )
+
+
+def _aggregate(rows, resolution):
+    """Agregados por periodo de lecturas ordenadas por fecha: ``(inicios, counts, mins, maxs, sums)``"""
+    keys = np.array([bucket_start(row[0], resolution).timestamp() for row in rows], dtype=np.int64)
+    values = _matrix(rows)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return (keys[starts],) + _reduce(starts, np.ones(len(rows), dtype=np.int64), values, values, values)
+
+
+def _rollups(patient_id, resolution, aggregated):
+    keys, counts, mins, maxs, sums = aggregated
+    rollups = []
+    for index, key in enumerate(keys):
+        fields = {'count': int(counts[index])}
+        for column, metric in enumerate(METRICS):
+            fields[f'{metric}_min'] = float(mins[index, column])
+            fields[f'{metric}_max'] = float(maxs[index, column])
+            fields[f'{metric}_sum'] = float(sums[index, column])
+        rollups.append(VitalSignsRollup(
+            patient_id=patient_id,
+            resolution=resolution,
+            bucket_start=datetime.fromtimestamp(int(key), tz=dt_timezone.utc),
+            **fields
+        ))
+    return rollups
+
+
+def _write(rollups):
+    VitalSignsRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=['patient', 'resolution', 'bucket_start'],
+        update_fields=ROLLUP_FIELDS
+    )
+
+
+def record_reading(reading):
+    """Sumar una lectura nueva a sus agregados por hora, día y semana"""
+    values = dict(zip(METRICS, _matrix([tuple(getattr(reading, name) for name in READING_FIELDS)])[0]))
+    initial = {'count': 1}
+    increment = {'count': F('count') + 1}
+    for metric, value in values.items():
+        value = float(value)
+        initial.update({f'{metric}_min': value, f'{metric}_max': value, f'{metric}_sum': value})
+        increment.update({
+            f'{metric}_min': Least(f'{metric}_min', Value(value)),
+            f'{metric}_max': Greatest(f'{metric}_max', Value(value)),
+            f'{metric}_sum': F(f'{metric}_sum') + value,
+        })
+
+    with transaction.atomic():
+        for resolution in RESOLUTIONS:
+            rollup, created = VitalSignsRollup.objects.get_or_create(
+                patient_id=reading.patient_id,
+                resolution=resolution,
+                bucket_start=bucket_start(reading.recorded_at, resolution),
+                defaults=initial
+            )
+            if not created:
+                VitalSignsRollup.objects.filter(pk=rollup.pk).update(**increment)
+
+
+def refresh_buckets(patient_id, moment):
+    """
+    Recalcular desde las lecturas los agregados que contienen ``moment``.
+
+    Se usa al editar o borrar una lectura, donde no basta con sumar.
+    """
+    with transaction.atomic():
+        for resolution in RESOLUTIONS:
+            start = bucket_start(moment, resolution)
+            rows = list(VitalSigns.objects.filter(
+                patient_id=patient_id,
+                recorded_at__gte=start,
+                recorded_at__lt=start + RESOLUTION_DELTAS[resolution]
+            ).order_by('recorded_at', 'id').values_list(*READING_FIELDS))
+            if rows:
+                _write(_rollups(patient_id, resolution, _aggregate(rows, resolution)))
+            else:
+                VitalSignsRollup.objects.filter(
+                    patient_id=patient_id,
+                    resolution=resolution,
+                    bucket_start=start
+                ).delete()
+
+
+def rebuild_patient_rollups(patient_id):
+    """Reconstruir todos los agregados de un paciente"""
+    rows = list(
+        VitalSigns.objects.filter(patient_id=patient_id).order_by('recorded_at', 'id').values_list(*READING_FIELDS)
+    )
+    with transaction.atomic():
+        VitalSignsRollup.objects.filter(patient_id=patient_id).delete()
+        if rows:
+            VitalSignsRollup.objects.bulk_create(
+                [
+                    rollup
+                    for resolution in RESOLUTIONS
+                    for rollup in _rollups(patient_id, resolution, _aggregate(rows, resolution))
+                ],
+                batch_size=1000
+            )
+
+
+def rebuild_vital_signs_rollups():
+    """Reconstruir los agregados de todos los pacientes; devuelve cuántos"""
+    VitalSignsRollup.objects.exclude(patient_id__in=VitalSigns.objects.values('patient_id')).delete()
+    patient_ids = sorted(set(VitalSigns.objects.values_list('patient_id', flat=True).distinct()))
+    for patient_id in patient_ids:
+        rebuild_patient_rollups(patient_id)
+    logger.info(f"Rebuilt vital signs rollups for {len(patient_ids)} patients")
+    return len(patient_ids)
+
+
+def choose_resolution(start, end):
+    """Resolución más fina que cubre la ventana con como mucho ``MAX_POINTS`` puntos"""
+    span = end - start
+    if span <= RAW_WINDOW:
+        return 'raw'
+    for resolution in RESOLUTIONS:
+        if span / RESOLUTION_DELTAS[resolution] <= MAX_POINTS:
+            return resolution
+    return 'week'
+
+
+def _raw_series(patient_id, start, end):
+    rows = list(VitalSigns.objects.filter(
+        patient_id=patient_id,
+        recorded_at__gte=start,
+        recorded_at__lt=end
+    ).order_by('recorded_at', 'id').values_list(*READING_FIELDS))
+    values = _matrix(rows)
+    return [row[0] for row in rows], np.ones(len(rows), dtype=np.int64), values, values, values
+
+
+def _rollup_series(patient_id, resolution, start, end):
+    rows = list(VitalSignsRollup.objects.filter(
+        patient_id=patient_id,
+        resolution=resolution,
+        bucket_start__gte=bucket_start(start, resolution),
+        bucket_start__lt=end
+    ).order_by('bucket_start').values_list('bucket_start', *ROLLUP_FIELDS))
+    data = np.array([row[1:] for row in rows], dtype=float).reshape(len(rows), len(ROLLUP_FIELDS))
+    counts = data[:, 0].astype(np.int64)
+    metrics = data[:, 1:].reshape(len(rows), len(METRICS), 3)
+    timestamps = [row[0] for row in rows]
+    mins, maxs, sums = metrics[:, :, 0], metrics[:, :, 1], metrics[:, :, 2]
+
+    if len(rows) > MAX_POINTS:
+        # Ventanas muy largas: agrupar periodos consecutivos
+        starts = np.arange(0, len(rows), math.ceil(len(rows) / MAX_POINTS))
+        timestamps = [timestamps[index] for index in starts]
+        counts, mins, maxs, sums = _reduce(starts, counts, mins, maxs, sums)
+    return timestamps, counts, mins, maxs, sums
+
+
+def vital_signs_trend(patient_id, start, end, metrics=METRICS):
+    """
+    Tendencia de signos vitales entre ``start`` y ``end`` en columnas.
+
+    Devuelve ``{'resolution', 'timestamps', 'count', 'metrics'}``, donde
+    ``metrics`` tiene por métrica las listas ``min``, ``max`` y ``avg``
+    alineadas con ``timestamps``.
+    """
+    resolution = choose_resolution(start, end)
+    if resolution == 'raw':
+        timestamps, counts, mins, maxs, sums = _raw_series(patient_id, start, end)
+    else:
+        timestamps, counts, mins, maxs, sums = _rollup_series(patient_id, resolution, start, end)
+
+    averages = sums / np.maximum(counts, 1)[:, np.newaxis]
+    series = {}
+    for metric in metrics:
+        column = METRICS.index(metric)
+        series[metric] = {
+            'min': np.round(mins[:, column], 2).tolist(),
+            'max': np.round(maxs[:, column], 2).tolist(),
+            'avg': np.round(averages[:, column], 2).tolist(),
+        }
+    return {
+        'resolution': resolution,
+        'timestamps': [timezone.localtime(moment).isoformat() for moment in timestamps],
+        'count': counts.tolist(),
+        'metrics': series,
+    }
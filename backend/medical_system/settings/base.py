@@ -140,7 +140,7 @@ SESSION_SAVE_EVERY_REQUEST = True
 # REST Framework configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -224,6 +224,21 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'notifications.tasks.retry_failed_notifications',
         'schedule': 600.0,  # Cada 10 minutos (600 segundos)
     },
+    # Liberar reservas temporales vencidas cada minuto
+    'release-expired-reservations': {
+        'task': 'appointments.tasks.release_expired_reservations',
+        'schedule': 60.0,  # Cada minuto (60 segundos)
+    },
+    # Materializar las citas de series recurrentes diariamente
+    'materialize-appointment-series': {
+        'task': 'appointments.tasks.materialize_appointment_series',
+        'schedule': 86400.0,  # Una vez al día (86400 segundos)
+    },
+    # Borrar subidas por partes abandonadas cada hora
+    'cleanup-expired-uploads': {
+        'task': 'medical_records.tasks.cleanup_expired_uploads',
+        'schedule': 3600.0,  # Cada hora (3600 segundos)
+    },
 }
 
 # DRF Spectacular settings para documentación API
@@ -304,6 +319,28 @@ TWO_FACTOR_BACKUP_TOKEN_COUNT = config('TWO_FACTOR_BACKUP_TOKEN_COUNT', default=
 # Configuración de encriptación de datos sensibles
 PGCRYPTO_KEY = config('PGCRYPTO_KEY', default='medical-system-default-key-change-in-production')
 ENCRYPTION_ENABLED = config('ENCRYPTION_ENABLED', default=True, cast=bool)
+# Backend de los campos encriptados: 'pgcrypto' o 'envelope' (cifrado en aplicación)
+ENCRYPTION_BACKEND = config('ENCRYPTION_BACKEND', default='pgcrypto')
+# Segundos que cada proceso recuerda la clave de datos principal
+ENVELOPE_PRIMARY_KEY_TTL = config('ENVELOPE_PRIMARY_KEY_TTL', default=300, cast=int)
+# Pool de procesos para el hash de contraseñas (0 = en el hilo de la petición)
+PASSWORD_HASHING_WORKERS = config('PASSWORD_HASHING_WORKERS', default=0, cast=int)
+# Hashes en curso como máximo; el resto espera sin consumir CPU
+PASSWORD_HASHING_MAX_PENDING = config('PASSWORD_HASHING_MAX_PENDING', default=PASSWORD_HASHING_WORKERS * 4, cast=int)
+
+# Bloqueo de login: fallos permitidos por email e IP en una ventana deslizante (segundos)
+LOGIN_THROTTLE_LIMITS = {
+    'email': {'limit': config('LOGIN_MAX_FAILURES_PER_EMAIL', default=5, cast=int), 'window': 900},
+    'ip': {'limit': config('LOGIN_MAX_FAILURES_PER_IP', default=20, cast=int), 'window': 900},
+}
+# Proxies de confianza delante de la aplicación (0 = usar REMOTE_ADDR)
+LOGIN_TRUSTED_PROXY_HOPS = config('LOGIN_TRUSTED_PROXY_HOPS', default=0, cast=int)
+# Escritura en bloque de LoginAttempt
+LOGIN_ATTEMPT_BATCH_SIZE = 50
+LOGIN_ATTEMPT_FLUSH_INTERVAL = 5  # segundos
+
+# Clave HMAC de los índices ciegos (vacía: se deriva de PGCRYPTO_KEY)
+BLIND_INDEX_KEY = config('BLIND_INDEX_KEY', default='')
 
 # Configuración HTTPS
 SECURE_SSL_REDIRECT = config('SECURE_SSL_REDIRECT', default=False, cast=bool)
@@ -47,6 +47,9 @@ EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# Intentos de login escritos al momento: sin temporizadores en segundo plano
+LOGIN_ATTEMPT_BATCH_SIZE = 1
+
 # Media files for testing
 MEDIA_ROOT = BASE_DIR / 'test_media'
 
@@ -5,6 +5,7 @@ import time
 import random
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from unittest import skipUnless
 from datetime import datetime, timedelta
 from decimal import Decimal
 from django.test import override_settings
@@ -629,6 +630,94 @@ class LoadTests(IntegrationTestCase):
         self.assertLess(elapsed, 5.0)
 
 
+@skipUnless(connection.vendor == 'postgresql',
+            'select_for_update y la escritura concurrente requieren PostgreSQL')
+class SlotBookingConcurrencyTests(IntegrationTestCase):
+    """Benchmark de reservas concurrentes sobre los mismos horarios"""
+    
+    CLIENTS = 200
+    SLOTS = 20
+    SLOT_MINUTES = 15
+    # Hilos (y conexiones) simultáneos; por debajo de max_connections=100
+    WORKERS = 30
+    
+    def setUp(self):
+        super().setUp()
+        self.specialty = Specialty.objects.create(name='Medicina General')
+        today = timezone.localdate()
+        self.booking_date = today + timedelta(days=14 - today.weekday())
+        self.slot_times = [
+            (datetime.combine(self.booking_date, datetime.min.time())
+             + timedelta(hours=8, minutes=self.SLOT_MINUTES * i)).time()
+            for i in range(self.SLOTS)
+        ]
+        # Sin horario las reservas duran DEFAULT_SLOT_MINUTES y se solaparían
+        MedicalSchedule.objects.create(
+            doctor=self.doctor,
+            specialty=self.specialty,
+            weekday=self.booking_date.weekday(),
+            start_time=self.slot_times[0],
+            end_time=(datetime.combine(self.booking_date, self.slot_times[-1])
+                      + timedelta(minutes=self.SLOT_MINUTES)).time(),
+            slot_duration=self.SLOT_MINUTES,
+            is_active=True
+        )
+        User.objects.bulk_create([
+            User(
+                username=f'booking_patient_{i}',
+                email=f'booking{i}@test.com',
+                first_name='Booking',
+                last_name=f'Patient{i}',
+                role='patient'
+            )
+            for i in range(self.CLIENTS)
+        ])
+        self.patients = list(User.objects.filter(username__startswith='booking_patient_'))
+    
+    def test_concurrent_slot_booking_throughput(self):
+        """200 clientes compitiendo por 20 horarios: una reserva por horario, sin errores"""
+        from appointments.booking import SlotTakenError, reserve_slot
+        from appointments.models import TemporaryReservation
+        
+        def book(index):
+            patient = self.patients[index]
+            slot_time = self.slot_times[index % self.SLOTS]
+            try:
+                reserve_slot(patient, self.doctor, self.specialty, self.booking_date, slot_time)
+                return 'booked'
+            except SlotTakenError:
+                return 'taken'
+            except Exception as e:
+                return f'error: {e}'
+            finally:
+                connection.close()
+        
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            results = list(executor.map(book, range(self.CLIENTS)))
+        elapsed = time.time() - start_time
+        
+        booked = results.count('booked')
+        taken = results.count('taken')
+        errors = [r for r in results if r.startswith('error')]
+        print(
+            f"\nReservas concurrentes: {booked} exitosas, {taken} rechazadas, "
+            f"{len(errors)} errores en {elapsed:.2f}s "
+            f"({booked / elapsed:.1f} reservas/s, {self.CLIENTS / elapsed:.1f} solicitudes/s)"
+        )
+        
+        # Ningún horario se reserva dos veces y nadie recibe un error inesperado
+        self.assertEqual(errors, [])
+        self.assertEqual(booked, self.SLOTS)
+        self.assertEqual(taken, self.CLIENTS - self.SLOTS)
+        self.assertEqual(
+            TemporaryReservation.objects.filter(
+                doctor=self.doctor, appointment_date=self.booking_date, is_active=True
+            ).count(),
+            self.SLOTS
+        )
+
+
 class MemoryPerformanceTests(IntegrationTestCase):
     """Tests de uso de memoria"""
     